@@ -0,0 +1,234 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `lifecycle_benchmark.py` measures the latency of starting and shutting down sessions with `chroot.chroot` and `chroot.chroot_shutdown` and the throughput of the session registry for different numbers of registered sessions as well as the latency of concurrent starts from multiple processes. The `mount`, `umount`, `kldload` and `chroot` binaries are replaced with executables which do nothing, so that the benchmark runs without root on any system and measures the overhead of the scripts themselves (registry, mount table checks, forks of the binaries, copying of `resolv.conf`). Since the stand-in mounts never show up in the mount table every start runs through the whole mount path.
+
+import plac
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import logging
+import multiprocessing
+import subprocess as sp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "chroot"))
+import chroot
+import chroot_registry
+import chroot_process
+
+session_counts_default = "1,100,10000"
+iterations_default = 50
+live_sessions_default = 10
+processes_default = 8
+launches_default = 20
+registry_operations_default = 1000
+host_type = chroot.HOST_TYPE_DEBIAN
+stale_base_dir_count = 100 # number of base directories the registered sessions are distributed over
+
+def create_fake_binaries(bin_dir):
+    """Creates executables which accept any arguments and do nothing in `bin_dir` and returns a dict mapping the names of the binaries to their paths."""
+    os.makedirs(bin_dir)
+    fake_binaries = dict()
+    for name in ["mount", "umount", "kldload", "chroot"]:
+        fake_binary = os.path.join(bin_dir, name)
+        with open(fake_binary, "w") as fake_binary_file:
+            fake_binary_file.write("#!/bin/sh\nexit 0\n")
+        os.chmod(fake_binary, 0o755)
+        fake_binaries[name] = fake_binary
+    return fake_binaries
+
+def create_base_dir(base_dir):
+    """Creates a minimal base directory in which `chroot.chroot_start` can replace `/etc/resolv.conf`."""
+    os.makedirs(os.path.join(base_dir, "etc"))
+    open(os.path.join(base_dir, "etc", "resolv.conf"), "w").close()
+
+def populate_registry(config_dir_path, session_count):
+    """Registers `session_count` sessions which are no longer running (start time `0` doesn't match any process) for other base directories than the one of the benchmark, i.e. entries which every registry query has to cope with, but which aren't touched by the start and scoped shutdown of the benchmark's base directory."""
+    registry = chroot_registry.open_registry(config_dir_path)
+    try:
+        with registry.locked():
+            for i in range(session_count):
+                registry.register("/nonexistent/base%d" % (i % stale_base_dir_count, ), host_type, i+1, start_time=0)
+    finally:
+        registry.close()
+
+def start_session(base_dir, config_dir_path, fake_binaries, metrics_file=None):
+    """Runs one session of `base_dir` with `chroot.chroot` and the stand-in binaries and returns its duration."""
+    start = time.time()
+    chroot.chroot(base_dir, shell="/bin/sh", config_dir_path=config_dir_path, host_type=host_type, mount=fake_binaries["mount"], kldload=fake_binaries["kldload"], chroot=fake_binaries["chroot"], mount_backend=chroot.MOUNT_BACKEND_BINARY, umount=fake_binaries["umount"], metrics_file=metrics_file)
+    return time.time()-start
+
+def benchmark_start(base_dir, config_dir_path, fake_binaries, iterations, metrics_file):
+    """Returns a list of the durations of `iterations` sessions (start and end) started one after another. The duration and outcome of the phases are appended to `metrics_file`."""
+    return [start_session(base_dir, config_dir_path, fake_binaries, metrics_file=metrics_file) for _ in range(iterations)]
+
+def benchmark_shutdown(base_dir, config_dir_path, fake_binaries, iterations, live_sessions):
+    """Returns a list of the durations of `iterations` shutdowns of `base_dir` with `live_sessions` running sessions each and a list of the durations of shutdowns of all registered sessions (which removes them from the registry, so it's measured once)."""
+    durations = []
+    for _ in range(iterations):
+        session_processes = [sp.Popen(["sleep", "600"]) for _ in range(live_sessions)]
+        registry = chroot_registry.open_registry(config_dir_path)
+        try:
+            with registry.locked():
+                for session_process in session_processes:
+                    registry.register(base_dir, host_type, session_process.pid, start_time=chroot_process.process_start_time(session_process.pid))
+                registry.register_mounts(base_dir, host_type)
+        finally:
+            registry.close()
+        start = time.time()
+        ret_value = chroot.chroot_shutdown(base_dir=base_dir, host_type=host_type, config_dir_path=config_dir_path, umount=fake_binaries["umount"], umount_backend=chroot.MOUNT_BACKEND_BINARY)
+        durations.append(time.time()-start)
+        for session_process in session_processes:
+            session_process.wait() # reap the zombies
+        if ret_value != 0:
+            raise RuntimeError("shutdown of base directory '%s' failed" % (base_dir, ))
+    start = time.time()
+    chroot.chroot_shutdown(config_dir_path=config_dir_path, umount=fake_binaries["umount"], umount_backend=chroot.MOUNT_BACKEND_BINARY)
+    return durations, [time.time()-start]
+
+def benchmark_registry(config_dir_path, operations):
+    """Returns a dict with the number of registrations, lookups and unregistrations per second and the duration of listing all sessions in the registry in `config_dir_path`."""
+    registry = chroot_registry.open_registry(config_dir_path)
+    try:
+        base_dir = "/nonexistent/registry_benchmark"
+        start = time.time()
+        for pid in range(1, operations+1):
+            registry.register(base_dir, host_type, pid, start_time=0)
+        register_duration = time.time()-start
+        start = time.time()
+        for _ in range(operations):
+            registry.lookup(base_dir, host_type)
+        lookup_duration = time.time()-start
+        start = time.time()
+        for pid in range(1, operations+1):
+            registry.unregister(base_dir, host_type, pid)
+        unregister_duration = time.time()-start
+        start = time.time()
+        registry.list_sessions()
+        list_duration = time.time()-start
+    finally:
+        registry.close()
+    return {
+        "register_per_s": operations/register_duration,
+        "lookup_per_s": operations/lookup_duration,
+        "unregister_per_s": operations/unregister_duration,
+        "list_sessions_ms": 1000.0*list_duration,
+    }
+
+def _launch_sessions(args):
+    """Starts `launches` sessions one after another in a worker process of `benchmark_concurrent` and returns their durations."""
+    base_dir, config_dir_path, fake_binaries, launches = args
+    return [start_session(base_dir, config_dir_path, fake_binaries) for _ in range(launches)]
+
+def benchmark_concurrent(pool, base_dir, config_dir_path, fake_binaries, processes, launches):
+    """Returns the list of durations of the sessions of `base_dir` started `launches` times by every one of `processes` concurrent processes of `pool` and the total duration."""
+    start = time.time()
+    durations_lists = pool.map(_launch_sessions, [(base_dir, config_dir_path, fake_binaries, launches)]*processes)
+    total_duration = time.time()-start
+    return [duration for durations in durations_lists for duration in durations], total_duration
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        "iterations": len(durations),
+        "mean_ms": 1000.0*sum(durations)/len(durations),
+        "median_ms": 1000.0*durations[len(durations)/2],
+        "p95_ms": 1000.0*durations[min(int(len(durations)*0.95), len(durations)-1)],
+    }
+
+def summarize_phases(metrics_file):
+    """Returns a dict mapping the phases recorded in the JSON lines `metrics_file` (see `chroot_metrics.py`) to the summary of their durations (all mounts are summarized as one phase)."""
+    phase_durations = dict()
+    with open(metrics_file, "r") as metrics_file_obj:
+        for line in metrics_file_obj:
+            timing = json.loads(line)
+            phase_durations.setdefault(timing["phase"], []).append(timing["duration"])
+    return dict([(phase, summarize(durations)) for phase, durations in phase_durations.items()])
+
+@plac.annotations(
+    session_counts=("A comma-separated list of numbers of registered sessions to run the benchmarks with", "option"),
+    iterations=("The number of sessions started and shutdowns performed per number of registered sessions", "option", None, int),
+    live_sessions=("The number of running sessions terminated by every shutdown", "option", None, int),
+    registry_operations=("The number of registrations, lookups and unregistrations performed per number of registered sessions", "option", None, int),
+    processes=("The number of processes starting sessions concurrently", "option", None, int),
+    launches=("The number of sessions started by every concurrent process", "option", None, int),
+    output=("The file to write the JSON report to, `-` means stdout", "option"),
+)
+def lifecycle_benchmark(session_counts=session_counts_default, iterations=iterations_default, live_sessions=live_sessions_default, registry_operations=registry_operations_default, processes=processes_default, launches=launches_default, output="-"):
+    # the log messages of every session would dominate the measurements
+    chroot.logger.setLevel(logging.WARNING)
+    chroot.ch.setLevel(logging.WARNING)
+    # forked before the mount table index is opened because its file offset would be shared with the workers
+    pool = multiprocessing.Pool(processes)
+    tmp_dir = tempfile.mkdtemp(prefix="lifecycle_benchmark")
+    try:
+        fake_binaries = create_fake_binaries(os.path.join(tmp_dir, "bin"))
+        report = {"parameters": {"iterations": iterations, "live_sessions": live_sessions, "registry_operations": registry_operations, "processes": processes, "launches": launches}, "sessions": dict()}
+        for session_count in [int(session_count) for session_count in session_counts.split(",")]:
+            run_dir = os.path.join(tmp_dir, "sessions%d" % (session_count, ))
+            base_dir = os.path.join(run_dir, "base")
+            config_dir_path = os.path.join(run_dir, "config")
+            metrics_file = os.path.join(run_dir, "metrics.jsonl")
+            create_base_dir(base_dir)
+            os.makedirs(config_dir_path)
+            populate_registry(config_dir_path, session_count)
+            start_durations = benchmark_start(base_dir, config_dir_path, fake_binaries, iterations, metrics_file)
+            registry = benchmark_registry(config_dir_path, registry_operations)
+            shutdown_durations, shutdown_all_durations = benchmark_shutdown(base_dir, config_dir_path, fake_binaries, iterations, live_sessions)
+            report["sessions"][str(session_count)] = {
+                "start": summarize(start_durations),
+                "start_phases": summarize_phases(metrics_file),
+                "registry": registry,
+                "shutdown": summarize(shutdown_durations),
+                "shutdown_all": summarize(shutdown_all_durations),
+            }
+        run_dir = os.path.join(tmp_dir, "concurrent")
+        base_dir = os.path.join(run_dir, "base")
+        config_dir_path = os.path.join(run_dir, "config")
+        create_base_dir(base_dir)
+        os.makedirs(config_dir_path)
+        concurrent_durations, concurrent_total_duration = benchmark_concurrent(pool, base_dir, config_dir_path, fake_binaries, processes, launches)
+        report["concurrent"] = summarize(concurrent_durations)
+        report["concurrent"]["sessions_per_s"] = len(concurrent_durations)/concurrent_total_duration
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(tmp_dir)
+    report_str = json.dumps(report, indent=2, sort_keys=True)
+    if output == "-":
+        print(report_str)
+    else:
+        with open(output, "w") as output_file:
+            output_file.write(report_str)
+
+if __name__ == "__main__":
+    plac.call(lifecycle_benchmark)
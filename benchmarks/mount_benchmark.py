@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `mount_benchmark.py` compares the latency of mounting and unmounting with the `mount(2)`/`umount2(2)` system calls (`chroot_mount.py`) with the latency of invoking the `mount`/`umount` binaries. Needs to be run as root on Linux. Mounts are performed on temporary directories only.
+
+import plac
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import subprocess as sp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "chroot"))
+import chroot_mount
+
+iterations_default = 200
+
+def benchmark_syscall(source, target, fs_type, options_str, iterations):
+    """Returns a list of the durations of `iterations` mount and unmount cycles with the system calls."""
+    durations = []
+    for _ in range(iterations):
+        start = time.time()
+        chroot_mount.syscall_mount(source, target, fs_type=fs_type, options_str=options_str)
+        chroot_mount.syscall_umount(target)
+        durations.append(time.time()-start)
+    return durations
+
+def benchmark_binary(source, target, fs_type, options_str, iterations, mount, umount):
+    """Returns a list of the durations of `iterations` mount and unmount cycles with the binaries."""
+    mount_cmds = [mount]
+    if fs_type is not None:
+        mount_cmds += ["-t", fs_type]
+    if options_str is not None:
+        mount_cmds += ["-o", options_str]
+    mount_cmds += [source, target]
+    durations = []
+    for _ in range(iterations):
+        start = time.time()
+        sp.check_call(mount_cmds)
+        sp.check_call([umount, target])
+        durations.append(time.time()-start)
+    return durations
+
+def detach(target):
+    """Lazily unmounts all filesystems mounted on `target` (e.g. left behind by a failed iteration)."""
+    while True:
+        try:
+            chroot_mount.syscall_umount(target, chroot_mount.MNT_DETACH)
+        except OSError:
+            # `EINVAL` if nothing's mounted anymore
+            return
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        "iterations": len(durations),
+        "mean_ms": 1000.0*sum(durations)/len(durations),
+        "median_ms": 1000.0*durations[len(durations)/2],
+        "p95_ms": 1000.0*durations[min(int(len(durations)*0.95), len(durations)-1)],
+    }
+
+@plac.annotations(
+    iterations=("The number of mount and unmount cycles per filesystem and backend", "option", None, int),
+    mount=("The mount binary to use", "option"),
+    umount=("The umount binary to use", "option"),
+    output=("The file to write the JSON report to, `-` means stdout", "option"),
+)
+def mount_benchmark(iterations=iterations_default, mount="mount", umount="umount", output="-"):
+    if not chroot_mount.syscall_available():
+        raise RuntimeError("mount(2) and umount2(2) aren't available on this system")
+    tmp_dir = tempfile.mkdtemp(prefix="mount_benchmark")
+    bind_source = os.path.join(tmp_dir, "source")
+    target = os.path.join(tmp_dir, "target")
+    try:
+        os.makedirs(bind_source)
+        os.makedirs(target)
+        report = dict()
+        for name, source, fs_type, options_str in [("bind", bind_source, None, "bind"), ("proc", "proc", "proc", None), ("sysfs", "sysfs", "sysfs", None), ("tmpfs", "none", "tmpfs", None)]:
+            syscall = summarize(benchmark_syscall(source, target, fs_type, options_str, iterations))
+            binary = summarize(benchmark_binary(source, target, fs_type, options_str, iterations, mount, umount))
+            report[name] = {"syscall": syscall, "binary": binary, "speedup": binary["mean_ms"]/syscall["mean_ms"]}
+    finally:
+        # `rmtree` would descend into a filesystem which is still mounted (e.g. `/proc`)
+        detach(target)
+        shutil.rmtree(tmp_dir)
+    report_str = json.dumps(report, indent=2, sort_keys=True)
+    if output == "-":
+        print(report_str)
+    else:
+        with open(output, "w") as output_file:
+            output_file.write(report_str)
+
+if __name__ == "__main__":
+    plac.call(mount_benchmark)
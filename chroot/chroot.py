@@ -27,22 +27,26 @@
 #    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
 #    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
 
-# `chroot.py` is used to save references to started chroots of a certain directory (in form of the PID in a data file) so that the necessary mounts (of `/proc`, `/sys`, etc.) can be performed before the first start and the cleanup of these mounts after the last end of the managed chroots. The cleanup can be added as a system service by wrapping the `chroot_shutdown` function in python script which is invoked by `initd` or `upstart` (or something similar).
+# `chroot.py` is used to save references to started chroots of a certain directory (in form of the PID in a registry, see `chroot_registry.py`) so that the necessary mounts (of `/proc`, `/sys`, etc.) can be performed before the first start and the cleanup of these mounts after the last end of the managed chroots. The cleanup can be added as a system service by wrapping the `chroot_shutdown` function in python script which is invoked by `initd` or `upstart` (or something similar).
 
 import plac
-import tempfile
 import chroot_globals
+import chroot_registry
+import chroot_mount
+import chroot_process
+import chroot_mountinfo
+import chroot_overlay
+import chroot_mount_plan
+import chroot_metrics
+import chroot_hostfiles
+import chroot_namespace
+import chroot_libc
 import logging
 import os
-import signal
-import python_essentials
-import python_essentials.lib
-import python_essentials.lib.mount_utils as mount_utils
+import errno
+import time
 import subprocess as sp
 import sys
-import shutil
-import shelve
-import dumbdbm
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -50,184 +54,537 @@ ch = logging.StreamHandler()
 ch.setLevel(logging.INFO)
 logger.addHandler(ch)
 
-HOST_TYPE_DEBIAN="debian"
-HOST_TYPE_FREEBSD = "freebsd"
+HOST_TYPE_DEBIAN = chroot_mount_plan.HOST_TYPE_DEBIAN
+HOST_TYPE_FREEBSD = chroot_mount_plan.HOST_TYPE_FREEBSD
 host_type_default = HOST_TYPE_DEBIAN
 shell_default = "/bin/bash"
 config_dir_path_default=os.path.join(os.getenv("HOME"), ".%s" % (chroot_globals.app_name, ))
-count_file_name = "chroot_count.dta"
 mount_default = "mount"
 mount_nullfs_default="mount_nullfs"
 kldload_default = "kldload"
 chroot_default = "chroot"
-count_file_separator = ";"
 umount_default = "umount"
+MOUNT_BACKEND_SYSCALL = "syscall"
+MOUNT_BACKEND_BINARY = "binary"
+mount_backends = [MOUNT_BACKEND_SYSCALL, MOUNT_BACKEND_BINARY]
+mount_backend_default = MOUNT_BACKEND_SYSCALL if chroot_mount.syscall_available() else MOUNT_BACKEND_BINARY
+shutdown_timeout_default = 30.0
+shutdown_workers_default = 8
+host_profiles_dir_name = "host_profiles" # directory in the config directory containing the descriptions of additional host profiles (see `chroot_mount_plan.load_host_profiles`)
 
 __docstring_config_dir_path__ = "The path where to store the references to started sessions and other configuration files"
 __docstring_debug__ = "Turn of debugging messages printed to stdout"
+__docstring_host_type__ = "An identifier for the different types of host which can be managed, i.e. the name of a host profile which is either built in (`%s` or `%s`) or described in a JSON file in the `%s` directory of the config directory" % (HOST_TYPE_DEBIAN, HOST_TYPE_FREEBSD, host_profiles_dir_name, )
+__docstring_shutdown_timeout__ = "The number of seconds the shutdown waits for sessions to exit in total, busy mounts are detached lazily afterwards"
+__docstring_term_timeout__ = "The number of seconds to wait for a session to exit after SIGTERM before it's killed with SIGKILL"
+__docstring_shutdown_workers__ = "The number of base directories to shut down concurrently"
+__docstring_metrics_file__ = "Append the duration and outcome of every phase (e.g. of each mount) as JSON lines to this file"
+__docstring_metrics_textfile__ = "Write the durations of the phases and the number of running sessions per base directory into this file in the format of the Prometheus textfile collector"
+__docstring_mount_backend__ = "How to perform mounts and unmounts, either with the mount(2)/umount2(2) system calls (`%s`, Linux only) or by invoking the mount/umount binary (`%s`)" % (MOUNT_BACKEND_SYSCALL, MOUNT_BACKEND_BINARY, )
 
 @plac.annotations(base_dir="The base directory of the chroot", 
     shell=("The shell to use for the chroot", "option"), 
     config_dir_path=(__docstring_config_dir_path__, "option"), 
-    host_type=("An identifier for the different types of host which can be managed", "option"), 
+    host_type=(__docstring_host_type__, "option"), 
     mount=("The mount binary to use", "option"), 
     mount_nullfs=("The mount_nullfs binary to use", "option"), 
     kldload=("The kldload binary to use", "option"), 
     chroot=("The chroot binary to use", "option"), 
+    mount_backend=(__docstring_mount_backend__, "option", None, str, mount_backends), 
+    umount=("The umount binary to use", "option"), 
+    auto_umount=("Unmount the mounts of `base_dir` and `host_type` as soon as the last running session of them exits", "flag"), 
+    overlay=("Run the session in a copy-on-write overlay of `base_dir` which is discarded when the session exits (Linux only)", "flag"), 
+    overlay_dir=("The directory in which overlay session roots are created", "option"), 
+    overlay_tmpfs_options=("The mount options of the tmpfs storing the changes of an overlay session, e.g. `size=1g`", "option"), 
+    snapshot_dir=("Keep the changes of an overlay session in a new directory in this directory", "option"), 
+    pooled=("Run the session in an overlay root prepared by the pool of `chroot_pool.py` if one is available, otherwise create one like `overlay` (implies `overlay`)", "flag"), 
+    mount_namespace=("Run the session in a private mount namespace in which the mounts are performed and which the kernel frees when the session exits instead of sharing the mounts of `base_dir` with other sessions (Linux only)", "flag"), 
+    pid_namespace=("Run the session in a private PID namespace as well, i.e. all its processes are killed when it exits (requires `mount_namespace`)", "flag"), 
+    metrics_file=(__docstring_metrics_file__, "option"), 
+    metrics_textfile=(__docstring_metrics_textfile__, "option"), 
     debug=(__docstring_debug__, "flag"), 
 )
-def chroot(base_dir, shell=shell_default, config_dir_path=config_dir_path_default, host_type=host_type_default, mount=mount_default, mount_nullfs=mount_nullfs_default, kldload=kldload_default, chroot=chroot_default, debug=False):
-    """Performs the necessary preparations for starting the chroot located in `base_dir` if and only if the script is invoked the first time with the value of `base_dir` and `host_type`, starts the chroot for `base_dir` and stores a reference (in form of `base_dir`, `host_type` and the pid of the chroot shell) in a line in the file denoted by `count_file_path`. Creates the file denoted by `count_file_path` if it doesn't exist. `host_type` allows to leave some fundamental differences between hosts to the script. `base_dir` must not contain %s. It is possible to manage different host types for the same base directory (that might make sense one day or maybe even already). The chroot (shell) runs in foreground and the script can be invoked multiple times.""" % (count_file_separator, )
+def chroot(base_dir, shell=shell_default, config_dir_path=config_dir_path_default, host_type=host_type_default, mount=mount_default, mount_nullfs=mount_nullfs_default, kldload=kldload_default, chroot=chroot_default, mount_backend=mount_backend_default, umount=umount_default, auto_umount=False, overlay=False, overlay_dir=chroot_overlay.overlay_dir_default, overlay_tmpfs_options=None, snapshot_dir=None, pooled=False, mount_namespace=False, pid_namespace=False, metrics_file=None, metrics_textfile=None, debug=False):
+    """Performs the necessary preparations for starting the chroot located in `base_dir` if and only if the script is invoked the first time with the value of `base_dir` and `host_type`, starts the chroot for `base_dir` and stores a reference (in form of `base_dir`, `host_type`, the pid of the chroot shell and its start time) in the session registry in `config_dir_path`. The reference is removed (together with the ones of sessions which are no longer running) when the chroot exits and if `auto_umount` is `True` and no other session of `base_dir` and `host_type` is running the mounts are freed immediately. If `overlay` is `True` the session doesn't write into `base_dir`, but into a copy-on-write root in `overlay_dir` (see `chroot_overlay.py`) which is discarded at its end or kept in `snapshot_dir`; if `pooled` is `True` a root which has been prepared in advance by `chroot_pool.py` is used if available. Creates the registry if it doesn't exist and migrates the count file of older versions into it. `host_type` allows to leave some fundamental differences between hosts to the script. It is possible to manage different host types for the same base directory (that might make sense one day or maybe even already). The chroot (shell) runs in foreground and the script can be invoked multiple times. If `mount_namespace` is `True` the session runs in a private mount namespace (and PID namespace if `pid_namespace` is `True`) with its own mounts which are freed by the kernel when it exits (see `chroot_namespace.py`); it's neither registered nor does it use or affect the mounts of other sessions. If `metrics_file` or `metrics_textfile` is specified the phases of the session's lifecycle are timed (see `chroot_metrics.py`)."""
     # internal implementation notes:
     # - it's more elegant to let the use only determine one of configuration directory and count file and due to the the fact that count file is in configuration directory it is better to let him_her choose the configuration directory. The configuration directory can't be static because that get's us in trouble whit sudo and read-only roots (e.g. in FreeBSD jails).
-    # - entries need to be removable from count file; either the count file is not human readable (in that case shelve can be used which is as easy as it can get) or it is (in that case either writing simple lines with a separator (makes deletions hard/implementation overhead) or using an XML serialization (programming overhead) would be the ways to go) -> use shelve
+    # - entries need to be removable from the registry and the registry needs to be safe for concurrent invocations; shelve (used in earlier versions) provides neither locking nor efficient updates -> use SQLite (see `chroot_registry.py`)
     if debug is True:
         logger.info("turning on debugging messages")
         logger.setLevel(logging.DEBUG)
         ch.setLevel(logging.DEBUG)
-    if count_file_separator in config_dir_path:
-        # `base_dir` might be wrapped in a delimiter character when writting into the count file, but this appears to be overhead in implementation because there're few directories with `;` in it -> if that ever becomes an issue store values in a persistent map with shelve
-        raise ValueError("character %s not allowed in base_dir argument" % (count_file_separator, ))
-    # don't create 
-    if not os.path.exists(config_dir_path):
-        logger.debug("creating config directory '%s'" % (config_dir_path, ))
-        os.makedirs(config_dir_path)
-    elif not os.path.isdir(config_dir_path):
-        raise ValueError("config directory '%s' is not a directory" % (config_dir_path, ))
-    count_file_path=os.path.join(config_dir_path, count_file_name)
-    if not os.path.exists(count_file_path):
-        logger.debug("creating count file '%s'" % (count_file_path, ))
-        os.mknod(count_file_path, 0o0755)
-    if os.path.isdir(count_file_path):
-        # might have been changed externally
-        raise ValueError("count file '%s' is a directory" % (count_file_path, ))
-    base_dir_new = os.path.realpath(base_dir)
-    if base_dir_new != base_dir:
-        logger.debug("using absolute directory '%s' as base directory" % (base_dir_new, ))
-        base_dir = base_dir_new
-    if not os.path.exists(base_dir):
-        raise ValueError("base directory '%s' doesn't exist" % (base_dir, ))
-    if host_type == HOST_TYPE_FREEBSD:
-        sp.call([kldload, "fdescfs", "linprocfs", "linsysfs", "tmpfs"]) # fails if one of the modules is already loaded, loads all necessary modules
-    # check whether eventually mounted outside the script:
-    pids = retrieve_pids(base_dir=base_dir, host_type=host_type, count_file_path=count_file_path)
-    if len(pids) > 0:
+    if pooled is True:
+        overlay = True
+    recorder = None
+    if metrics_file is not None or metrics_textfile is not None:
+        recorder = chroot_metrics.Recorder("chroot", jsonl_file_path=metrics_file, textfile_path=metrics_textfile)
+    with chroot_metrics.phase(recorder, "check_config"):
+        # don't create 
+        if not os.path.exists(config_dir_path):
+            logger.debug("creating config directory '%s'" % (config_dir_path, ))
+            os.makedirs(config_dir_path)
+        elif not os.path.isdir(config_dir_path):
+            raise ValueError("config directory '%s' is not a directory" % (config_dir_path, ))
+        registry_file_path = os.path.join(config_dir_path, chroot_registry.registry_file_name)
+        if os.path.isdir(registry_file_path):
+            # might have been changed externally
+            raise ValueError("registry file '%s' is a directory" % (registry_file_path, ))
+        base_dir_new = os.path.realpath(base_dir)
+        if base_dir_new != base_dir:
+            logger.debug("using absolute directory '%s' as base directory" % (base_dir_new, ))
+            base_dir = base_dir_new
+        if not os.path.exists(base_dir):
+            raise ValueError("base directory '%s' doesn't exist" % (base_dir, ))
+        load_host_profiles(config_dir_path)
+        host_profile = chroot_mount_plan.get_host_profile(host_type)
+        if overlay is True and not host_profile.syscall_supported:
+            raise ValueError("overlay sessions aren't supported for host type '%s'" % (host_type, ))
+        if pid_namespace is True and mount_namespace is False:
+            raise ValueError("a PID namespace requires a mount namespace")
+        if mount_namespace is True:
+            if not host_profile.syscall_supported or not chroot_namespace.namespace_available():
+                raise ValueError("mount namespaces aren't supported for host type '%s' on this system" % (host_type, ))
+            if overlay is True:
+                raise ValueError("overlay sessions can't be run in a mount namespace")
+    if mount_namespace is True:
+        _chroot_namespace(base_dir, host_type, shell=shell, mount=mount, chroot=chroot, mount_backend=mount_backend, pid_namespace=pid_namespace, recorder=recorder)
+        return
+    with chroot_metrics.phase(recorder, "kldload"):
+        load_kernel_modules(host_profile, kldload=kldload)
+    with chroot_metrics.phase(recorder, "registry_open"):
+        registry = chroot_registry.open_registry(config_dir_path)
+    try:
+        # the lock prevents concurrent invocations for the same base directory from setting up the same mounts or unmounting them after the check without delaying sessions of other base directories
+        with chroot_registry.base_dir_lock(config_dir_path, base_dir, host_type):
+            ensure_mounts(registry, base_dir, host_type, mount=mount, mount_backend=mount_backend, umount=umount, recorder=recorder)
+            root_dir = base_dir
+            session_dir = None
+            if pooled is True:
+                with chroot_metrics.phase(recorder, "pool_take", base_dir):
+                    session_dir = _take_pooled_session_root(registry, base_dir, host_type)
+            if overlay is True and session_dir is None:
+                # the mounts of `base_dir` are shared with the session root and need to be protected by the lock as well
+                with chroot_metrics.phase(recorder, "overlay_create", base_dir):
+                    session_dir = chroot_overlay.create_session_root(base_dir, list(reversed(_mount_targets(base_dir, host_type))), overlay_dir=overlay_dir, tmpfs_options=overlay_tmpfs_options)
+            if session_dir is not None:
+                root_dir = chroot_overlay.session_root_path(session_dir)
+            try:
+                with chroot_metrics.phase(recorder, "popen"):
+                    session_process = sp.Popen([chroot, root_dir, shell], close_fds=True) # don't leak the registry and mount table file descriptors into the session
+            except:
+                if session_dir is not None:
+                    chroot_overlay.remove_session_root(session_dir)
+                raise
+            pid = session_process.pid
+            logger.debug("adding pid %d for base directory '%s' and host type '%s' to registry '%s'" % (pid, base_dir, host_type, registry.registry_file_path, ))
+            with chroot_metrics.phase(recorder, "registry_register"):
+                start_time = chroot_process.process_start_time(pid)
+                with registry.locked():
+                    registry.register(base_dir, host_type, pid, start_time=start_time)
+                    if session_dir is not None:
+                        # allows `chroot_shutdown` to remove the root if the session isn't able to
+                        registry.add_overlay_root(base_dir, host_type, session_dir, pid, start_time=start_time)
+        # makes the new session visible in the active sessions metric while it's running
+        _write_metrics(recorder, registry)
+    finally:
+        registry.close()
+    try:
+        with chroot_metrics.phase(recorder, "wait") as timing:
+            session_process.wait() 
+            if session_process.returncode != 0:
+                timing.outcome = chroot_metrics.OUTCOME_FAILED
+    finally:
+        # a session which is still running (because waiting has been interrupted) is left to `chroot_shutdown`
+        if session_process.returncode is not None:
+            chroot_end(base_dir, host_type, pid, config_dir_path=config_dir_path, auto_umount=auto_umount, umount=umount, umount_backend=mount_backend, session_dir=session_dir, snapshot_dir=snapshot_dir, recorder=recorder)
+    if session_process.returncode != 0:
+        raise RuntimeError("chroot process failed and returned with returncode %d" % (session_process.returncode, ))
+
+def _take_pooled_session_root(registry, base_dir, host_type):
+    """Takes a prepared session root of `base_dir` and `host_type` from the pool in `registry` (see `chroot_pool.py`) and returns its session directory or `None` if the pool is empty. Roots which aren't mounted anymore (e.g. after a reboot) are discarded."""
+    mount_info = chroot_mountinfo.get_index()
+    while True:
+        session_dir = registry.take_pool_entry(base_dir, host_type)
+        if session_dir is None:
+            logger.info("pool of base directory '%s' and host type '%s' is empty" % (base_dir, host_type, ))
+            return None
+        if mount_info is None or mount_info.is_mounted(chroot_overlay.session_root_path(session_dir)):
+            logger.debug("using pooled session root '%s'" % (session_dir, ))
+            return session_dir
+        logger.warning("pooled session root '%s' isn't mounted anymore, discarding it" % (session_dir, ))
+        _discard_session_root(session_dir)
+
+def _discard_session_root(session_dir):
+    """Removes the session root `session_dir` which is no longer used (e.g. because it has been taken from the pool unusable or its session has been terminated) and logs failures because the removal mustn't prevent anything else."""
+    if not os.path.isdir(session_dir):
+        return
+    try:
+        chroot_overlay.remove_session_root(session_dir)
+    except OSError as ex:
+        logger.warning("removing session root '%s' failed: %s" % (session_dir, str(ex), ))
+
+def _chroot_namespace(base_dir, host_type, shell=shell_default, mount=mount_default, chroot=chroot_default, mount_backend=mount_backend_default, pid_namespace=False, recorder=None):
+    """Runs a session of `base_dir` in a private mount namespace (see `chroot`). Its start and end don't depend on the number of other sessions because neither the registry nor the mount table of the host are involved."""
+    # the host files are shared with all other sessions of `base_dir`
+    _sync_host_files(base_dir, host_type, recorder=recorder)
+    with chroot_metrics.phase(recorder, "namespace_start"):
+        pid = chroot_namespace.start_session([chroot, base_dir, shell], setup_function=lambda: _namespace_mounts(base_dir, host_type, mount=mount, mount_backend=mount_backend), pid_namespace=pid_namespace)
+    logger.debug("started session %d of base directory '%s' and host type '%s' in a mount namespace" % (pid, base_dir, host_type, ))
+    with chroot_metrics.phase(recorder, "wait") as timing:
+        returncode = chroot_namespace.wait_session(pid)
+        if returncode != 0:
+            timing.outcome = chroot_metrics.OUTCOME_FAILED
+    _write_metrics(recorder, None)
+    if returncode != 0:
+        raise RuntimeError("chroot process failed and returned with returncode %d" % (returncode, ))
+
+def _namespace_mounts(base_dir, host_type, mount=mount_default, mount_backend=mount_backend_default):
+    """Performs the mounts of `host_type` in `base_dir` in the mount namespace of a session started by `_chroot_namespace`."""
+    # mounts of `base_dir` copied from the host's namespace are mounted over, e.g. `/proc` needs to show the session's PID namespace
+    chroot_mount_plan.execute_mounts(base_dir, chroot_mount_plan.get_host_profile(host_type).mount_specs,
+        mount_function=lambda base_dir, spec: _mount(base_dir, spec, mount=mount, mount_backend=mount_backend),
+        umount_function=lambda target: None, # the kernel frees the mounts when the process which failed to set them up exits
+    )
+
+def load_host_profiles(config_dir_path, skip_invalid=False):
+    """Registers the host profiles described in the host profile directory of `config_dir_path` (see `chroot_mount_plan.load_host_profiles`)."""
+    return chroot_mount_plan.load_host_profiles(os.path.join(config_dir_path, host_profiles_dir_name), skip_invalid=skip_invalid)
+
+def load_kernel_modules(host_profile, kldload=kldload_default):
+    """Loads the kernel modules needed by the mounts of `host_profile` with `kldload`."""
+    if len(host_profile.kernel_modules) > 0:
+        sp.call([kldload]+list(host_profile.kernel_modules)) # fails if one of the modules is already loaded, loads all necessary modules
+
+def ensure_mounts(registry, base_dir, host_type, mount=mount_default, mount_backend=mount_backend_default, umount=umount_default, recorder=None):
+    """Invokes `chroot_start` for `base_dir` and `host_type` unless all their mounts are set up already. Should be called while holding the lock of `base_dir` and `host_type` (see `chroot_registry.base_dir_lock`). Returns `True` if `chroot_start` has been invoked, `False` otherwise."""
+    # check whether eventually mounted outside the script (the registry is only consulted if the mount table can't be inspected because stale pids would skip the setup):
+    with chroot_metrics.phase(recorder, "check_mounts", base_dir):
+        missing_mount_targets = _missing_mount_targets(base_dir, host_type)
+        if missing_mount_targets is None:
+            # sessions are unregistered when they exit, but the mounts stay set up unless they've been unmounted
+            registry.reap(base_dir=base_dir, host_type=host_type)
+            mounts_set_up = len(registry.lookup(base_dir, host_type)) > 0 or len(registry.list_mounts(base_dir=base_dir, host_type=host_type)) > 0
+        else:
+            mounts_set_up = len(missing_mount_targets) == 0
+    # recorded in both cases because the mounts might have been set up by a version which didn't record them
+    if mounts_set_up:
         logger.info("mounts already set up for base directory '%s' and host type '%s'" % (base_dir, host_type, ))
-    else:
-        chroot_start(base_dir=base_dir, host_type=host_type, mount=mount)
-    chroot_process = sp.Popen([chroot, base_dir, shell])
-    pid = chroot_process.pid
-    count_file_dbm = dumbdbm.open(count_file_path) # pass an instance of a key-value-store opened outside of shelve in order to work around http://bugs.python.org/issue23174
-    count_file_dict = shelve.Shelf(dict=count_file_dbm)
-    if not base_dir in count_file_dict:
-        count_file_dict[base_dir]= dict()
-    base_dir_dict = count_file_dict[base_dir]
-    if not host_type in base_dir_dict:
-        base_dir_dict[host_type] = set()
-    count_file_entry = "%s%s%s%s%s" % (base_dir, count_file_separator, pid, count_file_separator, host_type, )
-    logger.debug("adding entry '%s' to count file '%s'" % (count_file_entry, count_file_path, ))     
-    base_dir_dict[host_type].add(pid)
-    count_file_dict.close()
-    chroot_process.wait() 
-    if chroot_process.returncode != 0:
-        raise RuntimeError("chroot process failed and returned with returncode %d" % (chroot_process.returncode, ))
-
-def chroot_start(base_dir, host_type, mount=mount_default):
-    proc = "/proc"
-    sys = "/sys"
-    devpts = "/dev/pts"
-    dev = "/dev"
-    # @TODO: handle unmounting of successful mounts if not all are successful
-    proc_mount_target = os.path.join(base_dir, "proc")
-    sys_mount_target = os.path.join(base_dir, "sys")
-    dev_mount_target = os.path.join(base_dir, "dev")
-    devpts_mount_target = os.path.join(base_dir, "dev/pts")
-    if host_type == HOST_TYPE_DEBIAN:
-        mount_utils.lazy_mount(proc, proc_mount_target, "proc", mount=mount)
-        sp.check_call([mount, "-t", "sysfs", sys, sys_mount_target])
-            # mount_utils.lazy_mount doesn't work because os.makedirs fails with 
-            # OSError "file exists" although it doesn't
-        mount_utils.lazy_mount("/dev", dev_mount_target, fs_type=None, options_str="bind", mount=mount)
-        mount_utils.lazy_mount("/dev/pts", devpts_mount_target, "devpts", mount=mount)
-    elif host_type == HOST_TYPE_FREEBSD:
-        mount_utils.lazy_mount("none", proc_mount_target, "linprocfs", mount=mount)
-        mount_utils.lazy_mount("devfs", dev_mount_target, "devfs", mount=mount)
-            # both `mount_nullfs /dev/ dev_mount_target` and `mount -t devfs none dev_mount_target` succeed, but don't initialize /dev/urandom (when read with cat; ssl fails as well)
-        mount_utils.lazy_mount("none", sys_mount_target, "linsysfs", mount=mount)
-        mount_utils.lazy_mount("none", os.path.join(base_dir, "lib/init/rw"), "tmpfs", mount=mount)
-    else:
-        raise ValueError("host_type '%s' not supported" % (str(host_type), ))
+        registry.register_mounts(base_dir, host_type)
+        # every session should start with the current host files even if nobody watches them (see `watch_host_files`)
+        _sync_host_files(base_dir, host_type, recorder=recorder)
+        return False
+    chroot_start(base_dir=base_dir, host_type=host_type, mount=mount, mount_backend=mount_backend, umount=umount, recorder=recorder)
+    registry.register_mounts(base_dir, host_type)
+    return True
+
+def chroot_end(base_dir, host_type, pid, config_dir_path=config_dir_path_default, auto_umount=False, umount=umount_default, umount_backend=mount_backend_default, session_dir=None, snapshot_dir=None, recorder=None):
+    """Removes the session `pid` of `base_dir` and `host_type` which has exited and all sessions which are no longer running from the registry in `config_dir_path` and unmounts the mounts of `base_dir` and `host_type` if `auto_umount` is `True` and no session of them is running anymore. If the session ran in the overlay root `session_dir` it's removed before (see `chroot_overlay.remove_session_root` for `snapshot_dir`); the session is removed from the registry even if that fails. Returns `True` if the mounts have been unmounted, `False` otherwise. Writes the metrics of `recorder` (if not `None`) afterwards."""
+    registry = chroot_registry.open_registry(config_dir_path)
+    try:
+        try:
+            # `chroot_shutdown` might have removed the root already
+            if session_dir is not None and registry.remove_overlay_root(session_dir):
+                with chroot_metrics.phase(recorder, "overlay_remove", base_dir):
+                    try:
+                        chroot_overlay.remove_session_root(session_dir, snapshot_dir=snapshot_dir)
+                    except:
+                        # left to `chroot_shutdown`
+                        registry.add_overlay_root(base_dir, host_type, session_dir, pid)
+                        raise
+        finally:
+            umounted = _unregister_session(registry, config_dir_path, base_dir, host_type, pid, auto_umount=auto_umount, umount=umount, umount_backend=umount_backend, recorder=recorder)
+        return umounted
+    finally:
+        _write_metrics(recorder, registry)
+        registry.close()
+
+def _unregister_session(registry, config_dir_path, base_dir, host_type, pid, auto_umount=False, umount=umount_default, umount_backend=mount_backend_default, recorder=None):
+    """Removes the session `pid` from `registry` and frees the mounts if it's the last one (see `chroot_end`)."""
+    with chroot_registry.base_dir_lock(config_dir_path, base_dir, host_type):
+        with chroot_metrics.phase(recorder, "registry_unregister"):
+            registry.unregister(base_dir, host_type, pid)
+            registry.reap(base_dir=base_dir, host_type=host_type)
+        # the mounts are kept for the prepared roots of a pool as well
+        if not auto_umount or len(registry.lookup(base_dir, host_type)) > 0 or len(registry.list_pool_entries(base_dir=base_dir, host_type=host_type)) > 0:
+            return False
+        logger.info("last session of base directory '%s' and host type '%s' exited, freeing mounts" % (base_dir, host_type, ))
+        success = _umount_host_type(base_dir, host_type, umount=umount, umount_backend=umount_backend, recorder=recorder)
+        if success:
+            registry.unregister_mounts(base_dir, host_type)
+        return success
+
+def chroot_start(base_dir, host_type, mount=mount_default, mount_backend=mount_backend_default, umount=umount_default, workers=chroot_mount_plan.workers_default, recorder=None):
+    """Performs the mounts of the host profile `host_type` (see `chroot_mount_plan.py`) in `base_dir` which aren't mounted yet and synchronizes the host files of the profile (e.g. `/etc/resolv.conf`) into it. Mounts which don't depend on each other are performed concurrently by up to `workers` threads. If a mount fails, the mounts performed before are unmounted again. `mount` and `umount` are only used if `mount_backend` is `MOUNT_BACKEND_BINARY`. Every mount is timed with `recorder` unless it's `None`."""
+    host_profile = chroot_mount_plan.get_host_profile(host_type)
+    if mount_backend == MOUNT_BACKEND_SYSCALL and not host_profile.syscall_supported:
+        # e.g. mount(2) of FreeBSD has a different signature and the filesystems need `mount` specific preparations
+        logger.debug("mount backend '%s' not supported for host type '%s', using '%s'" % (mount_backend, host_type, MOUNT_BACKEND_BINARY, ))
+        mount_backend = MOUNT_BACKEND_BINARY
+    # mounts which already exist (e.g. set up by a previous start or outside the script) are skipped
+    mount_info = chroot_mountinfo.get_index()
+    chroot_mount_plan.execute_mounts(base_dir, host_profile.mount_specs,
+        mount_function=lambda base_dir, spec: _mount(base_dir, spec, mount=mount, mount_backend=mount_backend, recorder=recorder),
+        umount_function=lambda target: _umount(target, umount=umount, umount_backend=mount_backend, lazy_umount_option=host_profile.lazy_umount_option, recorder=recorder),
+        is_mounted=None if mount_info is None else mount_info.is_mounted,
+        workers=workers,
+    )
     logger.info("setup mount points for base directory '%s' and host type '%s'" % (base_dir, host_type, ))
-    logger.info("copying /etc/resolv.conf into base directory '%s'" % (base_dir, ))
-    resolv_target_path = os.path.join(base_dir, "etc", "resolv.conf")
-    os.remove(resolv_target_path) # script leaves a broken link (either python 2.7.8 or Linux 3.16.0 or something else or everything doesn't work)
-    if not os.path.exists(os.path.dirname(resolv_target_path)):
-        os.makedirs(os.path.dirname(resolv_target_path))
-    shutil.copyfile("/etc/resolv.conf", resolv_target_path)
-
-def chroot_shutdown(base_dir=None, host_type=None, config_dir_path=config_dir_path_default, umount=umount_default, debug=False):
-    """Reads the PIDs of all started instances from `config_dir_path/count_file_name` which is expected to be created by `chroot`, terminates them and then frees the resources, i.e. unmounts the (virtual) filesystems and directories which have been mounted in `chroot`. Returns `0` on success and `1` if `config_dir_path/count_file_name` doesn't exist."""
+    _sync_host_files(base_dir, host_type, recorder=recorder)
+
+def _sync_host_files(base_dir, host_type, recorder=None):
+    """Synchronizes the host files of the host profile `host_type` into `base_dir` (see `chroot_hostfiles.sync_files`)."""
+    with chroot_metrics.phase(recorder, "sync_host_files", base_dir):
+        written = chroot_hostfiles.sync_files(base_dir, chroot_mount_plan.get_host_profile(host_type).sync_files)
+    if len(written) > 0:
+        logger.info("synchronized %s into base directory '%s'" % (str.join(", ", ["'%s'" % (path, ) for path in written]), base_dir, ))
+
+def sync_host_files(config_dir_path=config_dir_path_default, base_dir=None, host_type=None, source_paths=None):
+    """Synchronizes the host files of the host profiles into all base directories which have mounts set up or running sessions according to the registry in `config_dir_path`. `base_dir` and `host_type` restrict the synchronization to that base directory and/or host type (`None` means all) and `source_paths` to these host files (`None` means all files of the profiles). Returns the list of paths which have been written."""
+    load_host_profiles(config_dir_path)
+    registry = chroot_registry.open_registry(config_dir_path)
+    try:
+        targets = set(registry.list_mounts(base_dir=base_dir, host_type=host_type))
+        targets |= set([(base_dir0, host_type0) for base_dir0, host_type0, pid, start_time in registry.list_sessions(base_dir=base_dir, host_type=host_type)])
+    finally:
+        registry.close()
+    written = []
+    for base_dir0, host_type0 in sorted(targets):
+        if host_type0 not in chroot_mount_plan.host_profiles:
+            logger.error("host_type '%s' not supported, skipping base directory '%s'" % (host_type0, base_dir0, ))
+            continue
+        if not os.path.isdir(base_dir0):
+            logger.warning("base directory '%s' doesn't exist anymore, skipping it" % (base_dir0, ))
+            continue
+        sync_files = chroot_mount_plan.get_host_profile(host_type0).sync_files
+        if source_paths is not None:
+            sync_files = [sync_file for sync_file in sync_files if sync_file in source_paths]
+        written += chroot_hostfiles.sync_files(base_dir0, sync_files)
+    for path in written:
+        logger.info("synchronized '%s'" % (path, ))
+    return written
+
+def watch_host_files(config_dir_path=config_dir_path_default, debounce=chroot_hostfiles.debounce_default):
+    """Synchronizes the host files of all host profiles into the registered base directories (see `sync_host_files`) and keeps doing so for every change of a host file until interrupted. Base directories registered later are taken into account at the next change. Requires inotify (Linux only)."""
+    sync_host_files(config_dir_path)
+    source_paths = set()
+    for host_profile in chroot_mount_plan.host_profiles.values():
+        source_paths |= set(host_profile.sync_files)
+    logger.info("watching %s" % (str.join(", ", ["'%s'" % (source_path, ) for source_path in sorted(source_paths)]), ))
+    watcher = chroot_hostfiles.HostFileWatcher(sorted(source_paths))
+    try:
+        while True:
+            changed = watcher.wait(debounce=debounce)
+            logger.debug("host files %s changed" % (str.join(", ", ["'%s'" % (source_path, ) for source_path in sorted(changed)]), ))
+            sync_host_files(config_dir_path, source_paths=changed)
+    finally:
+        watcher.close()
+
+def chroot_shutdown(base_dir=None, host_type=None, config_dir_path=config_dir_path_default, umount=umount_default, umount_backend=mount_backend_default, timeout=shutdown_timeout_default, term_timeout=chroot_process.term_timeout_default, workers=shutdown_workers_default, metrics_file=None, metrics_textfile=None, debug=False):
+    """Reads the PIDs of all started instances from the session registry in `config_dir_path` which is expected to be created by `chroot`, terminates them and then frees the resources, i.e. unmounts the (virtual) filesystems and directories which have been mounted in `chroot`, and removes them from the registry together with the prepared session roots of the pool (see `chroot_pool.py`) and the overlay roots of the terminated sessions. `base_dir` and `host_type` restrict the shutdown to sessions of that base directory and/or host type (`None` means all). Base directories are shut down concurrently by `workers` threads. Sessions receive `SIGTERM` and are killed with `SIGKILL` if they're still running after `term_timeout` seconds; the whole shutdown waits at most `timeout` seconds for sessions to exit (mounts which are still busy afterwards are detached lazily). `umount` is only used if `umount_backend` is `MOUNT_BACKEND_BINARY`. The termination of the sessions of every base directory and every unmount are timed if `metrics_file` or `metrics_textfile` is specified (see `chroot_metrics.py`). Returns `0` on success and if the registry doesn't exist and `1` if not all base directories could be shut down cleanly."""
     # internal implementation notes:
     # - should be parameterless because this makes wrapping the function as easy as possible (see script comment as well)
+    # - the registry connection can't be shared between threads -> workers only terminate and unmount and the registry is updated afterwards
     if debug is True:
         logger.info("turning on debugging messages")
         logger.setLevel(logging.DEBUG)
         ch.setLevel(logging.DEBUG)
-    count_file_path=os.path.join(config_dir_path, count_file_name)
-    if not os.path.exists(count_file_path):
-        logger.info("count file '%s' doesn't exist, canceling shutdown" % (count_file_path, ))
+    deadline = chroot_libc.monotonic()+timeout
+    recorder = None
+    if metrics_file is not None or metrics_textfile is not None:
+        recorder = chroot_metrics.Recorder("chroot_shutdown", jsonl_file_path=metrics_file, textfile_path=metrics_textfile)
+    registry_file_path = os.path.join(config_dir_path, chroot_registry.registry_file_name)
+    if not os.path.exists(registry_file_path) and not os.path.exists(os.path.join(config_dir_path, chroot_registry.legacy_count_file_name+".dir")):
+        logger.info("registry '%s' doesn't exist, canceling shutdown" % (registry_file_path, ))
+        _write_metrics(recorder, None)
         return 0
-    count_file_dbm = dumbdbm.open(count_file_path)
-    count_file_dict = shelve.Shelf(dict=count_file_dbm)
-    if len(count_file_dict) == 0:
-        logger.info("count file '%s' is empty" % (count_file_path, ))
-    for base_dir0, base_dir_dict in count_file_dict.items():
-        if base_dir != None and base_dir0 != base_dir:
-            continue
-        proc_mount_target = os.path.join(base_dir0, "proc")
-        sys_mount_target = os.path.join(base_dir0, "sys")
-        dev_mount_target = os.path.join(base_dir0, "dev")
-        devpts_mount_target = os.path.join(base_dir0, "dev/pts")
-        host_type_dict = base_dir_dict[base_dir0]
-        if len(host_type_dict) > 0:            
-            for host_type0, pids in host_type_dict.items():
-                if host_type != None and host_type0 != host_type:
-                    continue
-                for pid in pids:
-                    try:
-                        os.kill(pid, signal.SIGTERM)
-                    except OSError:
-                        # a real error occured or the process no longer exists (an entry doesn't denote a running chroot session, but the possibility that the mounts need to be unmounted), but in case this is called at system shutdown we really need to kill
-                        pass
-                # everything killed -> free resources
-                if host_type0 == HOST_TYPE_DEBIAN:
-                    sp.call([umount, devpts_mount_target]) # before dev_mount_target
-                    sp.call([umount, dev_mount_target])
-                    sp.call([umount, sys_mount_target])
-                    sp.call([umount, proc_mount_target])
-                elif host_type0 == HOST_TYPE_FREEBSD:
-                    sp.call([umount, dev_mount_target])
-                    sp.call([umount, sys_mount_target])
-                    sp.call([umount, proc_mount_target])
-                    sp.call([umount, os.path.join(base_dir0, "lib/init/rw")])
-                else:
-                    raise ValueError("host_type '%s' not supported (count file '%s' corrupted)" % (host_type0, count_file_path, ))
-                logger.info("umounted chroot mounts for base directory '%s' and host type '%s'" % (base_dir0, host_type0, ))
-                host_type_dict.pop(host_type0)
-    count_file_dict.close()
-
-def retrieve_pids(base_dir, host_type, count_file_path):
-    """Retrieves a list of pids of chroot session currently started for `host_type` or an empty list if no pids are managed for that type."""
-    count_file_dbm = dumbdbm.open(count_file_path)
-    count_file_dict = shelve.Shelf(dict=count_file_dbm)
-    if not base_dir in count_file_dict:
-        return []
-    if not host_type in count_file_dict[base_dir]:
-        return []
-    ret_value = count_file_dict[base_dir][host_type]
-    count_file_dict.close()
+    # an invalid profile mustn't prevent the shutdown of the other host types
+    load_host_profiles(config_dir_path, skip_invalid=True)
+    with chroot_metrics.phase(recorder, "registry_open"):
+        registry = chroot_registry.open_registry(config_dir_path)
+    try:
+        sessions = registry.list_sessions(base_dir=base_dir, host_type=host_type)
+        mounts = registry.list_mounts(base_dir=base_dir, host_type=host_type)
+        # the pool of a base directory keeps its mounts and the overlay roots of sessions which haven't been removed need to be freed as well
+        mounts = sorted(set(mounts) | set([(base_dir0, host_type0) for base_dir0, host_type0, session_dir, created in registry.list_pool_entries(base_dir=base_dir, host_type=host_type)]) | set([(base_dir0, host_type0) for base_dir0, host_type0, session_dir, pid, start_time in registry.list_overlay_roots(base_dir=base_dir, host_type=host_type)]))
+        if len(sessions) == 0 and len(mounts) == 0:
+            logger.info("registry '%s' contains no sessions and mounts" % (registry_file_path, ))
+            return 0
+        ret_value = 0
+        host_type_dicts = dict() # base_dir -> host_type -> pids of running sessions
+        # mounts which are set up without sessions need to be freed as well
+        for base_dir0, host_type0, pid, start_time in sessions+[(base_dir0, host_type0, None, None) for base_dir0, host_type0 in mounts]:
+            if host_type0 not in chroot_mount_plan.host_profiles:
+                logger.error("host_type '%s' not supported (registry '%s' corrupted), skipping base directory '%s'" % (host_type0, registry_file_path, base_dir0, ))
+                ret_value = 1
+                continue
+            host_type_pids = host_type_dicts.setdefault(base_dir0, dict()).setdefault(host_type0, set())
+            # the entry of a session which is no longer running still denotes mounts which need to be unmounted, but its pid might have been reused by an unrelated process which mustn't be killed
+            if pid is not None and chroot_process.session_alive(pid, start_time):
+                host_type_pids.add(pid)
+        results = chroot_mount_plan.parallel_map(lambda item: _shutdown_base_dir(item[0], item[1], deadline=deadline, term_timeout=term_timeout, umount=umount, umount_backend=umount_backend, recorder=recorder), sorted(host_type_dicts.items()), workers)
+        with chroot_metrics.phase(recorder, "registry_unregister"):
+            for base_dir0, host_types, remaining, umounted_host_types, success in results:
+                for host_type0 in host_types:
+                    with chroot_registry.base_dir_lock(config_dir_path, base_dir0, host_type0):
+                        # sessions which survived the shutdown are kept, so that it can be run again
+                        terminated = set()
+                        for base_dir1, host_type1, pid, start_time in sessions:
+                            if base_dir1 == base_dir0 and host_type1 == host_type0 and pid not in remaining:
+                                registry.unregister(base_dir0, host_type0, pid)
+                                terminated.add(pid)
+                        # overlay roots of terminated sessions (which might not have been reaped by their parent yet) and of sessions which crashed before
+                        for base_dir1, host_type1, session_dir, pid, start_time in registry.list_overlay_roots(base_dir=base_dir0, host_type=host_type0):
+                            if (pid in terminated or not chroot_process.session_alive(pid, start_time)) and registry.remove_overlay_root(session_dir):
+                                _discard_session_root(session_dir)
+                        if host_type0 not in umounted_host_types:
+                            # kept (together with the prepared roots sharing the mounts) for the next shutdown
+                            continue
+                        registry.unregister_mounts(base_dir0, host_type0)
+                        # prepared roots share the mounts which have just been freed
+                        for base_dir1, host_type1, session_dir, created in registry.list_pool_entries(base_dir=base_dir0, host_type=host_type0):
+                            if registry.remove_pool_entry(session_dir):
+                                _discard_session_root(session_dir)
+                if not success:
+                    ret_value = 1
+    finally:
+        _write_metrics(recorder, registry)
+        registry.close()
     return ret_value
 
+def _shutdown_base_dir(base_dir, host_type_dict, deadline, term_timeout=chroot_process.term_timeout_default, umount=umount_default, umount_backend=mount_backend_default, recorder=None):
+    """Terminates all sessions in `host_type_dict` (a dict of host type to pids) of `base_dir` and unmounts their mounts. Runs in a worker thread of `chroot_shutdown`. Returns a tuple of `base_dir`, the list of shut down host types, the set of pids of sessions which are still running, the set of host types whose mounts have been unmounted and a flag indicating whether everything succeeded."""
+    pids = set()
+    for host_type_pids in host_type_dict.values():
+        pids |= host_type_pids
+    with chroot_metrics.phase(recorder, "terminate", base_dir) as timing:
+        remaining = chroot_process.terminate_pids(pids, deadline=deadline, term_timeout=term_timeout)
+        if len(remaining) > 0:
+            timing.outcome = chroot_metrics.OUTCOME_FAILED
+    success = True
+    if len(remaining) > 0:
+        logger.warning("sessions %s of base directory '%s' are still running after the shutdown timeout" % (str.join(", ", [str(pid) for pid in sorted(remaining)]), base_dir, ))
+        success = False
+    # everything killed -> free resources
+    umounted_host_types = set()
+    for host_type in sorted(host_type_dict.keys()):
+        if _umount_host_type(base_dir, host_type, umount=umount, umount_backend=umount_backend, recorder=recorder):
+            umounted_host_types.add(host_type)
+        else:
+            success = False
+    return base_dir, sorted(host_type_dict.keys()), remaining, umounted_host_types, success
+
+def _umount_host_type(base_dir, host_type, umount=umount_default, umount_backend=mount_backend_default, recorder=None):
+    """Unmounts the mounts set up by `chroot_start` for `host_type` in `base_dir` which are currently mounted. Returns `True` if all of them have been unmounted, `False` otherwise."""
+    host_profile = chroot_mount_plan.get_host_profile(host_type)
+    if not host_profile.syscall_supported:
+        umount_backend = MOUNT_BACKEND_BINARY
+    mount_targets = _mount_targets(base_dir, host_type)
+    mount_info = chroot_mountinfo.get_index()
+    if mount_info is not None:
+        # only unmount what's actually mounted, but every filesystem stacked on a target
+        mounted = mount_info.mounts_under(base_dir)
+        mount_targets = [mount_target for mount_target in mount_targets for _ in range(mounted.count(mount_target))]
+    success = True
+    for mount_target in mount_targets:
+        success = _umount(mount_target, umount=umount, umount_backend=umount_backend, lazy_umount_option=host_profile.lazy_umount_option, recorder=recorder) and success
+    if success:
+        logger.info("umounted chroot mounts for base directory '%s' and host type '%s'" % (base_dir, host_type, ))
+    else:
+        logger.warning("not all chroot mounts for base directory '%s' and host type '%s' could be unmounted" % (base_dir, host_type, ))
+    return success
+
+def _missing_mount_targets(base_dir, host_type):
+    """Returns the list of mount targets of `host_type` in `base_dir` which aren't mounted or `None` if the mount table can't be inspected on this system."""
+    mount_info = chroot_mountinfo.get_index()
+    if mount_info is None:
+        return None
+    return [mount_target for mount_target in _mount_targets(base_dir, host_type) if not mount_info.is_mounted(mount_target)]
+
+def _mount_targets(base_dir, host_type):
+    """Returns the list of mount targets set up by `chroot_start` for `host_type` in `base_dir` in the order in which they need to be unmounted."""
+    host_profile = chroot_mount_plan.get_host_profile(host_type)
+    return [os.path.join(base_dir, spec.target) for spec in chroot_mount_plan.umount_order(host_profile.mount_specs)]
+
+def _mount(base_dir, spec, mount=mount_default, mount_backend=mount_backend_default, recorder=None):
+    """Performs the mount described by the `chroot_mount_plan.MountSpec` `spec` in `base_dir` and creates its target if it doesn't exist. The mount is timed with `recorder` unless it's `None`."""
+    target = os.path.join(base_dir, spec.target)
+    with chroot_metrics.phase(recorder, "mount", target):
+        if mount_backend == MOUNT_BACKEND_SYSCALL:
+            chroot_mount.lazy_syscall_mount(spec.source, target, fs_type=spec.fs_type, options_str=spec.options)
+            return
+        try:
+            os.makedirs(target)
+        except OSError:
+            # exists or has been created by a concurrent mount
+            if not os.path.isdir(target):
+                raise
+        mount_cmds = [mount]
+        if spec.fs_type is not None:
+            mount_cmds += ["-t", spec.fs_type]
+        if spec.options is not None:
+            mount_cmds += ["-o", spec.options]
+        sp.check_call(mount_cmds+[spec.source, target])
+
+def _umount(target, umount=umount_default, umount_backend=mount_backend_default, lazy_umount_option=None, recorder=None):
+    """Unmounts `target` and logs failures instead of raising an exception because a failed unmount mustn't prevent the remaining unmounts (analogous to `subprocess.call`). If the unmount fails because `target` is busy, it's detached lazily with `MNT_DETACH` or by passing `lazy_umount_option` to `umount` (no lazy unmount is attempted if it's `None`). Returns `True` if `target` has been unmounted or wasn't mounted, `False` otherwise. The unmount is timed with `recorder` unless it's `None`."""
+    with chroot_metrics.phase(recorder, "umount", target) as timing:
+        success = _umount_target(target, umount=umount, umount_backend=umount_backend, lazy_umount_option=lazy_umount_option)
+        if not success:
+            timing.outcome = chroot_metrics.OUTCOME_FAILED
+    return success
+
+def _umount_target(target, umount=umount_default, umount_backend=mount_backend_default, lazy_umount_option=None):
+    """Performs the unmount of `_umount` without timing it."""
+    if umount_backend == MOUNT_BACKEND_SYSCALL:
+        try:
+            chroot_mount.syscall_umount(target)
+        except OSError as ex:
+            if ex.errno in [errno.EINVAL, errno.ENOENT]:
+                logger.debug("'%s' isn't mounted" % (target, ))
+                return True
+            if ex.errno != errno.EBUSY:
+                logger.warning(str(ex))
+                return False
+            logger.info("'%s' is busy, detaching it lazily" % (target, ))
+            try:
+                chroot_mount.syscall_umount(target, chroot_mount.MNT_DETACH)
+            except OSError as ex:
+                logger.warning(str(ex))
+                return False
+        return True
+    if sp.call([umount, target]) == 0:
+        return True
+    if lazy_umount_option is None:
+        return False
+    logger.info("unmounting '%s' failed, retrying with '%s'" % (target, lazy_umount_option, ))
+    return sp.call([umount, lazy_umount_option, target]) == 0
+
+def _write_metrics(recorder, registry):
+    """Writes the metrics of `recorder` together with the number of running sessions per base directory and host type in `registry` (if not `None`). Does nothing if `recorder` is `None`."""
+    if recorder is None:
+        return
+    active_sessions = None
+    # checking every registered session is only worth it if the textfile is written
+    if registry is not None and recorder.textfile_path is not None:
+        # base directories whose mounts are set up are reported with 0 sessions after their last session exited
+        active_sessions = dict([(mount, 0) for mount in registry.list_mounts()])
+        for base_dir, host_type, pid, start_time in registry.list_sessions():
+            if chroot_process.session_alive(pid, start_time):
+                active_sessions[(base_dir, host_type)] = active_sessions.get((base_dir, host_type), 0)+1
+    recorder.write(active_sessions=active_sessions)
+
+def retrieve_pids(base_dir, host_type, count_file_path=None, config_dir_path=config_dir_path_default):
+    """Retrieves a list of pids of chroot session currently started for `base_dir` and `host_type` or an empty list if no pids are managed for that type. `count_file_path` is the count file of older versions which determines the registry (the one in its directory) and is migrated into it; `config_dir_path` is used if it's `None`."""
+    if count_file_path is None:
+        registry = chroot_registry.open_registry(config_dir_path)
+    else:
+        registry = chroot_registry.SessionRegistry(os.path.join(os.path.dirname(os.path.abspath(count_file_path)), chroot_registry.registry_file_name))
+        registry.migrate_count_file(count_file_path)
+    try:
+        return sorted(registry.lookup(base_dir, host_type))
+    finally:
+        registry.close()
+
 def main():
     """entry point for setuptools"""
     plac.call(chroot)
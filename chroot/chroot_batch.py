@@ -0,0 +1,219 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_batch.py` runs many non-interactive commands in a chroot concurrently. The mounts are set up once for the whole batch and the batch as well as every running command are registered as sessions in the registry (so that `chroot_shutdown` terminates them and the automatic unmount of `chroot.chroot_end` takes them into account). The output of every command is streamed line by line with a prefix identifying the command.
+
+import plac
+import os
+import sys
+import time
+import signal
+import threading
+import collections
+import logging
+import subprocess as sp
+from multiprocessing.pool import ThreadPool
+import multiprocessing
+import chroot
+import chroot_registry
+import chroot_process
+import chroot_mount_plan
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+
+workers_default = 4
+shell_default = "/bin/sh"
+prefix_format_default = "[%(index)d %(stream)s] "
+forwarded_signals = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]
+result_timeout = 1.0 # waiting for a result without timeout can't be interrupted by signals in Python 2
+
+CommandResult = collections.namedtuple("CommandResult", ["index", "command", "returncode", "duration"])
+
+def read_commands(commands_file):
+    """Yields the commands in the file object `commands_file`, one per line. Empty lines and lines starting with `#` are skipped."""
+    for line in iter(commands_file.readline, ""):
+        command = line.strip()
+        if command == "" or command.startswith("#"):
+            continue
+        yield command
+
+class OutputStreamer(object):
+    """Writes lines of the output of concurrently running commands to `output` with a prefix identifying the command and the stream. Lines are written atomically."""
+
+    def __init__(self, output, prefix_format=prefix_format_default):
+        self.output = output
+        self.prefix_format = prefix_format
+        self.lock = threading.Lock()
+
+    def stream(self, index, stream_name, stream):
+        """Copies the lines of the file object `stream` of the command with `index` to the output until EOF."""
+        prefix = self.prefix_format % {"index": index, "stream": stream_name}
+        for line in iter(stream.readline, ""):
+            if not line.endswith("\n"):
+                line += "\n"
+            with self.lock:
+                self.output.write(prefix+line)
+                self.output.flush()
+        stream.close()
+
+class BatchSessions(object):
+    """Registers the running commands of a batch as sessions of `base_dir` and `host_type` in `registry` which is shared by the threads running the commands. Every command runs in its own process group, so that `chroot.chroot_shutdown` terminates the processes started by it as well."""
+
+    def __init__(self, registry, base_dir, host_type):
+        self.registry = registry
+        self.base_dir = base_dir
+        self.host_type = host_type
+        self.lock = threading.Lock()
+        self.pids = set()
+
+    def register(self, pid):
+        with self.lock:
+            self.pids.add(pid)
+            self.registry.register(self.base_dir, self.host_type, pid, start_time=chroot_process.process_start_time(pid))
+
+    def unregister(self, pid):
+        with self.lock:
+            self.pids.discard(pid)
+            self.registry.unregister(self.base_dir, self.host_type, pid)
+
+    def kill(self, sig):
+        """Sends `sig` to the process groups of the running commands. Doesn't acquire `lock` because it's invoked by signal handlers."""
+        for pid in list(self.pids):
+            try:
+                os.killpg(pid, sig)
+            except OSError:
+                pass
+
+def run_command(base_dir, index, command, streamer, shell=shell_default, chroot_binary=chroot.chroot_default, sessions=None):
+    """Runs `command` with `shell -c` in the chroot `base_dir` whose mounts need to be set up and streams its standard output and error through `streamer` (an `OutputStreamer`). The command is registered in `sessions` (a `BatchSessions`) while it's running unless it's `None`. Returns a `CommandResult`."""
+    start = time.time()
+    with open(os.devnull, "r") as devnull:
+        command_process = sp.Popen([chroot_binary, base_dir, shell, "-c", command], stdin=devnull, stdout=sp.PIPE, stderr=sp.PIPE, bufsize=-1, close_fds=True, preexec_fn=os.setpgrp) # buffered, otherwise `readline` reads the output byte by byte
+    if sessions is not None:
+        sessions.register(command_process.pid)
+    try:
+        stderr_thread = threading.Thread(target=streamer.stream, args=(index, "err", command_process.stderr, ))
+        stderr_thread.start()
+        streamer.stream(index, "out", command_process.stdout)
+        stderr_thread.join()
+        command_process.wait()
+    finally:
+        if sessions is not None:
+            sessions.unregister(command_process.pid)
+    return CommandResult(index=index, command=command, returncode=command_process.returncode, duration=time.time()-start)
+
+def run_commands(base_dir, commands, workers=workers_default, host_type=chroot.host_type_default, shell=shell_default, config_dir_path=chroot.config_dir_path_default, mount=chroot.mount_default, kldload=chroot.kldload_default, mount_backend=chroot.mount_backend_default, chroot_binary=chroot.chroot_default, umount=chroot.umount_default, auto_umount=False, output=sys.stdout, prefix_format=prefix_format_default):
+    """Loads the kernel modules and sets up the mounts of `base_dir` and `host_type` if necessary and runs the commands of the iterable `commands` (which might be a generator) in the chroot `base_dir` with at most `workers` commands running at the same time. The output of the commands is written to `output` line by line prefixed with `prefix_format` which can refer to the index of the command in `commands` with `%(index)d` and to the stream with `%(stream)s` (`out` or `err`). Returns the list of `CommandResult`s ordered by index."""
+    base_dir = os.path.realpath(base_dir)
+    if not os.path.isdir(base_dir):
+        raise ValueError("base directory '%s' doesn't exist" % (base_dir, ))
+    if not os.path.exists(config_dir_path):
+        os.makedirs(config_dir_path)
+    chroot.load_host_profiles(config_dir_path)
+    chroot.load_kernel_modules(chroot_mount_plan.get_host_profile(host_type), kldload=kldload)
+    pid = os.getpid()
+    # `chroot_shutdown` needs to terminate the commands, killing the batch doesn't terminate them
+    registry = chroot_registry.open_registry(config_dir_path, check_same_thread=False)
+    try:
+        with chroot_registry.base_dir_lock(config_dir_path, base_dir, host_type):
+            chroot.ensure_mounts(registry, base_dir, host_type, mount=mount, mount_backend=mount_backend, umount=umount)
+            registry.register(base_dir, host_type, pid, start_time=chroot_process.process_start_time(pid))
+        sessions = BatchSessions(registry, base_dir, host_type)
+        streamer = OutputStreamer(output, prefix_format=prefix_format)
+        previous_handlers = dict()
+        def forward_signal(signum, frame):
+            # the commands don't receive signals sent to the process group of the batch (e.g. by Ctrl-C); the batch itself reacts like before afterwards
+            sessions.kill(signum)
+            signal.signal(signum, previous_handlers[signum])
+            os.kill(os.getpid(), signum)
+        for forwarded_signal in forwarded_signals:
+            previous_handlers[forwarded_signal] = signal.signal(forwarded_signal, forward_signal)
+        pool = ThreadPool(workers)
+        try:
+            results = []
+            result_iterator = pool.imap_unordered(lambda item: run_command(base_dir, item[0], item[1], streamer, shell=shell, chroot_binary=chroot_binary, sessions=sessions), enumerate(commands))
+            while True:
+                try:
+                    results.append(result_iterator.next(result_timeout))
+                except multiprocessing.TimeoutError:
+                    continue
+                except StopIteration:
+                    break
+        finally:
+            pool.close()
+            pool.join()
+            for forwarded_signal, previous_handler in previous_handlers.items():
+                signal.signal(forwarded_signal, previous_handler)
+            chroot.chroot_end(base_dir, host_type, pid, config_dir_path=config_dir_path, auto_umount=auto_umount, umount=umount, umount_backend=mount_backend)
+    finally:
+        registry.close()
+    return sorted(results, key=lambda result: result.index)
+
+@plac.annotations(
+    base_dir="The base directory of the chroot",
+    commands_file=("A file containing the commands to run, one per line, `-` means stdin", "option"),
+    workers=("The number of commands to run concurrently", "option", None, int),
+    host_type=(chroot.__docstring_host_type__, "option"),
+    shell=("The shell to run the commands with (as `shell -c command`)", "option"),
+    config_dir_path=(chroot.__docstring_config_dir_path__, "option"),
+    mount=("The mount binary to use", "option"),
+    kldload=("The kldload binary to use", "option"),
+    mount_backend=(chroot.__docstring_mount_backend__, "option", None, str, chroot.mount_backends),
+    chroot_binary=("The chroot binary to use", "option"),
+    umount=("The umount binary to use", "option"),
+    auto_umount=("Unmount the mounts of `base_dir` and `host_type` after the batch if no other session of them is running", "flag"),
+    debug=(chroot.__docstring_debug__, "flag"),
+)
+def chroot_batch(base_dir, commands_file="-", workers=workers_default, host_type=chroot.host_type_default, shell=shell_default, config_dir_path=chroot.config_dir_path_default, mount=chroot.mount_default, kldload=chroot.kldload_default, mount_backend=chroot.mount_backend_default, chroot_binary=chroot.chroot_default, umount=chroot.umount_default, auto_umount=False, debug=False):
+    """Runs the commands in `commands_file` in the chroot `base_dir` (see `run_commands`) and prints the returncode and duration of every command to stderr afterwards. Returns `0` if all commands succeeded and `1` otherwise."""
+    if debug is True:
+        logger.setLevel(logging.DEBUG)
+        ch.setLevel(logging.DEBUG)
+    commands_file_obj = sys.stdin if commands_file == "-" else open(commands_file, "r")
+    try:
+        results = run_commands(base_dir, read_commands(commands_file_obj), workers=workers, host_type=host_type, shell=shell, config_dir_path=config_dir_path, mount=mount, kldload=kldload, mount_backend=mount_backend, chroot_binary=chroot_binary, umount=umount, auto_umount=auto_umount)
+    finally:
+        if commands_file_obj is not sys.stdin:
+            commands_file_obj.close()
+    for result in results:
+        logger.info("command %d '%s' returned %d after %.3f s" % (result.index, result.command, result.returncode, result.duration, ))
+    failed_count = len([result for result in results if result.returncode != 0])
+    logger.info("%d of %d commands failed" % (failed_count, len(results), ))
+    return 0 if failed_count == 0 else 1
+
+def main():
+    """entry point for setuptools"""
+    sys.exit(plac.call(chroot_batch))
+
+if __name__ == "__main__":
+    main()
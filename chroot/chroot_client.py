@@ -0,0 +1,197 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_client.py` is a thin client which asks the supervisor (see `chroot_supervisor.py`) to start a chroot session on its standard input, output and error which are passed over the socket. It deliberately only imports modules which are cheap to load and falls back to `chroot.chroot` if no supervisor is running.
+
+import errno
+import fcntl
+import getopt
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import termios
+import tty
+import chroot_fdpass
+
+supervisor_socket_path_default = "/var/run/chroot_supervisor.sock"
+supervisor_socket_path_env = "CHROOT_SUPERVISOR_SOCKET" # environment variable overriding `supervisor_socket_path_default`
+forwarded_signals = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT]
+response_buffer_size = 4096
+relay_buffer_size = 65536
+usage = "usage: %s [--shell=SHELL] [--host-type=HOST_TYPE] [--socket=SOCKET] base_dir"
+
+def request_session(base_dir, host_type, shell, socket_path=supervisor_socket_path_default):
+    """Asks the supervisor listening on `socket_path` to start a session of `base_dir` and `host_type` with `shell` on the standard input, output and error of the calling process and waits for the session to exit. If the standard input is a terminal the session runs on a pty of the supervisor which is relayed to it (see `relay_pty`). Signals received in the meantime are forwarded to the process group of the session. Returns the returncode of the session. Raises `socket.error` if no supervisor is listening on `socket_path` and `RuntimeError` if the supervisor refused to start the session."""
+    supervisor_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        supervisor_socket.connect(socket_path)
+        request = {"base_dir": os.path.realpath(base_dir), "host_type": host_type, "shell": shell, "environment": dict(os.environ), "tty": os.isatty(sys.stdin.fileno())}
+        request_str = json.dumps(request)+"\n"
+        sent = chroot_fdpass.send_fds(supervisor_socket, request_str, [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()])
+        supervisor_socket.sendall(request_str[sent:])
+        # the pty master of the session is attached to the first response
+        data, fds = chroot_fdpass.recv_fds(supervisor_socket, response_buffer_size, 1)
+        response_str, data = _read_line(supervisor_socket, data)
+        response = json.loads(response_str)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        pid = response["pid"]
+        def forward_signal(signum, frame):
+            try:
+                # the session is the leader of its process group
+                os.killpg(pid, signum)
+            except OSError:
+                pass
+        for forwarded_signal in forwarded_signals:
+            signal.signal(forwarded_signal, forward_signal)
+        if len(fds) > 0:
+            try:
+                data = relay_pty(fds[0], supervisor_socket, data)
+            finally:
+                os.close(fds[0])
+        line, data = _read_line(supervisor_socket, data)
+        if line is None:
+            raise RuntimeError("supervisor closed the connection before session %d exited" % (pid, ))
+        return json.loads(line)["returncode"]
+    finally:
+        supervisor_socket.close()
+
+def _read_line(supervisor_socket, data):
+    """Reads from `supervisor_socket` until `data` (the data received before) contains a complete line. Returns a tuple of the line (without the line break, `None` if the connection has been closed before) and the data following it."""
+    while "\n" not in data:
+        received = _recv(supervisor_socket)
+        if received == "":
+            return None, data
+        data += received
+    line, data = data.split("\n", 1)
+    return line, data
+
+def _recv(supervisor_socket):
+    """Receives from `supervisor_socket` retrying if interrupted by a forwarded signal."""
+    while True:
+        try:
+            return supervisor_socket.recv(response_buffer_size)
+        except socket.error as ex:
+            if ex.args[0] != errno.EINTR:
+                raise
+
+def _write_all(fd, data):
+    while len(data) > 0:
+        data = data[os.write(fd, data):]
+
+def _copy_window_size(terminal_fd, pty_master_fd):
+    try:
+        fcntl.ioctl(pty_master_fd, termios.TIOCSWINSZ, fcntl.ioctl(terminal_fd, termios.TIOCGWINSZ, "\0"*8))
+    except IOError:
+        pass
+
+def relay_pty(pty_master_fd, supervisor_socket, data):
+    """Relays between the terminal on the standard input and output and the pty master `pty_master_fd` of a session until the session exits, i.e. the supervisor sends the returncode on `supervisor_socket` or the pty is closed. The terminal is switched into raw mode in the meantime, so that special characters like Ctrl-C and Ctrl-Z are interpreted by the pty of the session, and changes of its window size are forwarded. Returns the data received from `supervisor_socket` (the data received before needs to be passed as `data`)."""
+    terminal_fd = sys.stdin.fileno()
+    output_fd = sys.stdout.fileno()
+    terminal_attributes = termios.tcgetattr(terminal_fd)
+    _copy_window_size(terminal_fd, pty_master_fd)
+    signal.signal(signal.SIGWINCH, lambda signum, frame: _copy_window_size(terminal_fd, pty_master_fd))
+    tty.setraw(terminal_fd)
+    try:
+        input_fds = [terminal_fd, pty_master_fd, supervisor_socket.fileno()]
+        while "\n" not in data:
+            try:
+                readable = select.select(input_fds, [], [])[0]
+            except select.error as ex:
+                if ex.args[0] == errno.EINTR:
+                    continue
+                raise
+            if terminal_fd in readable:
+                input_data = os.read(terminal_fd, relay_buffer_size)
+                if input_data == "":
+                    input_fds.remove(terminal_fd)
+                else:
+                    _write_all(pty_master_fd, input_data)
+            if pty_master_fd in readable:
+                if not _relay_output(pty_master_fd, output_fd):
+                    input_fds.remove(pty_master_fd)
+            if supervisor_socket.fileno() in readable:
+                received = _recv(supervisor_socket)
+                if received == "":
+                    break
+                data += received
+        # output written immediately before the session exited
+        while pty_master_fd in input_fds and len(select.select([pty_master_fd], [], [], 0)[0]) > 0:
+            if not _relay_output(pty_master_fd, output_fd):
+                break
+    finally:
+        termios.tcsetattr(terminal_fd, termios.TCSAFLUSH, terminal_attributes)
+        signal.signal(signal.SIGWINCH, signal.SIG_DFL)
+    return data
+
+def _relay_output(pty_master_fd, output_fd):
+    """Copies the available output of the session to `output_fd`. Returns `False` if the pty has been closed (by all processes of the session), `True` otherwise."""
+    try:
+        output_data = os.read(pty_master_fd, relay_buffer_size)
+    except OSError as ex:
+        if ex.errno != errno.EIO:
+            raise
+        output_data = ""
+    if output_data == "":
+        return False
+    _write_all(output_fd, output_data)
+    return True
+
+def main():
+    """entry point for setuptools"""
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["shell=", "host-type=", "socket=", "help"])
+    except getopt.GetoptError as ex:
+        sys.stderr.write("%s\n%s\n" % (str(ex), usage % (sys.argv[0], ), ))
+        return 2
+    options = dict(opts)
+    if "-h" in options or "--help" in options or len(args) != 1:
+        sys.stderr.write("%s\n" % (usage % (sys.argv[0], ), ))
+        return 2
+    base_dir = args[0]
+    # the defaults of `chroot.py` are duplicated in order to avoid importing it
+    shell = options.get("--shell", "/bin/bash")
+    host_type = options.get("--host-type", "debian")
+    socket_path = options.get("--socket", os.getenv(supervisor_socket_path_env, supervisor_socket_path_default))
+    try:
+        return request_session(base_dir, host_type=host_type, shell=shell, socket_path=socket_path)
+    except socket.error as ex:
+        if ex.errno not in [errno.ENOENT, errno.ECONNREFUSED]:
+            raise
+    # no supervisor running -> start the session in this process
+    import chroot
+    chroot.chroot(base_dir, shell=shell, host_type=host_type)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
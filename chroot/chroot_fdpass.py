@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_fdpass.py` passes file descriptors over Unix sockets (`SCM_RIGHTS`). The `socket` module of Python 2 doesn't provide `sendmsg` and `recvmsg`, so they're invoked through `ctypes`. Linux only.
+
+import ctypes
+import chroot_libc
+import os
+import socket
+
+SCM_RIGHTS = 1
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class cmsghdr(ctypes.Structure):
+    _fields_ = [("cmsg_len", ctypes.c_size_t), ("cmsg_level", ctypes.c_int), ("cmsg_type", ctypes.c_int)]
+
+def _cmsg_align(length):
+    alignment = ctypes.sizeof(ctypes.c_size_t)
+    return (length+alignment-1) & ~(alignment-1)
+
+def _cmsg_len(length):
+    return _cmsg_align(ctypes.sizeof(cmsghdr))+length
+
+def _cmsg_space(length):
+    return _cmsg_align(ctypes.sizeof(cmsghdr))+_cmsg_align(length)
+
+_libc = None
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = chroot_libc.load_libc()
+        libc.sendmsg.argtypes = [ctypes.c_int, ctypes.POINTER(msghdr), ctypes.c_int]
+        libc.sendmsg.restype = ctypes.c_ssize_t
+        libc.recvmsg.argtypes = [ctypes.c_int, ctypes.POINTER(msghdr), ctypes.c_int]
+        libc.recvmsg.restype = ctypes.c_ssize_t
+        _libc = libc
+    return _libc
+
+def send_fds(sock, data, fds):
+    """Sends the string `data` over the Unix socket `sock` with the file descriptors `fds` attached to its first byte. Returns the number of bytes sent which might be less than `len(data)` (the rest needs to be sent with `sock.sendall`)."""
+    data_buffer = ctypes.create_string_buffer(data, len(data))
+    iov = iovec(ctypes.cast(data_buffer, ctypes.c_void_p), len(data))
+    fds_size = ctypes.sizeof(ctypes.c_int)*len(fds)
+    control_buffer = ctypes.create_string_buffer(_cmsg_space(fds_size))
+    header = cmsghdr.from_buffer(control_buffer)
+    header.cmsg_len = _cmsg_len(fds_size)
+    header.cmsg_level = socket.SOL_SOCKET
+    header.cmsg_type = SCM_RIGHTS
+    (ctypes.c_int*len(fds)).from_buffer(control_buffer, _cmsg_align(ctypes.sizeof(cmsghdr)))[:] = fds
+    message = msghdr(None, 0, ctypes.pointer(iov), 1, ctypes.cast(control_buffer, ctypes.c_void_p), len(control_buffer), 0)
+    sent = _load_libc().sendmsg(sock.fileno(), ctypes.byref(message), 0)
+    if sent < 0:
+        error = ctypes.get_errno()
+        raise socket.error(error, os.strerror(error))
+    return sent
+
+def recv_fds(sock, bufsize, max_fds):
+    """Receives at most `bufsize` bytes and at most `max_fds` file descriptors from the Unix socket `sock`. Returns a tuple of the received string and the list of received file descriptors (which are owned by the caller)."""
+    data_buffer = ctypes.create_string_buffer(bufsize)
+    iov = iovec(ctypes.cast(data_buffer, ctypes.c_void_p), bufsize)
+    control_buffer = ctypes.create_string_buffer(_cmsg_space(ctypes.sizeof(ctypes.c_int)*max_fds))
+    message = msghdr(None, 0, ctypes.pointer(iov), 1, ctypes.cast(control_buffer, ctypes.c_void_p), len(control_buffer), 0)
+    received = _load_libc().recvmsg(sock.fileno(), ctypes.byref(message), 0)
+    if received < 0:
+        error = ctypes.get_errno()
+        raise socket.error(error, os.strerror(error))
+    fds = []
+    if message.msg_controllen >= ctypes.sizeof(cmsghdr):
+        # only one control message is sent by `send_fds`
+        header = cmsghdr.from_buffer(control_buffer)
+        if header.cmsg_level == socket.SOL_SOCKET and header.cmsg_type == SCM_RIGHTS:
+            fd_count = (header.cmsg_len-_cmsg_len(0))/ctypes.sizeof(ctypes.c_int)
+            fds = list((ctypes.c_int*fd_count).from_buffer(control_buffer, _cmsg_align(ctypes.sizeof(cmsghdr))))
+    return data_buffer.raw[:received], fds
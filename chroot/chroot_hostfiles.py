@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_hostfiles.py` synchronizes files of the host which need to be the same in a chroot (e.g. `/etc/resolv.conf`, `/etc/hosts` or CA bundles) into base directories. Files are only written if their content differs (compared by size and SHA-256 digest, the digests are cached per file as long as it doesn't change) and are replaced atomically by renaming a temporary file, so that running sessions never read a partially written file. `HostFileWatcher` waits for changes of the host files with inotify (Linux only) so that changes can be propagated to running sessions.
+
+import ctypes
+import chroot_libc
+import errno
+import hashlib
+import os
+import select
+import stat
+import struct
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# flags from `<sys/inotify.h>`
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+watch_mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE # editors and tools like `resolvconf` replace files by renaming or recreating them, so the directories are watched instead of the files
+inotify_event_header = struct.Struct("iIII") # wd, mask, cookie, len
+debounce_default = 0.2
+racy_interval = 2.0 # seconds, the digests of files changed more recently aren't cached because another change within the resolution of the file timestamps wouldn't be noticed
+
+_digests = dict() # path -> (`_signature` of the file, SHA-256 digest of its content)
+_digests_lock = threading.Lock()
+
+def inotify_available():
+    """Returns `True` if inotify can be used on this system, `False` otherwise."""
+    try:
+        return hasattr(chroot_libc.load_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+def target_path(base_dir, source_path):
+    """Returns the path of the host file `source_path` in `base_dir`."""
+    return os.path.join(base_dir, source_path.lstrip("/"))
+
+def sync_file(source_path, target_path):
+    """Writes the content and mode of `source_path` to `target_path` unless the regular file `target_path` has the same content already. `target_path` is replaced atomically; a symlink (e.g. to a file which only exists on the host) is replaced instead of being followed. The digests of both files are cached as long as their size, timestamps and inode don't change, so that checking an unchanged file doesn't read it. Returns `True` if `target_path` has been written, `False` if it's up to date or `source_path` doesn't exist."""
+    try:
+        source_stat = os.stat(source_path)
+    except OSError as ex:
+        if ex.errno not in [errno.ENOENT, errno.ENOTDIR]:
+            raise
+        logger.debug("host file '%s' doesn't exist, skipping it" % (source_path, ))
+        return False
+    content = None
+    source_digest = _cached_digest(source_path, source_stat)
+    if source_digest is None:
+        source_stat, content = _read(source_path)
+        source_digest = hashlib.sha256(content).digest()
+        _cache_digest(source_path, source_stat, source_digest)
+    if _has_digest(target_path, source_stat.st_size, source_digest):
+        return False
+    if content is None:
+        source_stat, content = _read(source_path)
+    target_dir_path = os.path.dirname(target_path)
+    if not os.path.isdir(target_dir_path):
+        os.makedirs(target_dir_path)
+    target_fd, target_tmp_path = tempfile.mkstemp(dir=target_dir_path, prefix=".%s." % (os.path.basename(target_path), ))
+    try:
+        with os.fdopen(target_fd, "wb") as target_file:
+            target_file.write(content)
+            os.fchmod(target_file.fileno(), stat.S_IMODE(source_stat.st_mode))
+        os.rename(target_tmp_path, target_path)
+    except:
+        os.remove(target_tmp_path)
+        raise
+    _cache_digest(target_path, os.lstat(target_path), hashlib.sha256(content).digest())
+    logger.debug("synchronized '%s' to '%s'" % (source_path, target_path, ))
+    return True
+
+def _read(path):
+    """Returns the `os.fstat` result and the content of `path`."""
+    with open(path, "rb") as path_file:
+        return os.fstat(path_file.fileno()), path_file.read()
+
+def _signature(path_stat):
+    # the change time can't be set by the owner of a file (unlike the modification time)
+    return (path_stat.st_dev, path_stat.st_ino, path_stat.st_size, path_stat.st_mtime, path_stat.st_ctime)
+
+def _cached_digest(path, path_stat):
+    """Returns the cached digest of `path` if the file hasn't changed since it has been cached according to `path_stat`, `None` otherwise."""
+    with _digests_lock:
+        signature, digest = _digests.get(path, (None, None))
+    if signature != _signature(path_stat):
+        return None
+    return digest
+
+def _cache_digest(path, path_stat, digest):
+    with _digests_lock:
+        if time.time()-max(path_stat.st_mtime, path_stat.st_ctime) < racy_interval:
+            _digests.pop(path, None)
+        else:
+            _digests[path] = (_signature(path_stat), digest)
+
+def _has_digest(path, size, digest):
+    """Returns `True` if `path` is a regular file (not a symlink) of `size` bytes whose content has the SHA-256 digest `digest`, `False` otherwise. The file is only read if the size matches and its digest isn't cached."""
+    try:
+        path_stat = os.lstat(path)
+    except OSError as ex:
+        if ex.errno in [errno.ENOENT, errno.ENOTDIR]:
+            return False
+        raise
+    if not stat.S_ISREG(path_stat.st_mode) or path_stat.st_size != size:
+        return False
+    path_digest = _cached_digest(path, path_stat)
+    if path_digest is None:
+        path_stat0, content = _read(path)
+        if path_stat0.st_ino != path_stat.st_ino:
+            # replaced in the meantime (possibly by a symlink)
+            return False
+        path_digest = hashlib.sha256(content).digest()
+        _cache_digest(path, path_stat0, path_digest)
+    return path_digest == digest
+
+def sync_files(base_dir, source_paths):
+    """Synchronizes the host files `source_paths` into `base_dir` (see `sync_file`). Returns the list of paths in `base_dir` which have been written."""
+    written = []
+    for source_path in source_paths:
+        target_path0 = target_path(base_dir, source_path)
+        if sync_file(source_path, target_path0):
+            written.append(target_path0)
+    return written
+
+class HostFileWatcher(object):
+    """Waits for changes of the host files `source_paths` with inotify. The directories containing the files and the targets of symlinks are watched, so that files which are replaced by renaming or recreating them and changed symlinks are noticed. Raises `OSError` if inotify isn't available."""
+
+    def __init__(self, source_paths):
+        self.source_paths = list(source_paths)
+        libc = chroot_libc.load_libc()
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify isn't available on this system")
+        self._libc = libc
+        self.inotify_fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.inotify_fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, "inotify_init1: %s" % (os.strerror(error), ))
+        self._watch_dirs = dict() # watch descriptor -> watched directory
+        self._watched_paths = dict() # path whose change is reported -> set of source paths affected by it
+        self._add_watches()
+
+    def _add_watches(self):
+        # symlink targets might have changed since the last call; adding a watch for a directory which is watched already returns its watch descriptor
+        self._watched_paths = dict()
+        for source_path in self.source_paths:
+            for path in set([os.path.abspath(source_path), os.path.realpath(source_path)]):
+                self._watched_paths.setdefault(path, set()).add(source_path)
+                dir_path = os.path.dirname(path)
+                if dir_path in self._watch_dirs.values() or not os.path.isdir(dir_path):
+                    continue
+                watch_descriptor = self._libc.inotify_add_watch(self.inotify_fd, dir_path, watch_mask)
+                if watch_descriptor < 0:
+                    error = ctypes.get_errno()
+                    logger.warning("watching '%s' failed: %s" % (dir_path, os.strerror(error), ))
+                    continue
+                self._watch_dirs[watch_descriptor] = dir_path
+
+    def _read_events(self):
+        """Returns the set of source paths affected by the events which can be read without blocking."""
+        changed = set()
+        while True:
+            try:
+                events = os.read(self.inotify_fd, 65536)
+            except OSError as ex:
+                if ex.errno == errno.EAGAIN:
+                    return changed
+                raise
+            offset = 0
+            while offset < len(events):
+                watch_descriptor, mask, cookie, name_length = inotify_event_header.unpack_from(events, offset)
+                name = events[offset+inotify_event_header.size:offset+inotify_event_header.size+name_length].rstrip("\0")
+                offset += inotify_event_header.size+name_length
+                if mask & IN_Q_OVERFLOW:
+                    # events have been lost -> everything might have changed
+                    changed |= set(self.source_paths)
+                elif mask & IN_IGNORED:
+                    # the directory has been removed and needs to be watched again once it's recreated
+                    self._watch_dirs.pop(watch_descriptor, None)
+                elif watch_descriptor in self._watch_dirs:
+                    changed |= self._watched_paths.get(os.path.join(self._watch_dirs[watch_descriptor], name), set())
+
+    def wait(self, timeout=None, debounce=debounce_default):
+        """Waits at most `timeout` seconds (forever if `None`) for changes of the host files and returns the set of changed source paths (which is empty if `timeout` expired). Changes which follow each other within `debounce` seconds (e.g. a file which is written in multiple steps) are reported together."""
+        deadline = None if timeout is None else time.time()+timeout
+        changed = set()
+        while len(changed) == 0:
+            remaining = None if deadline is None else max(0, deadline-time.time())
+            readable = select.select([self.inotify_fd], [], [], remaining)[0]
+            if len(readable) == 0:
+                return changed
+            changed = self._read_events()
+            self._add_watches()
+        while len(select.select([self.inotify_fd], [], [], debounce)[0]) > 0:
+            changed |= self._read_events()
+        self._add_watches()
+        return changed
+
+    def close(self):
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_libc.py` loads the C library for the modules which call its functions through `ctypes` (mount(2), pidfd_open(2), inotify(7), unshare(2), sendmsg(2), clock_gettime(2), etc.). It's loaded once per process; the modules set the argument and result types of the functions they use themselves. `monotonic` provides the monotonic clock which Python 2 lacks.
+
+import ctypes
+import ctypes.util
+import errno
+import sys
+import threading
+import time
+
+# `CLOCK_MONOTONIC` from `<time.h>` differs between systems (on FreeBSD 1 is `CLOCK_VIRTUAL`, the user CPU time of the process), `None` on systems whose value isn't known
+if sys.platform.startswith("linux"):
+    CLOCK_MONOTONIC = 1
+elif sys.platform.startswith("freebsd"):
+    CLOCK_MONOTONIC = 4
+else:
+    CLOCK_MONOTONIC = None
+
+_libc = None
+_libc_lock = threading.Lock()
+
+def load_libc():
+    """Returns the C library loaded with `use_errno`, so that `ctypes.get_errno` returns the `errno` of the last call of one of its functions. Raises `OSError` with `ENOSYS` if it can't be found."""
+    global _libc
+    with _libc_lock:
+        if _libc is None:
+            libc_name = ctypes.util.find_library("c")
+            if libc_name is None:
+                raise OSError(errno.ENOSYS, "libc couldn't be found")
+            _libc = ctypes.CDLL(libc_name, use_errno=True)
+        return _libc
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+_clock_gettime = None
+
+def _load_clock_gettime():
+    global _clock_gettime
+    if _clock_gettime is None:
+        try:
+            if CLOCK_MONOTONIC is None:
+                raise OSError("the value of CLOCK_MONOTONIC isn't known")
+            clock_gettime = load_libc().clock_gettime
+        except (OSError, AttributeError):
+            _clock_gettime = False
+        else:
+            clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+            _clock_gettime = clock_gettime
+    return _clock_gettime
+
+def monotonic():
+    """Returns the value of a clock which isn't affected by changes of the system time in seconds (Python 2 has no `time.monotonic`). Falls back to `time.time` if `clock_gettime` or the value of `CLOCK_MONOTONIC` isn't available."""
+    clock_gettime = _load_clock_gettime()
+    if clock_gettime is False:
+        return time.time()
+    timespec = _timespec()
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+        return time.time()
+    return timespec.tv_sec+timespec.tv_nsec*1e-9
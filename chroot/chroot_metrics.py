@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_metrics.py` records the duration and outcome of the phases of a session's lifecycle (checks, loading of kernel modules, every single mount and unmount, registry access, starting and waiting for the session, termination, etc.) and exports them as JSON lines and in the text format of the Prometheus node exporter's textfile collector. Instrumentation is optional; all functions accept `None` as recorder and don't measure anything then.
+
+import chroot_libc
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_OK = "ok"
+OUTCOME_FAILED = "failed" # the phase reported a failure without raising an exception
+OUTCOME_ERROR = "error" # the phase raised an exception
+metric_prefix = "chroot"
+
+class PhaseTiming(object):
+    """The measurement of one execution of a phase. The code running in the phase can set `outcome` to `OUTCOME_FAILED` if it fails without raising an exception."""
+
+    def __init__(self, phase, target=None):
+        self.phase = phase
+        self.target = target
+        self.time = time.time()
+        self.duration = None
+        self.outcome = OUTCOME_OK
+        self.error = None
+
+class Recorder(object):
+    """Collects `PhaseTiming`s of `command` (the name of the instrumented entry point) and writes them as JSON lines to `jsonl_file_path` and/or as Prometheus metrics to `textfile_path` (either of them can be `None`). Phases can be recorded from multiple threads."""
+
+    def __init__(self, command, jsonl_file_path=None, textfile_path=None):
+        self.command = command
+        self.jsonl_file_path = jsonl_file_path
+        self.textfile_path = textfile_path
+        self.timings = []
+        self._written_count = 0 # number of timings already appended to `jsonl_file_path`
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, phase, target=None):
+        """Measures the execution of the `with` block as `phase` (e.g. applied to the mount target `target`). Exceptions are recorded with outcome `OUTCOME_ERROR` and re-raised."""
+        timing = PhaseTiming(phase, target)
+        start = chroot_libc.monotonic()
+        try:
+            yield timing
+        except BaseException as ex:
+            timing.outcome = OUTCOME_ERROR
+            timing.error = ex.__class__.__name__
+            raise
+        finally:
+            timing.duration = chroot_libc.monotonic()-start
+            with self._lock:
+                self.timings.append(timing)
+
+    def write(self, active_sessions=None):
+        """Appends the timings which haven't been written yet to the JSON lines file and replaces the textfile with metrics of all timings and the number of sessions in `active_sessions` (a dict mapping tuples of base directory and host type to the number of running sessions). Failures to write are logged because metrics mustn't let sessions fail."""
+        with self._lock:
+            timings = list(self.timings)
+        try:
+            if self.jsonl_file_path is not None:
+                self._write_jsonl(timings[self._written_count:])
+                self._written_count = len(timings)
+            if self.textfile_path is not None:
+                self._write_textfile(timings, active_sessions)
+        except (IOError, OSError) as ex:
+            logger.warning("writing metrics failed: %s" % (str(ex), ))
+
+    def _write_jsonl(self, timings):
+        # all lines are written with a single `write` on a file descriptor opened with `O_APPEND`, so that they aren't interleaved with the lines of concurrent invocations (the buffer of a file object might be flushed in several writes)
+        pid = os.getpid()
+        payload = str.join("", [json.dumps({"time": timing.time, "command": self.command, "pid": pid, "phase": timing.phase, "target": timing.target, "duration": timing.duration, "outcome": timing.outcome, "error": timing.error}, sort_keys=True)+"\n" for timing in timings])
+        if len(payload) == 0:
+            return
+        jsonl_fd = os.open(self.jsonl_file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            written = os.write(jsonl_fd, payload)
+            if written < len(payload):
+                raise IOError("short write of %d of %d bytes to '%s'" % (written, len(payload), self.jsonl_file_path, ))
+        finally:
+            os.close(jsonl_fd)
+
+    def _write_textfile(self, timings, active_sessions):
+        lines = []
+        duration_metric = "%s_phase_duration_seconds" % (metric_prefix, )
+        count_metric = "%s_phase_count" % (metric_prefix, )
+        lines.append("# HELP %s Total duration of the phases of the last invocation of %s." % (duration_metric, self.command, ))
+        lines.append("# TYPE %s gauge" % (duration_metric, ))
+        durations = dict() # (phase, target, outcome) -> [total duration, count]
+        for timing in timings:
+            duration = durations.setdefault((timing.phase, timing.target or "", timing.outcome), [0.0, 0])
+            duration[0] += timing.duration
+            duration[1] += 1
+        for (phase, target, outcome), (duration, count) in sorted(durations.items()):
+            lines.append("%s{%s} %r" % (duration_metric, _labels(command=self.command, phase=phase, target=target, outcome=outcome), duration, ))
+        lines.append("# HELP %s Number of executions of the phases of the last invocation of %s." % (count_metric, self.command, ))
+        lines.append("# TYPE %s gauge" % (count_metric, ))
+        for (phase, target, outcome), (duration, count) in sorted(durations.items()):
+            lines.append("%s{%s} %d" % (count_metric, _labels(command=self.command, phase=phase, target=target, outcome=outcome), count, ))
+        if active_sessions is not None:
+            sessions_metric = "%s_active_sessions" % (metric_prefix, )
+            lines.append("# HELP %s Number of running sessions per base directory and host type." % (sessions_metric, ))
+            lines.append("# TYPE %s gauge" % (sessions_metric, ))
+            for (base_dir, host_type), count in sorted(active_sessions.items()):
+                lines.append("%s{%s} %d" % (sessions_metric, _labels(base_dir=base_dir, host_type=host_type), count, ))
+        # the textfile collector might read the file at any time -> replace it atomically
+        textfile_dir_path = os.path.dirname(os.path.abspath(self.textfile_path))
+        textfile_fd, textfile_tmp_path = tempfile.mkstemp(dir=textfile_dir_path, prefix=".%s." % (os.path.basename(self.textfile_path), ))
+        try:
+            with os.fdopen(textfile_fd, "w") as textfile:
+                textfile.write(str.join("\n", lines)+"\n")
+            os.chmod(textfile_tmp_path, 0o644)
+            os.rename(textfile_tmp_path, self.textfile_path)
+        except:
+            os.remove(textfile_tmp_path)
+            raise
+
+def _labels(**labels):
+    """Formats `labels` as Prometheus label set (without braces) sorted by name."""
+    return str.join(",", ['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"), ) for name, value in sorted(labels.items())])
+
+def phase(recorder, phase, target=None):
+    """Returns `recorder.phase(phase, target)` or a context manager which doesn't measure anything if `recorder` is `None`."""
+    if recorder is None:
+        return _unrecorded_phase(phase, target)
+    return recorder.phase(phase, target)
+
+@contextlib.contextmanager
+def _unrecorded_phase(phase, target):
+    yield PhaseTiming(phase, target)
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_mount.py` performs mounts and unmounts in-process with the `mount(2)` and `umount2(2)` system calls of the Linux libc (through `ctypes`) which avoids forking the `mount` and `umount` binaries (and their parsing of `fstab` and `mtab`) for every filesystem. It's only available on Linux; other systems need to use the binaries.
+
+import ctypes
+import chroot_libc
+import os
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+# flags from `<sys/mount.h>`
+MS_RDONLY = 1
+MS_NOSUID = 2
+MS_NODEV = 4
+MS_NOEXEC = 8
+MS_REMOUNT = 32
+MS_NOATIME = 1024
+MS_BIND = 4096
+MS_REC = 16384
+MS_PRIVATE = 1 << 18
+MS_SLAVE = 1 << 19
+MS_SHARED = 1 << 20
+MS_RELATIME = 1 << 21
+MNT_FORCE = 1
+MNT_DETACH = 2
+
+# maps `mount -o` options which are translated into flags to their flag, all other options are passed to the filesystem as data
+option_flags = {
+    "ro": MS_RDONLY,
+    "nosuid": MS_NOSUID,
+    "nodev": MS_NODEV,
+    "noexec": MS_NOEXEC,
+    "remount": MS_REMOUNT,
+    "noatime": MS_NOATIME,
+    "bind": MS_BIND,
+    "rbind": MS_BIND | MS_REC,
+    "private": MS_PRIVATE,
+    "rprivate": MS_PRIVATE | MS_REC,
+    "slave": MS_SLAVE,
+    "rslave": MS_SLAVE | MS_REC,
+    "shared": MS_SHARED,
+    "rshared": MS_SHARED | MS_REC,
+    "relatime": MS_RELATIME,
+}
+# options which are the default and don't need to be passed
+option_noops = set(["rw", "defaults", "suid", "dev", "exec"])
+
+_libc = None
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = chroot_libc.load_libc()
+        libc.mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p]
+        libc.umount2.argtypes = [ctypes.c_char_p, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+def syscall_available():
+    """Returns `True` if `syscall_mount` and `syscall_umount` can be used on this system, i.e. on Linux with a loadable libc, `False` otherwise."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        _load_libc()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+def parse_options(options_str):
+    """Translates a comma-separated `mount -o` option string into a tuple of the `mount(2)` flags and the remaining filesystem specific options (`None` if there're none)."""
+    flags = 0
+    data = []
+    if options_str is not None:
+        for option in options_str.split(","):
+            option = option.strip()
+            if option == "" or option in option_noops:
+                continue
+            if option in option_flags:
+                flags |= option_flags[option]
+            else:
+                data.append(option)
+    if len(data) == 0:
+        return flags, None
+    return flags, str.join(",", data)
+
+def syscall_mount(source, target, fs_type=None, options_str=None, flags=0):
+    """Mounts `source` on `target` with the `mount(2)` system call. `options_str` is interpreted like the `-o` option of `mount` (see `parse_options`), `flags` are added to the flags resulting from it. Raises `OSError` if the system call fails."""
+    options_flags, data = parse_options(options_str)
+    flags |= options_flags
+    logger.debug("mounting '%s' on '%s' with type '%s', flags %d and data '%s'" % (source, target, fs_type, flags, data, ))
+    if _load_libc().mount(source, target, fs_type, flags, data) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, "mounting '%s' on '%s' failed: %s" % (source, target, os.strerror(error), ))
+
+def lazy_syscall_mount(source, target, fs_type=None, options_str=None, flags=0):
+    """Like `syscall_mount`, but creates `target` if it doesn't exist."""
+    try:
+        os.makedirs(target)
+    except OSError:
+        # exists or has been created by a concurrent mount
+        if not os.path.isdir(target):
+            raise
+    syscall_mount(source, target, fs_type=fs_type, options_str=options_str, flags=flags)
+
+def syscall_umount(target, flags=0):
+    """Unmounts `target` with the `umount2(2)` system call. `flags` can be `MNT_DETACH` for a lazy unmount or `MNT_FORCE`. Raises `OSError` if the system call fails."""
+    logger.debug("unmounting '%s' with flags %d" % (target, flags, ))
+    if _load_libc().umount2(target, flags) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, "unmounting '%s' failed: %s" % (target, os.strerror(error), ))
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_mount_plan.py` describes the mounts of a host type as data (a `HostProfile` with a list of `MountSpec`s) and executes them: mounts without dependencies between them are performed concurrently, unmounts are performed in reverse dependency order and a failed mount rolls back the mounts performed before. Additional host profiles can be registered with `register_host_profile` or be described in JSON files (see `load_host_profiles`).
+
+import collections
+import json
+import os
+import sys
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+HOST_TYPE_DEBIAN = "debian"
+HOST_TYPE_FREEBSD = "freebsd"
+workers_default = 4
+host_profile_file_suffix = ".json"
+sync_files_default = ("/etc/resolv.conf", )
+
+# A mount of `source` with filesystem type `fs_type` (`None` for bind mounts) and the `mount -o` options `options` (`None` for none) on `target` which is relative to the base directory. `dependencies` is a tuple of the targets of mounts which need to be performed before. Mounts with a target inside the target of another mount depend on that mount implicitly.
+MountSpec = collections.namedtuple("MountSpec", ["source", "target", "fs_type", "options", "dependencies"])
+
+# The mounts of a host type. `syscall_supported` indicates whether the mounts can be performed with `chroot_mount.py`, `lazy_umount_option` is the `umount` option to fall back to if a mount is busy, `kernel_modules` are loaded with `kldload` before the mounts are performed and `sync_files` are the absolute paths of the host files which are synchronized into the base directory (see `chroot_hostfiles.py`).
+HostProfile = collections.namedtuple("HostProfile", ["name", "mount_specs", "syscall_supported", "lazy_umount_option", "kernel_modules", "sync_files"])
+
+def mount_spec(source, target, fs_type=None, options=None, dependencies=()):
+    """Creates a `MountSpec` with defaults for the optional fields."""
+    return MountSpec(source=source, target=target, fs_type=fs_type, options=options, dependencies=tuple(dependencies))
+
+host_profiles = dict() # name -> HostProfile
+registered_host_profiles = dict() # name -> HostProfile registered with `register_host_profile` (i.e. not loaded from a file), extended by host profile files based on themselves
+
+def register_host_profile(name, mount_specs, syscall_supported=True, lazy_umount_option="-l", kernel_modules=(), sync_files=sync_files_default):
+    """Registers (or replaces) the host profile `name` which can then be used as `host_type`. Raises `ValueError` if the dependencies of `mount_specs` can't be satisfied. Returns the `HostProfile`."""
+    host_profile = _host_profile(name, mount_specs, syscall_supported, lazy_umount_option, kernel_modules, sync_files)
+    host_profiles[name] = host_profile
+    registered_host_profiles[name] = host_profile
+    return host_profile
+
+def _host_profile(name, mount_specs, syscall_supported, lazy_umount_option, kernel_modules, sync_files):
+    """Creates a `HostProfile` and raises `ValueError` if the dependencies of `mount_specs` can't be satisfied."""
+    mount_specs = tuple(mount_specs)
+    mount_levels(mount_specs) # validates the dependencies
+    return HostProfile(name=name, mount_specs=mount_specs, syscall_supported=syscall_supported, lazy_umount_option=lazy_umount_option, kernel_modules=tuple(kernel_modules), sync_files=tuple(sync_files))
+
+def get_host_profile(host_type):
+    """Returns the `HostProfile` registered for `host_type` or raises `ValueError` if there's none."""
+    if host_type not in host_profiles:
+        raise ValueError("host_type '%s' not supported" % (str(host_type), ))
+    return host_profiles[host_type]
+
+def load_host_profiles(directory, skip_invalid=False):
+    """Registers the host profiles described in the `.json` files in `directory` (if it exists). A file contains an object with the keys `name`, `mounts` (a list of objects with the keys of `MountSpec`, only `source` and `target` are mandatory) and optionally `base` (the name of a profile whose mounts are performed before `mounts`), `syscall_supported`, `lazy_umount_option`, `kernel_modules` and `sync_files`. `base` can refer to a profile registered before or described in another file regardless of the order of the files. A profile based on itself extends the profile registered with `register_host_profile` (rather than the one loaded by a previous invocation), so the profiles can be reloaded after the files changed. Raises `ValueError` if a file is invalid unless `skip_invalid` is `True` in which case the file (and the files based on it) are logged and skipped. Returns the list of names of the registered profiles."""
+    if not os.path.isdir(directory):
+        return []
+    descriptions = collections.OrderedDict() # name -> (file path, description)
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(host_profile_file_suffix):
+            continue
+        host_profile_file_path = os.path.join(directory, file_name)
+        try:
+            with open(host_profile_file_path, "r") as host_profile_file:
+                description = json.load(host_profile_file)
+            if not isinstance(description, dict) or "name" not in description:
+                raise ValueError("expected an object with the key 'name'")
+        except (IOError, ValueError) as ex:
+            _invalid_host_profile_file(host_profile_file_path, str(ex), skip_invalid)
+            continue
+        descriptions[str(description["name"])] = (host_profile_file_path, description)
+    loaded = dict() # name -> HostProfile or `None` if the file is invalid
+    def load(name, based_names):
+        """Registers the described profile `name` after its base profile. `based_names` are the names of the profiles which are being loaded and are based on `name`."""
+        if name in loaded:
+            return loaded[name]
+        host_profile_file_path, description = descriptions[name]
+        try:
+            base_profile = None
+            if "base" in description:
+                base_name = str(description["base"])
+                if base_name in based_names:
+                    raise ValueError("base profiles %s are cyclic" % (str.join(", ", ["'%s'" % (based_name, ) for based_name in based_names+(name, )]), ))
+                if base_name != name and base_name in descriptions:
+                    base_profile = load(base_name, based_names+(name, ))
+                    if base_profile is None:
+                        raise ValueError("base profile '%s' is invalid" % (base_name, ))
+                elif base_name == name and base_name in registered_host_profiles:
+                    base_profile = registered_host_profiles[base_name]
+                elif base_name != name and base_name in host_profiles:
+                    base_profile = host_profiles[base_name]
+                else:
+                    raise ValueError("host_type '%s' not supported" % (base_name, ))
+            loaded[name] = _register_described_profile(description, base_profile)
+        except (KeyError, TypeError, ValueError) as ex:
+            loaded[name] = None
+            _invalid_host_profile_file(host_profile_file_path, str(ex), skip_invalid)
+        return loaded[name]
+    for name in descriptions.keys():
+        load(name, ())
+    return [name for name in descriptions.keys() if loaded[name] is not None]
+
+def _register_described_profile(description, base_profile):
+    """Registers the host profile described by the content `description` of a host profile file (see `load_host_profiles`) based on `base_profile` (`None` if it has no base). Returns the `HostProfile`."""
+    mount_specs = [] if base_profile is None else list(base_profile.mount_specs)
+    for mount in description.get("mounts", []):
+        mount_specs.append(mount_spec(str(mount["source"]), str(mount["target"]), fs_type=mount.get("fs_type"), options=mount.get("options"), dependencies=[str(dependency) for dependency in mount.get("dependencies", [])]))
+    host_profile = _host_profile(str(description["name"]), mount_specs,
+        syscall_supported=description.get("syscall_supported", True if base_profile is None else base_profile.syscall_supported),
+        lazy_umount_option=description.get("lazy_umount_option", "-l" if base_profile is None else base_profile.lazy_umount_option),
+        kernel_modules=description.get("kernel_modules", () if base_profile is None else base_profile.kernel_modules),
+        sync_files=[str(sync_file) for sync_file in description.get("sync_files", sync_files_default if base_profile is None else base_profile.sync_files)],
+    )
+    host_profiles[host_profile.name] = host_profile
+    return host_profile
+
+def _invalid_host_profile_file(host_profile_file_path, message, skip_invalid):
+    if not skip_invalid:
+        raise ValueError("invalid host profile file '%s': %s" % (host_profile_file_path, message, ))
+    logger.warning("skipping invalid host profile file '%s': %s" % (host_profile_file_path, message, ))
+
+def _is_inside(target, other_target):
+    return target.startswith(other_target.rstrip("/")+"/")
+
+def mount_levels(mount_specs):
+    """Sorts `mount_specs` topologically by their dependencies. Returns a list of levels (lists of `MountSpec`s) where the mounts of a level only depend on mounts of previous levels and can be performed concurrently. Raises `ValueError` if a dependency doesn't exist or the dependencies are cyclic."""
+    specs_by_target = dict()
+    for spec in mount_specs:
+        if spec.target in specs_by_target:
+            raise ValueError("target '%s' is mounted twice" % (spec.target, ))
+        specs_by_target[spec.target] = spec
+    dependencies = dict()
+    for spec in mount_specs:
+        for dependency in spec.dependencies:
+            if dependency not in specs_by_target:
+                raise ValueError("mount on '%s' depends on '%s' which isn't mounted" % (spec.target, dependency, ))
+        dependencies[spec.target] = set(spec.dependencies) | set([other.target for other in mount_specs if other is not spec and _is_inside(spec.target, other.target)])
+    levels = []
+    done = set()
+    while len(done) < len(mount_specs):
+        # keep the order of `mount_specs` within a level
+        level = [spec for spec in mount_specs if spec.target not in done and dependencies[spec.target] <= done]
+        if len(level) == 0:
+            raise ValueError("dependencies of mounts on %s are cyclic" % (str.join(", ", ["'%s'" % (target, ) for target in sorted(set(specs_by_target.keys())-done)]), ))
+        levels.append(level)
+        done |= set([spec.target for spec in level])
+    return levels
+
+def umount_order(mount_specs):
+    """Returns `mount_specs` in the order in which they need to be unmounted, i.e. the reverse dependency order."""
+    return [spec for level in reversed(mount_levels(mount_specs)) for spec in reversed(level)]
+
+def execute_mounts(base_dir, mount_specs, mount_function, umount_function, is_mounted=None, workers=workers_default):
+    """Performs the mounts of `mount_specs` in `base_dir` level by level (see `mount_levels`) with the mounts of one level performed concurrently by up to `workers` threads. `mount_function` is invoked with `base_dir` and a `MountSpec` and `umount_function` with the absolute target of a mount which needs to be rolled back. Mounts for which `is_mounted` (invoked with the absolute target) returns `True` are skipped. If a mount fails all mounts performed before are unmounted in reverse order and the exception of the failed mount is raised. Returns the list of absolute targets which have been mounted."""
+    mounted = []
+    for level in mount_levels(mount_specs):
+        pending = [spec for spec in level if is_mounted is None or not is_mounted(os.path.join(base_dir, spec.target))]
+        for spec in level:
+            if spec not in pending:
+                logger.debug("'%s' is already mounted" % (os.path.join(base_dir, spec.target), ))
+        if len(pending) == 0:
+            continue
+        if len(pending) == 1 or workers <= 1:
+            results = [_execute_mount(base_dir, spec, mount_function) for spec in pending]
+        else:
+            results = parallel_map(lambda spec: _execute_mount(base_dir, spec, mount_function), pending, workers)
+        error = None
+        for spec, result in zip(pending, results):
+            if result is None:
+                mounted.append(os.path.join(base_dir, spec.target))
+            elif error is None:
+                error = result
+        if error is not None:
+            logger.warning("mounting in base directory '%s' failed, rolling back %d mounts" % (base_dir, len(mounted), ))
+            for target in reversed(mounted):
+                try:
+                    umount_function(target)
+                except Exception as ex:
+                    logger.warning("rolling back mount on '%s' failed: %s" % (target, str(ex), ))
+            raise error[0], error[1], error[2]
+    return mounted
+
+def parallel_map(function, items, workers):
+    """Returns the list of the results of `function` applied to every element of `items` computed by up to `workers` threads. If `function` raises an exception for an element, the exception is raised after all threads finished. Unlike `multiprocessing.pool.ThreadPool` (whose `join` waits up to 100 ms for its worker handler thread in Python 2) the threads are joined as soon as the last element is done."""
+    items = list(items)
+    results = [None]*len(items)
+    errors = []
+    lock = threading.Lock()
+    next_index = [0]
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if index >= len(items):
+                return
+            try:
+                results[index] = function(items[index])
+            except Exception:
+                with lock:
+                    errors.append(sys.exc_info())
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(workers, len(items))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return results
+
+def _execute_mount(base_dir, spec, mount_function):
+    """Returns `None` if `mount_function` succeeded and the `sys.exc_info` of its exception otherwise (so that the failure of a mount performed in a worker thread can be re-raised with its traceback)."""
+    try:
+        mount_function(base_dir, spec)
+    except Exception:
+        return sys.exc_info()
+    return None
+
+register_host_profile(HOST_TYPE_DEBIAN, [
+    mount_spec("/proc", "proc", "proc"),
+    mount_spec("/sys", "sys", "sysfs"),
+    mount_spec("/dev", "dev", options="bind"),
+    mount_spec("/dev/pts", "dev/pts", "devpts", dependencies=["dev"]),
+])
+register_host_profile(HOST_TYPE_FREEBSD, [
+    mount_spec("none", "proc", "linprocfs"),
+    mount_spec("devfs", "dev", "devfs"),
+        # both `mount_nullfs /dev/ dev_mount_target` and `mount -t devfs none dev_mount_target` succeed, but don't initialize /dev/urandom (when read with cat; ssl fails as well)
+    mount_spec("none", "sys", "linsysfs"),
+    mount_spec("none", "lib/init/rw", "tmpfs"),
+], syscall_supported=False, lazy_umount_option="-f", kernel_modules=["fdescfs", "linprocfs", "linsysfs", "tmpfs"])
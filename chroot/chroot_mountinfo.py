@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_mountinfo.py` provides an index of the mounts of the current mount namespace parsed from `/proc/self/mountinfo` and keyed by mount point. The index is cached and only refreshed if the kernel signals a change of the mount table with `POLLPRI`/`POLLERR` on the open file. `/proc/self/mountinfo` only exists on Linux, on other systems `get_index` returns `None`.
+
+import collections
+import os
+import re
+import select
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+mountinfo_path_default = "/proc/self/mountinfo"
+
+MountInfoEntry = collections.namedtuple("MountInfoEntry", ["mount_id", "parent_id", "major_minor", "root", "mount_point", "mount_options", "fs_type", "source", "super_options"])
+
+_octal_escape_pattern = re.compile(r"\\([0-7]{3})")
+
+def _unescape(field):
+    """Reverts the octal escaping of space, tab, newline and backslash in fields of `/proc/self/mountinfo`."""
+    return _octal_escape_pattern.sub(lambda match: chr(int(match.group(1), 8)), field)
+
+def parse_line(line):
+    """Parses a line of `/proc/self/mountinfo` into a `MountInfoEntry` (see proc(5) for the format)."""
+    fields = line.split()
+    separator_index = fields.index("-", 6) # the optional fields are terminated by `-`
+    return MountInfoEntry(mount_id=int(fields[0]),
+        parent_id=int(fields[1]),
+        major_minor=fields[2],
+        root=_unescape(fields[3]),
+        mount_point=_unescape(fields[4]),
+        mount_options=fields[5],
+        fs_type=fields[separator_index+1],
+        source=_unescape(fields[separator_index+2]),
+        super_options=fields[separator_index+3] if len(fields) > separator_index+3 else "",
+    )
+
+def _stack(entries):
+    """Orders the `MountInfoEntry`s of the filesystems mounted on the same mount point from the bottom to the top. A filesystem mounted onto another one has the one below as parent; mount ids are reused and say nothing about the order."""
+    if len(entries) == 1:
+        return entries
+    mount_ids = set([entry.mount_id for entry in entries])
+    children = dict([(entry.parent_id, entry) for entry in entries if entry.parent_id != entry.mount_id])
+    stack = []
+    # usually there's only one bottom filesystem, but the mount points of filesystems in different subtrees can coincide
+    for entry in sorted([entry for entry in entries if entry.parent_id not in mount_ids or entry.parent_id == entry.mount_id], key=lambda entry: entry.mount_id):
+        while entry is not None and entry not in stack:
+            stack.append(entry)
+            entry = children.get(entry.mount_id)
+    return stack
+
+class MountInfoIndex(object):
+    """A cached index of the mounts in `/proc/self/mountinfo` keyed by mount point. If several filesystems are stacked on the same mount point, the index contains the top one (i.e. the visible one). Thread-safe."""
+
+    def __init__(self, mountinfo_path=mountinfo_path_default):
+        self.mountinfo_path = mountinfo_path
+        self.mountinfo_file = open(mountinfo_path, "r")
+        self.poller = select.poll()
+        self.poller.register(self.mountinfo_file.fileno(), select.POLLPRI | select.POLLERR)
+        self.lock = threading.Lock()
+        self.entries = dict() # mount_id -> MountInfoEntry
+        self.mounts = dict() # mount point -> MountInfoEntry
+        self.stacks = dict() # mount point -> list of MountInfoEntry from the bottom to the top
+        self._lines = dict() # mount_id -> line, used to parse changed lines only
+        self._read()
+
+    def _read(self):
+        self.mountinfo_file.seek(0)
+        lines = dict()
+        for line in self.mountinfo_file.read().splitlines():
+            mount_id = int(line.split(" ", 1)[0])
+            lines[mount_id] = line
+        entries = dict()
+        for mount_id, line in lines.items():
+            if self._lines.get(mount_id) == line:
+                entries[mount_id] = self.entries[mount_id]
+            else:
+                entries[mount_id] = parse_line(line)
+        stacks = dict()
+        for entry in entries.values():
+            stacks.setdefault(entry.mount_point, []).append(entry)
+        for mount_point, stack in stacks.items():
+            stacks[mount_point] = _stack(stack)
+        self._lines = lines
+        self.entries = entries
+        self.stacks = stacks
+        self.mounts = dict([(mount_point, stack[-1]) for mount_point, stack in stacks.items()])
+
+    def refresh(self, force=False):
+        """Re-reads the mount table if the kernel signalled a change since the last read or if `force` is `True`. Returns `True` if the mount table has been re-read."""
+        with self.lock:
+            if not force and len(self.poller.poll(0)) == 0:
+                return False
+            logger.debug("re-reading '%s'" % (self.mountinfo_path, ))
+            self._read()
+            return True
+
+    def lookup(self, mount_point):
+        """Returns the `MountInfoEntry` of the (top) filesystem mounted on `mount_point` or `None` if nothing's mounted there."""
+        self.refresh()
+        return self.mounts.get(os.path.realpath(mount_point))
+
+    def is_mounted(self, mount_point):
+        """Returns `True` if a filesystem is mounted on `mount_point`, `False` otherwise."""
+        return self.lookup(mount_point) is not None
+
+    def mounts_under(self, base_dir):
+        """Returns the list of mount points in `base_dir` (including `base_dir` itself) in the order in which they need to be unmounted, i.e. nested mount points first. A mount point is contained once for every filesystem stacked on it because every unmount only removes the top one."""
+        self.refresh()
+        base_dir = os.path.realpath(base_dir)
+        prefix = base_dir.rstrip("/")+"/"
+        mount_points = [mount_point for mount_point, stack in self.stacks.items() if mount_point == base_dir or mount_point.startswith(prefix) for _ in stack]
+        return sorted(mount_points, key=lambda mount_point: (-mount_point.count("/"), mount_point))
+
+    def close(self):
+        self.mountinfo_file.close()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """Returns the process-wide `MountInfoIndex` of `/proc/self/mountinfo` or `None` if it doesn't exist (e.g. on FreeBSD)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if not os.path.exists(mountinfo_path_default):
+                return None
+            _index = MountInfoIndex(mountinfo_path_default)
+        return _index
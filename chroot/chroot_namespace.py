@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_namespace.py` starts sessions in a private mount namespace (and optionally a private PID namespace) of Linux with `unshare(2)`. Mounts performed in the namespace are invisible to the host and freed by the kernel when the last process of the namespace exits, so such sessions neither need to be counted in the registry nor unmounted.
+
+import ctypes
+import chroot_libc
+import errno
+import fcntl
+import os
+import signal
+import sys
+import chroot_mount
+import logging
+
+logger = logging.getLogger(__name__)
+
+# flags from `<sched.h>`
+CLONE_NEWNS = 0x00020000
+CLONE_NEWPID = 0x20000000
+setup_failed_returncode = 127
+
+def namespace_available():
+    """Returns `True` if sessions can be started in namespaces on this system, i.e. on Linux with `unshare` in libc, `False` otherwise. Creating namespaces requires root privileges nevertheless."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        return hasattr(chroot_libc.load_libc(), "unshare")
+    except OSError:
+        return False
+
+def unshare(flags):
+    """Moves the calling process into the new namespaces denoted by the `CLONE_*` `flags`. Raises `OSError` if the system call fails."""
+    if chroot_libc.load_libc().unshare(flags) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, "unshare failed: %s" % (os.strerror(error), ))
+
+def start_session(args, setup_function=None, pid_namespace=False):
+    """Forks a process which enters a new mount namespace (and a new PID namespace in which the session has pid 1 if `pid_namespace` is `True`), makes all mounts in it private, so that nothing propagates to the host, invokes `setup_function` (e.g. to perform mounts) and executes `args`. Returns the pid of the forked process after `args` has been executed (wait for it with `wait_session`). Raises `OSError` if the namespace couldn't be set up or `args` couldn't be executed."""
+    # the child reports failures before `exec` through a pipe which is closed by a successful `exec` (like `subprocess` does)
+    error_read_fd, error_write_fd = os.pipe()
+    fcntl.fcntl(error_write_fd, fcntl.F_SETFD, fcntl.fcntl(error_write_fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(error_read_fd)
+            unshare(CLONE_NEWNS | (CLONE_NEWPID if pid_namespace else 0))
+            chroot_mount.syscall_mount("none", "/", flags=chroot_mount.MS_REC | chroot_mount.MS_PRIVATE)
+            if pid_namespace:
+                # only children of the process which called `unshare` are in the new PID namespace
+                session_pid = os.fork()
+                if session_pid != 0:
+                    # the signals need to be forwarded before `start_session` returns the pid
+                    _forward_signals(session_pid)
+                    os.close(error_write_fd)
+                    os._exit(_wait_forwarded_session(session_pid))
+            if setup_function is not None:
+                setup_function()
+            os.execvp(args[0], args)
+        except BaseException as ex:
+            try:
+                os.write(error_write_fd, "%s: %s" % (ex.__class__.__name__, str(ex), ))
+            finally:
+                os._exit(setup_failed_returncode)
+    os.close(error_write_fd)
+    try:
+        error_message = ""
+        while True:
+            data = os.read(error_read_fd, 4096)
+            if data == "":
+                break
+            error_message += data
+    finally:
+        os.close(error_read_fd)
+    if error_message != "":
+        wait_session(pid)
+        raise OSError(errno.ECHILD, "starting session in mount namespace failed: %s" % (error_message, ))
+    return pid
+
+def _forward_signals(session_pid):
+    """Forwards termination signals received by the process between the caller of `start_session` and a session in a PID namespace to `session_pid`."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the session receives it from the terminal itself
+    for signum in [signal.SIGTERM, signal.SIGHUP]:
+        signal.signal(signum, lambda signum, frame: os.kill(session_pid, signum))
+
+def _wait_forwarded_session(session_pid):
+    """Waits for `session_pid` in the process between the caller of `start_session` and a session in a PID namespace and returns the exit code to exit with."""
+    returncode = wait_session(session_pid)
+    if returncode < 0:
+        return 128-returncode
+    return returncode
+
+def wait_session(pid):
+    """Waits for the session `pid` started with `start_session` and returns its returncode (negative if it was terminated by a signal like `subprocess.Popen.returncode`)."""
+    while True:
+        try:
+            _, status = os.waitpid(pid, 0)
+            break
+        except OSError as ex:
+            if ex.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_overlay.py` creates copy-on-write roots for single sessions: an overlayfs with the (unchanged) base directory as lower directory and a tmpfs as upper directory. The mounts of the base directory (`/proc`, `/sys`, `/dev`, etc.) are bind mounted into the session root, so that they're shared by all sessions. A session root costs a few mounts instead of a copy of the base directory and is discarded when the session ends or kept as a snapshot of the changes. Linux only.
+
+import os
+import sys
+import tempfile
+import logging
+import subprocess as sp
+import chroot_mount
+import chroot_mountinfo
+
+logger = logging.getLogger(__name__)
+
+overlay_dir_default = "/var/run/chroot_overlays"
+upper_dir_name = "upper"
+work_dir_name = "work"
+root_dir_name = "root"
+
+def create_session_root(base_dir, shared_mount_targets, overlay_dir=overlay_dir_default, tmpfs_options=None):
+    """Creates a session root in a new directory in `overlay_dir` which shows the content of `base_dir` and stores changes in a tmpfs mounted with `tmpfs_options` (e.g. `size=1g`). `shared_mount_targets` are the mount points in `base_dir` (in the order in which they've been mounted) which are bind mounted to the same place in the session root. Returns the path of the directory of the session which needs to be passed to `remove_session_root`; the root to chroot into is `session_root_path(session_dir)`. Mounts which have been performed are undone if a later one fails."""
+    if not chroot_mount.syscall_available():
+        raise RuntimeError("overlay session roots are only supported on Linux")
+    if not os.path.isdir(overlay_dir):
+        os.makedirs(overlay_dir)
+    session_dir = tempfile.mkdtemp(prefix="%s-" % (os.path.basename(base_dir.rstrip("/")), ), dir=overlay_dir)
+    mounted = []
+    try:
+        chroot_mount.syscall_mount("tmpfs", session_dir, "tmpfs", options_str=tmpfs_options)
+        mounted.append(session_dir)
+        upper_dir = os.path.join(session_dir, upper_dir_name)
+        work_dir = os.path.join(session_dir, work_dir_name)
+        root_dir = os.path.join(session_dir, root_dir_name)
+        for directory in [upper_dir, work_dir, root_dir]:
+            os.mkdir(directory)
+        # the root of the overlay has the owner and mode of the upper directory
+        base_dir_stat = os.stat(base_dir)
+        os.chown(upper_dir, base_dir_stat.st_uid, base_dir_stat.st_gid)
+        os.chmod(upper_dir, base_dir_stat.st_mode & 0o7777)
+        chroot_mount.syscall_mount("overlay", root_dir, "overlay", options_str="lowerdir=%s,upperdir=%s,workdir=%s" % (base_dir, upper_dir, work_dir, ))
+        mounted.append(root_dir)
+        for shared_mount_target in shared_mount_targets:
+            target = os.path.join(root_dir, os.path.relpath(shared_mount_target, base_dir))
+            chroot_mount.lazy_syscall_mount(shared_mount_target, target, options_str="bind")
+            mounted.append(target)
+    except:
+        error = sys.exc_info()
+        # a failing rollback mustn't hide the original error
+        for target in reversed(mounted):
+            try:
+                chroot_mount.syscall_umount(target, chroot_mount.MNT_DETACH)
+            except OSError as ex:
+                logger.warning("unmounting '%s' failed: %s" % (target, str(ex), ))
+        try:
+            os.rmdir(session_dir)
+        except OSError as ex:
+            logger.warning("removing session directory '%s' failed: %s" % (session_dir, str(ex), ))
+        raise error[0], error[1], error[2]
+    logger.debug("created session root '%s' for base directory '%s'" % (root_dir, base_dir, ))
+    return session_dir
+
+def session_root_path(session_dir):
+    """Returns the directory to chroot into for the session directory `session_dir` returned by `create_session_root`."""
+    return os.path.join(session_dir, root_dir_name)
+
+def remove_session_root(session_dir, snapshot_dir=None):
+    """Unmounts and removes the session directory `session_dir` created by `create_session_root`. If `snapshot_dir` isn't `None`, the changes of the session (the upper directory of the overlay including whiteouts of deleted files) are copied into a new directory in `snapshot_dir` before and its path is returned, otherwise `None` is returned."""
+    snapshot_path = None
+    if snapshot_dir is not None:
+        if not os.path.isdir(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        snapshot_path = os.path.join(snapshot_dir, os.path.basename(session_dir))
+        # `cp -a` preserves the character devices which mark deleted files in contrast to `shutil.copytree`
+        sp.check_call(["cp", "-a", os.path.join(session_dir, upper_dir_name), snapshot_path])
+        logger.info("saved changes of session root '%s' in '%s'" % (session_dir, snapshot_path, ))
+    # the mounts are detached lazily because they might still be used by processes started in the session; the bind mounts (and mounts made in the session) come first
+    for mount_point in chroot_mountinfo.get_index().mounts_under(session_dir):
+        chroot_mount.syscall_umount(mount_point, chroot_mount.MNT_DETACH)
+    os.rmdir(session_dir)
+    return snapshot_path
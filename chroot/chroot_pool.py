@@ -0,0 +1,197 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_pool.py` keeps a pool of prepared session roots of a base directory, so that sessions started with `chroot.chroot --pooled` don't wait for loading kernel modules, setting up the mounts and creating their overlay root. The session roots are overlay roots (see `chroot_overlay.py`) whose mounts are shared with the base directory; they're stored in the registry, so that every root is handed out only once to concurrent invocations, and are refilled in the background. Roots which haven't been used for `ttl` seconds are replaced because changes of the base directory made after the overlay has been mounted aren't guaranteed to be visible in it. Linux only.
+
+import plac
+import os
+import signal
+import threading
+import time
+import logging
+import chroot
+import chroot_registry
+import chroot_overlay
+import chroot_mount_plan
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+
+size_default = 4
+ttl_default = 3600.0
+refill_interval_default = 1.0
+
+class SessionRootPool(object):
+    """Keeps `size` prepared session roots of `base_dir` and `host_type` in the registry in `config_dir_path`. `overlay_dir` and `tmpfs_options` are passed to `chroot_overlay.create_session_root` and the remaining parameters to `chroot.ensure_mounts`. Roots older than `ttl` seconds are evicted and the pool is refilled every `refill_interval` seconds by `run` or a background thread started with `start`."""
+
+    def __init__(self, base_dir, size=size_default, ttl=ttl_default, host_type=chroot.host_type_default, config_dir_path=chroot.config_dir_path_default, overlay_dir=chroot_overlay.overlay_dir_default, tmpfs_options=None, mount=chroot.mount_default, mount_backend=chroot.mount_backend_default, umount=chroot.umount_default, refill_interval=refill_interval_default):
+        self.base_dir = os.path.realpath(base_dir)
+        self.size = size
+        self.ttl = ttl
+        self.host_type = host_type
+        self.config_dir_path = config_dir_path
+        self.overlay_dir = overlay_dir
+        self.tmpfs_options = tmpfs_options
+        self.mount = mount
+        self.mount_backend = mount_backend
+        self.umount = umount
+        self.refill_interval = refill_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def refill(self):
+        """Creates session roots until the pool contains `size` of them and sets up the mounts of the base directory if necessary. The base directory is only locked while one root is created, so that handouts aren't delayed by the whole refill. Returns the number of created roots."""
+        registry = chroot_registry.open_registry(self.config_dir_path)
+        created_count = 0
+        try:
+            while True:
+                with chroot_registry.base_dir_lock(self.config_dir_path, self.base_dir, self.host_type):
+                    if len(registry.list_pool_entries(base_dir=self.base_dir, host_type=self.host_type)) >= self.size:
+                        break
+                    chroot.ensure_mounts(registry, self.base_dir, self.host_type, mount=self.mount, mount_backend=self.mount_backend, umount=self.umount)
+                    session_dir = chroot_overlay.create_session_root(self.base_dir, list(reversed(chroot._mount_targets(self.base_dir, self.host_type))), overlay_dir=self.overlay_dir, tmpfs_options=self.tmpfs_options)
+                    registry.add_pool_entry(self.base_dir, self.host_type, session_dir)
+                created_count += 1
+        finally:
+            registry.close()
+        if created_count > 0:
+            logger.info("added %d session roots to the pool of base directory '%s' and host type '%s'" % (created_count, self.base_dir, self.host_type, ))
+        return created_count
+
+    def evict(self, now=None):
+        """Removes the session roots which have been in the pool for longer than `ttl` seconds at `now` (the current time if `None`). Returns the number of removed roots."""
+        if now is None:
+            now = time.time()
+        registry = chroot_registry.open_registry(self.config_dir_path)
+        evicted = []
+        try:
+            for base_dir, host_type, session_dir, created in registry.list_pool_entries(base_dir=self.base_dir, host_type=self.host_type):
+                # a root which has been handed out since it's been listed isn't touched
+                if created+self.ttl <= now and registry.remove_pool_entry(session_dir):
+                    evicted.append(session_dir)
+        finally:
+            registry.close()
+        for session_dir in evicted:
+            chroot._discard_session_root(session_dir)
+        if len(evicted) > 0:
+            logger.info("evicted %d idle session roots from the pool of base directory '%s' and host type '%s'" % (len(evicted), self.base_dir, self.host_type, ))
+        return len(evicted)
+
+    def drain(self):
+        """Removes all session roots from the pool and unmounts the mounts of the base directory unless sessions of it are running (like the automatic unmount of `chroot.chroot_end`). Returns `True` if the mounts have been unmounted, `False` otherwise."""
+        registry = chroot_registry.open_registry(self.config_dir_path)
+        try:
+            with chroot_registry.base_dir_lock(self.config_dir_path, self.base_dir, self.host_type):
+                for base_dir, host_type, session_dir, created in registry.list_pool_entries(base_dir=self.base_dir, host_type=self.host_type):
+                    if registry.remove_pool_entry(session_dir):
+                        chroot._discard_session_root(session_dir)
+                registry.reap(base_dir=self.base_dir, host_type=self.host_type)
+                if len(registry.lookup(self.base_dir, self.host_type)) > 0:
+                    logger.info("sessions of base directory '%s' and host type '%s' are running, keeping mounts" % (self.base_dir, self.host_type, ))
+                    return False
+                success = chroot._umount_host_type(self.base_dir, self.host_type, umount=self.umount, umount_backend=self.mount_backend)
+                if success:
+                    registry.unregister_mounts(self.base_dir, self.host_type)
+                return success
+        finally:
+            registry.close()
+
+    def run(self):
+        """Evicts and refills until `stop` is invoked. Failures are logged and retried after `refill_interval` seconds."""
+        while not self._stop_event.is_set():
+            try:
+                self.evict()
+                self.refill()
+            except Exception as ex:
+                logger.error("maintaining the pool of base directory '%s' and host type '%s' failed: %s" % (self.base_dir, self.host_type, str(ex), ))
+            self._stop_event.wait(self.refill_interval)
+
+    def start(self):
+        """Runs `run` in a background thread."""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name="pool %s" % (self.base_dir, ))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, drain=True):
+        """Stops `run` and waits for the background thread if there's one. Drains the pool if `drain` is `True` (see `drain`)."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if drain is True:
+            self.drain()
+
+@plac.annotations(
+    base_dir="The base directory of the chroot",
+    size=("The number of prepared session roots to keep", "option", None, int),
+    ttl=("The number of seconds after which an unused session root is replaced", "option", None, float),
+    host_type=(chroot.__docstring_host_type__, "option"),
+    config_dir_path=(chroot.__docstring_config_dir_path__, "option"),
+    overlay_dir=("The directory in which the session roots are created", "option"),
+    overlay_tmpfs_options=("The mount options of the tmpfs storing the changes of a session, e.g. `size=1g`", "option"),
+    mount=("The mount binary to use", "option"),
+    kldload=("The kldload binary to use", "option"),
+    mount_backend=(chroot.__docstring_mount_backend__, "option", None, str, chroot.mount_backends),
+    umount=("The umount binary to use", "option"),
+    refill_interval=("The number of seconds between checks whether the pool needs to be refilled", "option", None, float),
+    debug=(chroot.__docstring_debug__, "flag"),
+)
+def chroot_pool(base_dir, size=size_default, ttl=ttl_default, host_type=chroot.host_type_default, config_dir_path=chroot.config_dir_path_default, overlay_dir=chroot_overlay.overlay_dir_default, overlay_tmpfs_options=None, mount=chroot.mount_default, kldload=chroot.kldload_default, mount_backend=chroot.mount_backend_default, umount=chroot.umount_default, refill_interval=refill_interval_default, debug=False):
+    """Keeps the pool of `base_dir` filled in the foreground until it's interrupted or terminated and drains it afterwards. Sessions take roots from it with `chroot.chroot --pooled`."""
+    if debug is True:
+        logger.setLevel(logging.DEBUG)
+        ch.setLevel(logging.DEBUG)
+    if not os.path.isdir(base_dir):
+        raise ValueError("base directory '%s' doesn't exist" % (base_dir, ))
+    chroot.load_host_profiles(config_dir_path)
+    host_profile = chroot_mount_plan.get_host_profile(host_type)
+    if not host_profile.syscall_supported:
+        raise ValueError("overlay sessions aren't supported for host type '%s'" % (host_type, ))
+    chroot.load_kernel_modules(host_profile, kldload=kldload)
+    pool = SessionRootPool(base_dir, size=size, ttl=ttl, host_type=host_type, config_dir_path=config_dir_path, overlay_dir=overlay_dir, tmpfs_options=overlay_tmpfs_options, mount=mount, mount_backend=mount_backend, umount=umount, refill_interval=refill_interval)
+    # `SIGTERM` (e.g. sent by the init system) drains the pool like an interrupt
+    signal.signal(signal.SIGTERM, lambda signum, frame: pool.stop(drain=False))
+    logger.info("keeping %d session roots of base directory '%s' and host type '%s' ready" % (size, pool.base_dir, host_type, ))
+    try:
+        pool.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+def main():
+    """entry point for setuptools"""
+    plac.call(chroot_pool)
+
+if __name__ == "__main__":
+    main()
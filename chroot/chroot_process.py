@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_process.py` contains helpers to wait for and terminate processes which aren't children of the calling process (e.g. chroot sessions started by another invocation of `chroot.py`). Waiting uses pidfds (Linux 5.3 and newer) where available and falls back to polling.
+
+import ctypes
+import chroot_libc
+import errno
+import os
+import select
+import signal
+import logging
+
+logger = logging.getLogger(__name__)
+
+SYS_pidfd_open = 434 # the same on all architectures since Linux 5.3
+poll_interval_default = 0.05
+term_timeout_default = 5.0
+
+def pid_exists(pid):
+    """Returns `True` if a process with `pid` exists, `False` otherwise."""
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        # EPERM means that the process exists, but belongs to another user
+        return ex.errno == errno.EPERM
+    return True
+
+def process_start_time(pid):
+    """Returns the start time of the process `pid` in clock ticks since boot (field `starttime` of `/proc/<pid>/stat`) which identifies a process together with its pid regardless of pid reuse. Returns `None` if the process doesn't exist or `/proc` isn't available."""
+    try:
+        with open("/proc/%d/stat" % (pid, ), "r") as stat_file:
+            stat = stat_file.read()
+    except (IOError, OSError):
+        return None
+    # the command name in parentheses might contain spaces and parentheses -> split after the last `)`; `starttime` is the 22nd field and the 20th after the command name
+    return int(stat[stat.rindex(")")+2:].split()[19])
+
+def session_alive(pid, start_time):
+    """Returns `True` if the process `pid` exists and has been started at `start_time` (as returned by `process_start_time`), `False` otherwise. If `start_time` is `None` (e.g. for sessions registered by older versions or on systems without `/proc`) only the existence of `pid` is checked."""
+    if start_time is None:
+        return pid_exists(pid)
+    return process_start_time(pid) == start_time
+
+def pidfd_open(pid):
+    """Returns a file descriptor referring to the process `pid` which becomes readable when the process exits. Returns `None` if pidfds aren't supported. Raises `OSError` with `ESRCH` if the process doesn't exist."""
+    try:
+        libc = chroot_libc.load_libc()
+    except OSError:
+        return None
+    fd = libc.syscall(SYS_pidfd_open, ctypes.c_int(pid), ctypes.c_uint(0))
+    if fd < 0:
+        error = ctypes.get_errno()
+        if error == errno.ESRCH:
+            raise OSError(error, os.strerror(error))
+        return None
+    return fd
+
+def wait_pids(pids, deadline, poll_interval=poll_interval_default):
+    """Waits until all processes in `pids` have exited or the `chroot_libc.monotonic` value `deadline` is reached. Returns the set of pids of processes which are still running."""
+    remaining = set()
+    pidfds = dict() # fd -> pid
+    poller = select.poll()
+    try:
+        for pid in pids:
+            try:
+                fd = pidfd_open(pid)
+            except OSError:
+                continue
+            remaining.add(pid)
+            if fd is not None:
+                pidfds[fd] = pid
+                poller.register(fd, select.POLLIN)
+        polled_pids = remaining-set(pidfds.values())
+        while len(remaining) > 0:
+            now = chroot_libc.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline-now
+            if len(polled_pids) > 0:
+                timeout = min(timeout, poll_interval)
+            for fd, _ in poller.poll(timeout*1000):
+                remaining.discard(pidfds[fd])
+                poller.unregister(fd)
+            for pid in list(polled_pids):
+                if not pid_exists(pid):
+                    polled_pids.discard(pid)
+                    remaining.discard(pid)
+    finally:
+        for fd in pidfds:
+            os.close(fd)
+    return remaining
+
+def kill_pids(pids, sig):
+    """Sends `sig` to all processes in `pids` ignoring processes which no longer exist. Processes which lead a process group (e.g. sessions started by `chroot_supervisor.py` or the commands of `chroot_batch.py`) receive it together with the other processes of their group, so that the processes started in the session don't survive it."""
+    for pid in pids:
+        try:
+            if os.getpgid(pid) == pid:
+                os.killpg(pid, sig)
+            else:
+                os.kill(pid, sig)
+        except OSError:
+            # a real error occured or the process no longer exists (an entry doesn't denote a running chroot session, but the possibility that the mounts need to be unmounted), but in case this is called at system shutdown we really need to kill
+            pass
+
+def terminate_pids(pids, deadline, term_timeout=term_timeout_default):
+    """Sends `SIGTERM` to all processes in `pids`, waits at most `term_timeout` seconds (and not beyond `deadline`) for them to exit and sends `SIGKILL` to the remaining ones which are then waited for until `deadline` (a `chroot_libc.monotonic` value). Returns the set of pids of processes which are still running."""
+    kill_pids(pids, signal.SIGTERM)
+    remaining = wait_pids(pids, min(deadline, chroot_libc.monotonic()+term_timeout))
+    if len(remaining) > 0:
+        logger.info("killing processes %s which didn't terminate after SIGTERM" % (str.join(", ", [str(pid) for pid in sorted(remaining)]), ))
+        kill_pids(remaining, signal.SIGKILL)
+        remaining = wait_pids(remaining, deadline)
+    return remaining
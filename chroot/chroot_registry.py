@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_registry.py` stores the references to started chroot sessions (`base_dir`, `host_type`, the pid of the chroot shell and its start time which allows to detect pid reuse) in a SQLite database in WAL mode. Additionally it stores for which base directories and host types mounts have been set up, so that they can be freed after the last session exited, the prepared session roots of the pool of `chroot_pool.py` and the overlay roots of running sessions. The `(base_dir, host_type, pid)` primary key serves as index for lookups, concurrent writers are serialized by SQLite's locking (transactions are kept short, slow actions like mounting are serialized per base directory by `base_dir_lock`) and the count file of older versions (a `dumbdbm` database wrapped in a `shelve.Shelf`) is migrated on first access.
+
+import sqlite3
+import time
+import contextlib
+import chroot_process
+import os
+import errno
+import fcntl
+import hashlib
+import logging
+import shelve
+import dumbdbm
+
+logger = logging.getLogger(__name__)
+
+registry_file_name = "chroot_registry.sqlite"
+legacy_count_file_name = "chroot_count.dta"
+legacy_count_file_suffixes = [".dat", ".dir", ".bak"]
+migrated_suffix = ".migrated"
+busy_timeout_default = 60.0 # seconds to wait for the lock held by another writer
+lock_dir_name = "locks"
+
+class SessionRegistry(object):
+    """A persistent map of `base_dir` and `host_type` to the pids of the chroot sessions started for them which can be accessed by multiple processes concurrently. Every public method runs in its own transaction unless it's invoked inside `locked`."""
+
+    def __init__(self, registry_file_path, timeout=busy_timeout_default, check_same_thread=True):
+        """`check_same_thread` can be set to `False` if the registry is used by multiple threads which synchronize the access themselves."""
+        self.registry_file_path = registry_file_path
+        # `isolation_level=None` disables the implicit transaction handling of the `sqlite3` module in favour of explicit `BEGIN IMMEDIATE` which acquires the write lock at the start of a transaction and thus avoids deadlocks between concurrent read-modify-write transactions
+        self.connection = sqlite3.connect(registry_file_path, timeout=timeout, isolation_level=None, check_same_thread=check_same_thread)
+        self.connection.text_factory = str
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sessions (base_dir TEXT NOT NULL, host_type TEXT NOT NULL, pid INTEGER NOT NULL, start_time INTEGER, PRIMARY KEY (base_dir, host_type, pid)) WITHOUT ROWID")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(sessions)")]
+        if "start_time" not in columns:
+            # registry created by an earlier version, entries without start time are only checked for existence of their pid
+            self.connection.execute("ALTER TABLE sessions ADD COLUMN start_time INTEGER")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS mounts (base_dir TEXT NOT NULL, host_type TEXT NOT NULL, PRIMARY KEY (base_dir, host_type)) WITHOUT ROWID")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pool (session_dir TEXT NOT NULL PRIMARY KEY, base_dir TEXT NOT NULL, host_type TEXT NOT NULL, created REAL NOT NULL) WITHOUT ROWID")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS overlays (session_dir TEXT NOT NULL PRIMARY KEY, base_dir TEXT NOT NULL, host_type TEXT NOT NULL, pid INTEGER NOT NULL, start_time INTEGER) WITHOUT ROWID")
+        self._lock_depth = 0
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Holds the write lock of the registry for the duration of the `with` block so that a sequence of reads and writes is atomic with respect to other processes. Every other process using the registry waits for the lock, so slow actions (e.g. mounting) should be protected by `base_dir_lock` instead. All changes in the block are committed at its end or rolled back if it raises an exception. Can be nested."""
+        if self._lock_depth == 0:
+            self.connection.execute("BEGIN IMMEDIATE")
+        self._lock_depth += 1
+        try:
+            yield self
+        except:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                self.connection.execute("ROLLBACK")
+            raise
+        self._lock_depth -= 1
+        if self._lock_depth == 0:
+            self.connection.execute("COMMIT")
+
+    def _transaction(self, statements):
+        """Executes the `(sql, parameters)` pairs in `statements` in one write transaction and returns the total number of affected rows."""
+        cursor = self.connection.cursor()
+        rowcount = 0
+        with self.locked():
+            for sql, parameters in statements:
+                cursor.execute(sql, parameters)
+                rowcount += max(cursor.rowcount, 0)
+        return rowcount
+
+    def _select(self, table, columns, base_dir, host_type, order):
+        """Returns the list of tuples of `columns` (an SQL column list) of the rows of `table` ordered by `order` (an SQL `ORDER BY` list), optionally restricted to `base_dir` and/or `host_type` (`None` means all)."""
+        conditions = []
+        parameters = []
+        if base_dir is not None:
+            conditions.append("base_dir = ?")
+            parameters.append(base_dir)
+        if host_type is not None:
+            conditions.append("host_type = ?")
+            parameters.append(host_type)
+        sql = "SELECT %s FROM %s" % (columns, table, )
+        if len(conditions) > 0:
+            sql += " WHERE %s" % (str.join(" AND ", conditions), )
+        return [tuple(row) for row in self.connection.execute("%s ORDER BY %s" % (sql, order, ), parameters)]
+
+    def register(self, base_dir, host_type, pid, start_time=None):
+        """Adds the session with `pid` started at `start_time` (see `chroot_process.process_start_time`) for `base_dir` and `host_type`. Registering a session with a pid which is already registered for `base_dir` and `host_type` replaces the existing entry (the pid has been reused)."""
+        logger.debug("registering pid %d with start time %s for base directory '%s' and host type '%s'" % (pid, start_time, base_dir, host_type, ))
+        self._transaction([("INSERT OR REPLACE INTO sessions (base_dir, host_type, pid, start_time) VALUES (?, ?, ?, ?)", (base_dir, host_type, pid, start_time, ))])
+
+    def unregister(self, base_dir, host_type, pid=None):
+        """Removes the session with `pid` for `base_dir` and `host_type` or all sessions for `base_dir` and `host_type` if `pid` is `None`. Returns the number of removed sessions."""
+        if pid is None:
+            statement = ("DELETE FROM sessions WHERE base_dir = ? AND host_type = ?", (base_dir, host_type, ))
+        else:
+            statement = ("DELETE FROM sessions WHERE base_dir = ? AND host_type = ? AND pid = ?", (base_dir, host_type, pid, ))
+        return self._transaction([statement])
+
+    def lookup(self, base_dir, host_type):
+        """Returns the set of pids of the sessions currently registered for `base_dir` and `host_type` which is empty if there're none."""
+        cursor = self.connection.execute("SELECT pid FROM sessions WHERE base_dir = ? AND host_type = ?", (base_dir, host_type, ))
+        return set([row[0] for row in cursor])
+
+    def list_sessions(self, base_dir=None, host_type=None):
+        """Returns a list of `(base_dir, host_type, pid, start_time)` tuples of all registered sessions, optionally restricted to `base_dir` and/or `host_type` (`None` means all)."""
+        return self._select("sessions", "base_dir, host_type, pid, start_time", base_dir, host_type, "base_dir, host_type, pid")
+
+    def reap(self, base_dir=None, host_type=None):
+        """Removes all sessions whose process is no longer running (see `chroot_process.session_alive`), optionally restricted to `base_dir` and/or `host_type` (`None` means all), in one transaction. Returns the number of removed sessions."""
+        statements = []
+        with self.locked():
+            for base_dir0, host_type0, pid, start_time in self.list_sessions(base_dir=base_dir, host_type=host_type):
+                if not chroot_process.session_alive(pid, start_time):
+                    statements.append(("DELETE FROM sessions WHERE base_dir = ? AND host_type = ? AND pid = ?", (base_dir0, host_type0, pid, )))
+            reaped_count = self._transaction(statements)
+        if reaped_count > 0:
+            logger.debug("removed %d sessions which are no longer running" % (reaped_count, ))
+        return reaped_count
+
+    def register_mounts(self, base_dir, host_type):
+        """Records that the mounts of `host_type` are set up in `base_dir`. Registering them twice has no effect."""
+        self._transaction([("INSERT OR IGNORE INTO mounts (base_dir, host_type) VALUES (?, ?)", (base_dir, host_type, ))])
+
+    def unregister_mounts(self, base_dir, host_type):
+        """Records that the mounts of `host_type` in `base_dir` have been freed."""
+        self._transaction([("DELETE FROM mounts WHERE base_dir = ? AND host_type = ?", (base_dir, host_type, ))])
+
+    def list_mounts(self, base_dir=None, host_type=None):
+        """Returns a list of `(base_dir, host_type)` tuples for which mounts are set up, optionally restricted to `base_dir` and/or `host_type` (`None` means all)."""
+        return self._select("mounts", "base_dir, host_type", base_dir, host_type, "base_dir, host_type")
+
+    def add_pool_entry(self, base_dir, host_type, session_dir, created=None):
+        """Adds the prepared session root `session_dir` (see `chroot_overlay.create_session_root`) of `base_dir` and `host_type` created at `created` (the current time if `None`) to the pool."""
+        if created is None:
+            created = time.time()
+        self._transaction([("INSERT OR REPLACE INTO pool (session_dir, base_dir, host_type, created) VALUES (?, ?, ?, ?)", (session_dir, base_dir, host_type, created, ))])
+
+    def take_pool_entry(self, base_dir, host_type):
+        """Removes the oldest prepared session root of `base_dir` and `host_type` from the pool and returns it or returns `None` if the pool is empty. Every session root is handed out only once regardless of concurrent invocations."""
+        with self.locked():
+            row = self.connection.execute("SELECT session_dir FROM pool WHERE base_dir = ? AND host_type = ? ORDER BY created, session_dir LIMIT 1", (base_dir, host_type, )).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("DELETE FROM pool WHERE session_dir = ?", (row[0], ))
+        return row[0]
+
+    def remove_pool_entry(self, session_dir):
+        """Removes `session_dir` from the pool. Returns `True` if it has been in the pool (i.e. it hasn't been handed out in the meantime), `False` otherwise."""
+        return self._transaction([("DELETE FROM pool WHERE session_dir = ?", (session_dir, ))]) > 0
+
+    def list_pool_entries(self, base_dir=None, host_type=None):
+        """Returns a list of `(base_dir, host_type, session_dir, created)` tuples of the prepared session roots in the pool ordered by their creation, optionally restricted to `base_dir` and/or `host_type` (`None` means all)."""
+        return self._select("pool", "base_dir, host_type, session_dir, created", base_dir, host_type, "created, session_dir")
+
+    def add_overlay_root(self, base_dir, host_type, session_dir, pid, start_time=None):
+        """Records that the session with `pid` started at `start_time` of `base_dir` and `host_type` runs in the overlay root `session_dir` (see `chroot_overlay.create_session_root`), so that it can be removed by `chroot.chroot_shutdown` if the session doesn't remove it itself."""
+        self._transaction([("INSERT OR REPLACE INTO overlays (session_dir, base_dir, host_type, pid, start_time) VALUES (?, ?, ?, ?, ?)", (session_dir, base_dir, host_type, pid, start_time, ))])
+
+    def remove_overlay_root(self, session_dir):
+        """Removes the overlay root `session_dir` from the registry. Returns `True` if it has been registered (i.e. nobody else claimed its removal in the meantime), `False` otherwise."""
+        return self._transaction([("DELETE FROM overlays WHERE session_dir = ?", (session_dir, ))]) > 0
+
+    def list_overlay_roots(self, base_dir=None, host_type=None):
+        """Returns a list of `(base_dir, host_type, session_dir, pid, start_time)` tuples of the overlay roots of sessions, optionally restricted to `base_dir` and/or `host_type` (`None` means all)."""
+        return self._select("overlays", "base_dir, host_type, session_dir, pid, start_time", base_dir, host_type, "base_dir, host_type, session_dir")
+
+    def migrate_count_file(self, count_file_path):
+        """Imports all entries of the `dumbdbm`/`shelve` count file `count_file_path` written by older versions and renames its files with the suffix `migrated_suffix` afterwards so that they're not imported again. Does nothing if the count file doesn't exist. Returns the number of imported sessions."""
+        if not os.path.exists(count_file_path+".dir") and not os.path.exists(count_file_path+".dat"):
+            return 0
+        logger.info("migrating count file '%s' to registry '%s'" % (count_file_path, self.registry_file_path, ))
+        count_file_dbm = dumbdbm.open(count_file_path, "r")
+        count_file_dict = shelve.Shelf(dict=count_file_dbm)
+        statements = []
+        try:
+            for base_dir, base_dir_dict in count_file_dict.items():
+                if not isinstance(base_dir_dict, dict):
+                    logger.warning("skipping malformed entry for base directory '%s' in count file '%s'" % (base_dir, count_file_path, ))
+                    continue
+                for host_type, pids in base_dir_dict.items():
+                    for pid in pids:
+                        statements.append(("INSERT OR IGNORE INTO sessions (base_dir, host_type, pid) VALUES (?, ?, ?)", (base_dir, host_type, int(pid), )))
+        finally:
+            count_file_dict.close()
+        # entries are inserted with `INSERT OR IGNORE` -> importing twice in case of a concurrent migration is harmless
+        imported_count = self._transaction(statements)
+        for suffix in [""]+legacy_count_file_suffixes:
+            path = count_file_path+suffix
+            if os.path.exists(path):
+                os.rename(path, path+migrated_suffix)
+        return imported_count
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+@contextlib.contextmanager
+def base_dir_lock(config_dir_path, base_dir, host_type):
+    """Holds an exclusive lock of `base_dir` and `host_type` for the duration of the `with` block which serializes setting up and freeing their mounts between processes and threads without blocking other base directories or the registry. The lock is a `flock` of a file in `config_dir_path` and is released by the kernel if the process dies. Can't be nested for the same base directory and host type."""
+    lock_dir_path = os.path.join(config_dir_path, lock_dir_name)
+    try:
+        os.mkdir(lock_dir_path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+    # the base directory can't be used as file name
+    lock_file_path = os.path.join(lock_dir_path, "%s.lock" % (hashlib.sha1("%s\0%s" % (base_dir, host_type, )).hexdigest(), ))
+    lock_fd = os.open(lock_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(lock_fd)
+
+def open_registry(config_dir_path, check_same_thread=True):
+    """Opens the registry in `config_dir_path` (creating it if it doesn't exist) and migrates a count file of an older version in `config_dir_path` into it."""
+    registry = SessionRegistry(os.path.join(config_dir_path, registry_file_name), check_same_thread=check_same_thread)
+    registry.migrate_count_file(os.path.join(config_dir_path, legacy_count_file_name))
+    return registry
@@ -31,16 +31,23 @@
 
 import chroot
 import plac
+import sys
 
 @plac.annotations(
     base_dir=("Only shutdown all resources based on `base_dir`. Effect depends on `host_type`. `None` means all.", "positional"), 
     host_type=("Only shutdown all resources with `host_type`. Effect depends on `base_dir`. `None` means all.", "positional"), 
     config_dir_path=(chroot.__docstring_config_dir_path__, "option"), 
     umount=("The umount binary to use", "option"), 
+    umount_backend=(chroot.__docstring_mount_backend__, "option", None, str, chroot.mount_backends), 
+    timeout=(chroot.__docstring_shutdown_timeout__, "option", None, float), 
+    term_timeout=(chroot.__docstring_term_timeout__, "option", None, float), 
+    workers=(chroot.__docstring_shutdown_workers__, "option", None, int), 
+    metrics_file=(chroot.__docstring_metrics_file__, "option"), 
+    metrics_textfile=(chroot.__docstring_metrics_textfile__, "option"), 
     debug=(chroot.__docstring_debug__, "flag"), 
 )    
-def chroot_shutdown(base_dir=None, host_type=None, config_dir_path=chroot.config_dir_path_default, umount=chroot.umount_default, debug=False):
-    chroot.chroot_shutdown(config_dir_path=config_dir_path, umount=umount, debug=debug)
+def chroot_shutdown(base_dir=None, host_type=None, config_dir_path=chroot.config_dir_path_default, umount=chroot.umount_default, umount_backend=chroot.mount_backend_default, timeout=chroot.shutdown_timeout_default, term_timeout=chroot.chroot_process.term_timeout_default, workers=chroot.shutdown_workers_default, metrics_file=None, metrics_textfile=None, debug=False):
+    return chroot.chroot_shutdown(base_dir=base_dir, host_type=host_type, config_dir_path=config_dir_path, umount=umount, umount_backend=umount_backend, timeout=timeout, term_timeout=term_timeout, workers=workers, metrics_file=metrics_file, metrics_textfile=metrics_textfile, debug=debug)
 
 if __name__ == "__main__":
-    plac.call(chroot_shutdown)
+    sys.exit(plac.call(chroot_shutdown))
@@ -0,0 +1,294 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# `chroot_supervisor.py` is a daemon which starts chroot sessions on request of `chroot_client.py` over a Unix socket. It owns the session registry and the mounts of all base directories it serves and keeps the running sessions per base directory and host type in memory so that starting a session on a base directory with running sessions neither reads the registry nor inspects the mount table. Sessions started by the supervisor are registered in the registry as well, so that `chroot.chroot` and `chroot.chroot_shutdown` keep working alongside it.
+
+import plac
+import os
+import pty
+import fcntl
+import termios
+import json
+import socket
+import struct
+import threading
+import logging
+import subprocess as sp
+import SocketServer
+import chroot
+import chroot_registry
+import chroot_process
+import chroot_client
+import chroot_fdpass
+import chroot_mount_plan
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+
+SO_PEERCRED = getattr(socket, "SO_PEERCRED", 17) # not exported by the `socket` module of Python 2
+socket_mode = 0o0600
+request_buffer_size = 65536
+
+def _set_close_on_exec():
+    """Runs in the forked session process before the chroot is executed: marks the inherited file descriptors except the standard input, output and error close-on-exec. Used instead of `close_fds=True` which makes Python 2 close every possible file descriptor up to `SC_OPEN_MAX` (thousands of system calls per session) while only the open ones are listed in `/proc/self/fd`."""
+    try:
+        fds = [int(fd_name) for fd_name in os.listdir("/proc/self/fd")]
+    except OSError:
+        fds = range(3, sp.MAXFD)
+    for fd in fds:
+        if fd > 2:
+            try:
+                fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+            except (IOError, OSError):
+                # not open (e.g. the descriptor used to list `/proc/self/fd`)
+                pass
+
+def _start_session():
+    """Runs in the forked session process before the chroot is executed: starts a new session without controlling terminal."""
+    os.setsid()
+    _set_close_on_exec()
+
+def _set_controlling_terminal():
+    """Runs in the forked session process before the chroot is executed: makes the pty on its standard input the controlling terminal of a new session, so that job control and the signals of the terminal (e.g. Ctrl-C and Ctrl-Z) reach the foreground process group in the session."""
+    os.setsid()
+    fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+    _set_close_on_exec()
+
+def peer_credentials(connection):
+    """Returns the pid, uid and gid of the process connected to the Unix socket `connection`."""
+    return struct.unpack("3i", connection.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize("3i")))
+
+class SupervisorRequestHandler(SocketServer.StreamRequestHandler):
+    """Handles one session request of `chroot_client.request_session` and keeps the connection open until the session exits."""
+
+    def handle(self):
+        client_pid, client_uid, _ = peer_credentials(self.connection)
+        stdio = []
+        try:
+            # the client's standard input, output and error are attached to the first byte of the request
+            request_str, stdio = chroot_fdpass.recv_fds(self.connection, request_buffer_size, 3)
+            while not request_str.endswith("\n"):
+                data = self.connection.recv(request_buffer_size)
+                if data == "":
+                    raise ValueError("incomplete request")
+                request_str += data
+            if client_uid != os.getuid():
+                raise ValueError("uid %d isn't allowed to start sessions" % (client_uid, ))
+            if len(stdio) != 3:
+                raise ValueError("expected standard input, output and error, but received %d file descriptors" % (len(stdio), ))
+            request = json.loads(request_str)
+            base_dir, host_type, session_process, pty_master_fd = self.server.start_session(client_pid, stdio, request["base_dir"], request["host_type"], request["shell"], request.get("environment"), tty=request.get("tty", False))
+        except Exception as ex:
+            logger.warning("refusing request of process %d: %s" % (client_pid, str(ex), ))
+            self.wfile.write(json.dumps({"error": str(ex)})+"\n")
+            return
+        finally:
+            for fd in stdio:
+                os.close(fd)
+        response_str = json.dumps({"pid": session_process.pid, "tty": pty_master_fd is not None})+"\n"
+        if pty_master_fd is None:
+            self.wfile.write(response_str)
+            self.wfile.flush()
+        else:
+            # the client relays between its terminal and the session's pty
+            try:
+                sent = chroot_fdpass.send_fds(self.connection, response_str, [pty_master_fd])
+                self.connection.sendall(response_str[sent:])
+            finally:
+                os.close(pty_master_fd)
+        session_process.wait()
+        self.server.end_session(base_dir, host_type, session_process.pid)
+        try:
+            self.wfile.write(json.dumps({"returncode": session_process.returncode})+"\n")
+        except socket.error:
+            # the client exited before the session
+            pass
+
+class Supervisor(SocketServer.ThreadingUnixStreamServer):
+    """Listens on `socket_path` and starts sessions in a thread per request. The running sessions per `(base_dir, host_type)` are kept in memory; they and the registry in `config_dir_path` are shared by all threads and protected by `self.lock` which is only held for these short updates. Setting up and freeing the mounts of a base directory and host type is serialized by a lock per base directory and host type (in addition to `chroot_registry.base_dir_lock`) and uses a registry connection of its own, so that it doesn't block the requests for other base directories."""
+    daemon_threads = True
+
+    def __init__(self, socket_path, config_dir_path=chroot.config_dir_path_default, mount=chroot.mount_default, kldload=chroot.kldload_default, chroot_binary=chroot.chroot_default, mount_backend=chroot.mount_backend_default, umount=chroot.umount_default, auto_umount=False):
+        if os.path.exists(socket_path):
+            # left over from a supervisor which didn't exit cleanly
+            os.remove(socket_path)
+        SocketServer.ThreadingUnixStreamServer.__init__(self, socket_path, SupervisorRequestHandler)
+        os.chmod(socket_path, socket_mode)
+        if not os.path.exists(config_dir_path):
+            os.makedirs(config_dir_path)
+        self.socket_path = socket_path
+        self.config_dir_path = config_dir_path
+        self.mount = mount
+        self.kldload = kldload
+        self.chroot_binary = chroot_binary
+        self.mount_backend = mount_backend
+        self.umount = umount
+        self.auto_umount = auto_umount
+        self.lock = threading.Lock()
+        self.registry = chroot_registry.open_registry(config_dir_path, check_same_thread=False)
+        self.sessions = dict() # (base_dir, host_type) -> set of pids of running sessions
+        self.starting = dict() # (base_dir, host_type) -> number of sessions being started, their mounts mustn't be freed
+        self.mounted = set() # (base_dir, host_type) whose mounts have been set up since they had no running session
+        self.mount_locks = dict() # (base_dir, host_type) -> lock held while setting up or freeing their mounts
+        self.kernel_modules_loaded = set() # host types
+        chroot.load_host_profiles(config_dir_path)
+
+    def _mount_lock(self, key):
+        with self.lock:
+            return self.mount_locks.setdefault(key, threading.Lock())
+
+    def start_session(self, client_pid, stdio, base_dir, host_type, shell, environment=None, tty=False):
+        """Sets up the mounts of `base_dir` and `host_type` unless the supervisor set them up for running sessions or sessions being started and starts `shell` in the chroot on the file descriptors `stdio` (the standard input, output and error passed by the process `client_pid`) in a new process session. If `tty` is `True` the session runs on a new pty instead which is its controlling terminal and whose master is relayed by the client (the client's terminal can't become the controlling terminal of the session without being taken away from the client's session). Returns a tuple of the real path of `base_dir`, `host_type`, the `subprocess.Popen` of the session and the file descriptor of the pty master (`None` if `tty` is `False`) which is owned by the caller."""
+        base_dir = os.path.realpath(base_dir)
+        if not os.path.isdir(base_dir):
+            raise ValueError("base directory '%s' doesn't exist" % (base_dir, ))
+        host_profile = chroot_mount_plan.get_host_profile(host_type)
+        key = (base_dir, host_type)
+        with self.lock:
+            # keeps `end_session` from freeing the mounts until the session is registered
+            self.starting[key] = self.starting.get(key, 0)+1
+            mounts_set_up = key in self.mounted
+        try:
+            if not mounts_set_up:
+                self._set_up_mounts(key, host_profile)
+            pty_master_fd = None
+            if tty is True:
+                pty_master_fd, pty_slave_fd = pty.openpty()
+                try:
+                    session_process = sp.Popen([self.chroot_binary, base_dir, shell], stdin=pty_slave_fd, stdout=pty_slave_fd, stderr=pty_slave_fd, env=environment, preexec_fn=_set_controlling_terminal)
+                except:
+                    os.close(pty_master_fd)
+                    raise
+                finally:
+                    os.close(pty_slave_fd)
+            else:
+                session_process = sp.Popen([self.chroot_binary, base_dir, shell], stdin=stdio[0], stdout=stdio[1], stderr=stdio[2], env=environment, preexec_fn=_start_session)
+            start_time = chroot_process.process_start_time(session_process.pid)
+            with self.lock:
+                self.registry.register(base_dir, host_type, session_process.pid, start_time=start_time)
+                self.sessions.setdefault(key, set()).add(session_process.pid)
+        finally:
+            with self.lock:
+                self.starting[key] -= 1
+                if self._idle(key):
+                    self.mounted.discard(key)
+        logger.info("started session %d of base directory '%s' and host type '%s' for process %d" % (session_process.pid, base_dir, host_type, client_pid, ))
+        return base_dir, host_type, session_process, pty_master_fd
+
+    def _set_up_mounts(self, key, host_profile):
+        """Sets up the mounts of `key` unless a concurrent request did so while waiting for the mount lock. `key` is kept in `self.mounted` while sessions of it are running or being started, i.e. `end_session` doesn't free the mounts in the meantime."""
+        base_dir, host_type = key
+        with self._mount_lock(key), chroot_registry.base_dir_lock(self.config_dir_path, base_dir, host_type):
+            with self.lock:
+                if key in self.mounted:
+                    return
+            if host_type not in self.kernel_modules_loaded:
+                chroot.load_kernel_modules(host_profile, kldload=self.kldload)
+                self.kernel_modules_loaded.add(host_type)
+            registry = chroot_registry.SessionRegistry(self.registry.registry_file_path)
+            try:
+                chroot.ensure_mounts(registry, base_dir, host_type, mount=self.mount, mount_backend=self.mount_backend, umount=self.umount)
+            finally:
+                registry.close()
+            with self.lock:
+                self.mounted.add(key)
+
+    def _idle(self, key):
+        """Returns `True` if no session of `key` is running or being started. Must be called with `self.lock` held."""
+        return len(self.sessions.get(key, [])) == 0 and self.starting.get(key, 0) == 0
+
+    def end_session(self, base_dir, host_type, pid):
+        """Removes the exited session `pid` and unmounts the mounts of `base_dir` and `host_type` if `auto_umount` is set and no session of them is running anymore (see `chroot.chroot_end`)."""
+        key = (base_dir, host_type)
+        with self.lock:
+            self.sessions[key].discard(pid)
+            self.registry.unregister(base_dir, host_type, pid)
+            idle = self._idle(key)
+            if idle:
+                # the mounts are checked again by the next session
+                self.mounted.discard(key)
+        logger.info("session %d of base directory '%s' and host type '%s' exited" % (pid, base_dir, host_type, ))
+        if not self.auto_umount or not idle:
+            return
+        with self._mount_lock(key), chroot_registry.base_dir_lock(self.config_dir_path, base_dir, host_type):
+            with self.lock:
+                # a session which is started from now on isn't in `self.mounted`, waits for the mount lock and sets up the mounts again
+                if not self._idle(key):
+                    return
+            registry = chroot_registry.SessionRegistry(self.registry.registry_file_path)
+            try:
+                registry.reap(base_dir=base_dir, host_type=host_type)
+                # sessions started with `chroot.chroot` outside the supervisor use the mounts as well
+                if len(registry.lookup(base_dir, host_type)) == 0 and len(registry.list_pool_entries(base_dir=base_dir, host_type=host_type)) == 0:
+                    logger.info("last session of base directory '%s' and host type '%s' exited, freeing mounts" % (base_dir, host_type, ))
+                    if chroot._umount_host_type(base_dir, host_type, umount=self.umount, umount_backend=self.mount_backend):
+                        registry.unregister_mounts(base_dir, host_type)
+            finally:
+                registry.close()
+
+    def server_close(self):
+        SocketServer.ThreadingUnixStreamServer.server_close(self)
+        self.registry.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+@plac.annotations(
+    socket_path=("The Unix socket to listen on for session requests", "option"),
+    config_dir_path=(chroot.__docstring_config_dir_path__, "option"),
+    mount=("The mount binary to use", "option"),
+    kldload=("The kldload binary to use", "option"),
+    chroot_binary=("The chroot binary to use", "option"),
+    mount_backend=(chroot.__docstring_mount_backend__, "option", None, str, chroot.mount_backends),
+    umount=("The umount binary to use", "option"),
+    auto_umount=("Unmount the mounts of a base directory and host type as soon as the last running session of them exits", "flag"),
+    debug=(chroot.__docstring_debug__, "flag"),
+)
+def chroot_supervisor(socket_path=os.getenv(chroot_client.supervisor_socket_path_env, chroot_client.supervisor_socket_path_default), config_dir_path=chroot.config_dir_path_default, mount=chroot.mount_default, kldload=chroot.kldload_default, chroot_binary=chroot.chroot_default, mount_backend=chroot.mount_backend_default, umount=chroot.umount_default, auto_umount=False, debug=False):
+    """Runs the supervisor in the foreground until it's interrupted. Running sessions aren't terminated when the supervisor exits; use `chroot_shutdown` to free them."""
+    if debug is True:
+        logger.setLevel(logging.DEBUG)
+        ch.setLevel(logging.DEBUG)
+    supervisor = Supervisor(socket_path, config_dir_path=config_dir_path, mount=mount, kldload=kldload, chroot_binary=chroot_binary, mount_backend=mount_backend, umount=umount, auto_umount=auto_umount)
+    logger.info("listening for session requests on '%s'" % (socket_path, ))
+    try:
+        supervisor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.server_close()
+
+def main():
+    """entry point for setuptools"""
+    plac.call(chroot_supervisor)
+
+if __name__ == "__main__":
+    main()
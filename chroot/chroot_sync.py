@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# a simple wrapper around the `sync_host_files` and `watch_host_files` functions in `chroot.py` which synchronizes host files (e.g. `/etc/resolv.conf`) into the registered base directories once or (with `--watch`) as a service whenever they change
+
+import chroot
+import chroot_hostfiles
+import plac
+import sys
+import logging
+
+@plac.annotations(
+    base_dir=("Only synchronize into `base_dir`. `None` means all registered base directories.", "positional"), 
+    host_type=("Only synchronize into base directories with `host_type`. `None` means all.", "positional"), 
+    config_dir_path=(chroot.__docstring_config_dir_path__, "option"), 
+    watch=("Keep running and synchronize host files into all registered base directories whenever they change (Linux only)", "flag"), 
+    debounce=("The number of seconds to wait for further changes before synchronizing", "option", None, float), 
+    debug=(chroot.__docstring_debug__, "flag"), 
+)
+def chroot_sync(base_dir=None, host_type=None, config_dir_path=chroot.config_dir_path_default, watch=False, debounce=chroot_hostfiles.debounce_default, debug=False):
+    if debug is True:
+        chroot.logger.setLevel(logging.DEBUG)
+        chroot.ch.setLevel(logging.DEBUG)
+    if watch is True:
+        if base_dir is not None or host_type is not None:
+            raise ValueError("watching can't be restricted to a base directory or host type")
+        chroot.watch_host_files(config_dir_path=config_dir_path, debounce=debounce)
+        return 0
+    chroot.sync_host_files(config_dir_path=config_dir_path, base_dir=base_dir, host_type=host_type)
+    return 0
+
+def main():
+    """entry point for setuptools"""
+    sys.exit(plac.call(chroot_sync))
+
+if __name__ == "__main__":
+    main()
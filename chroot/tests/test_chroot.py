@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of the bookkeeping of sessions in `chroot.py` which use a registry in a temporary directory and replace the unmounting with a fake.
+
+import unittest
+import tempfile
+import shutil
+import os
+import subprocess as sp
+from chroot import chroot
+from chroot import chroot_process
+from chroot import chroot_registry
+
+def _exited_pid():
+    """Returns the pid of a process which has exited and been reaped."""
+    process = sp.Popen(["true"])
+    process.wait()
+    return process.pid
+
+class ChrootEndTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir_path = tempfile.mkdtemp()
+        self.registry = chroot_registry.open_registry(self.config_dir_path)
+        self.umounted = []
+        self.umount_success = True
+        self.umount_host_type = chroot._umount_host_type
+        chroot._umount_host_type = self.fake_umount_host_type
+        self.pid = os.getpid()
+        self.registry.register("/base", chroot.HOST_TYPE_DEBIAN, self.pid, chroot_process.process_start_time(self.pid))
+        self.registry.register_mounts("/base", chroot.HOST_TYPE_DEBIAN)
+
+    def tearDown(self):
+        chroot._umount_host_type = self.umount_host_type
+        self.registry.close()
+        shutil.rmtree(self.config_dir_path)
+
+    def fake_umount_host_type(self, base_dir, host_type, **kwargs):
+        self.umounted.append((base_dir, host_type))
+        return self.umount_success
+
+    def chroot_end(self, pid, **kwargs):
+        return chroot.chroot_end("/base", chroot.HOST_TYPE_DEBIAN, pid, config_dir_path=self.config_dir_path, **kwargs)
+
+    def test_last_session_umounts(self):
+        exited_pid = _exited_pid()
+        self.registry.register("/base", chroot.HOST_TYPE_DEBIAN, exited_pid)
+        # a running session is left
+        self.assertFalse(self.chroot_end(exited_pid, auto_umount=True))
+        self.assertEqual(self.registry.lookup("/base", chroot.HOST_TYPE_DEBIAN), set([self.pid]))
+        self.assertEqual(self.umounted, [])
+        self.assertTrue(self.chroot_end(self.pid, auto_umount=True))
+        self.assertEqual(self.registry.list_sessions(), [])
+        self.assertEqual(self.umounted, [("/base", chroot.HOST_TYPE_DEBIAN)])
+        self.assertEqual(self.registry.list_mounts(), [])
+
+    def test_dead_sessions_reaped(self):
+        start_time = chroot_process.process_start_time(self.pid)
+        if start_time is None:
+            self.skipTest("process start times aren't available")
+        # the pid of the session has been reused by another process
+        self.registry.register("/base", chroot.HOST_TYPE_DEBIAN, self.pid, start_time+1)
+        self.registry.register("/base", chroot.HOST_TYPE_DEBIAN, _exited_pid())
+        exited_pid = _exited_pid()
+        self.registry.register("/base", chroot.HOST_TYPE_DEBIAN, exited_pid)
+        self.assertTrue(self.chroot_end(exited_pid, auto_umount=True))
+        self.assertEqual(self.registry.list_sessions(), [])
+
+    def test_mounts_kept(self):
+        self.assertFalse(self.chroot_end(self.pid))
+        self.assertEqual(self.registry.list_sessions(), [])
+        # `chroot_shutdown` still finds the mounts
+        self.assertEqual(self.registry.list_mounts(), [("/base", chroot.HOST_TYPE_DEBIAN)])
+        self.assertEqual(self.umounted, [])
+
+    def test_mounts_kept_for_pool(self):
+        self.registry.add_pool_entry("/base", chroot.HOST_TYPE_DEBIAN, "/sessions/a")
+        self.assertFalse(self.chroot_end(self.pid, auto_umount=True))
+        self.assertEqual(self.umounted, [])
+
+    def test_failed_umount(self):
+        self.umount_success = False
+        self.assertFalse(self.chroot_end(self.pid, auto_umount=True))
+        self.assertEqual(self.umounted, [("/base", chroot.HOST_TYPE_DEBIAN)])
+        self.assertEqual(self.registry.list_mounts(), [("/base", chroot.HOST_TYPE_DEBIAN)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `chroot_batch.py` which run the commands with a stand-in chroot binary (executing them outside a chroot) and replace the setup of the mounts with a fake.
+
+import unittest
+import tempfile
+import shutil
+import os
+import StringIO
+from chroot import chroot
+from chroot import chroot_batch
+from chroot import chroot_registry
+
+class ReadCommandsTest(unittest.TestCase):
+
+    def test_read_commands(self):
+        commands_file = StringIO.StringIO("echo a\n\n  # comment\n  echo b  \necho c")
+        self.assertEqual(list(chroot_batch.read_commands(commands_file)), ["echo a", "echo b", "echo c"])
+
+class OutputStreamerTest(unittest.TestCase):
+
+    def test_stream(self):
+        output = StringIO.StringIO()
+        streamer = chroot_batch.OutputStreamer(output, prefix_format="%(index)d/%(stream)s: ")
+        streamer.stream(3, "err", StringIO.StringIO("a\n\nb"))
+        self.assertEqual(output.getvalue(), "3/err: a\n3/err: \n3/err: b\n")
+
+class RunCommandsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+        self.config_dir_path = os.path.join(self.directory, "config")
+        self.base_dir = os.path.join(self.directory, "base")
+        os.mkdir(self.base_dir)
+        # runs `shell -c command` in the base directory instead of a chroot
+        self.chroot_binary = os.path.join(self.directory, "chroot")
+        with open(self.chroot_binary, "w") as chroot_binary_file:
+            chroot_binary_file.write("#!/bin/sh\ncd \"$1\"\nshift\nexec \"$@\"\n")
+        os.chmod(self.chroot_binary, 0o755)
+        self.ensured_mounts = []
+        self.ensure_mounts = chroot.ensure_mounts
+        chroot.ensure_mounts = lambda registry, base_dir, host_type, **kwargs: self.ensured_mounts.append((base_dir, host_type))
+
+    def tearDown(self):
+        chroot.ensure_mounts = self.ensure_mounts
+        shutil.rmtree(self.directory)
+
+    def test_run_command(self):
+        output = StringIO.StringIO()
+        with chroot_registry.SessionRegistry(os.path.join(self.directory, "registry.sqlite")) as registry:
+            sessions = chroot_batch.BatchSessions(registry, self.base_dir, chroot.HOST_TYPE_DEBIAN)
+            result = chroot_batch.run_command(self.base_dir, 2, "pwd; echo error >&2; exit 4", chroot_batch.OutputStreamer(output), chroot_binary=self.chroot_binary, sessions=sessions)
+            self.assertEqual(registry.list_sessions(), [])
+        self.assertEqual((result.index, result.command, result.returncode), (2, "pwd; echo error >&2; exit 4", 4))
+        self.assertEqual(sorted(output.getvalue().splitlines()), ["[2 err] error", "[2 out] %s" % (self.base_dir, )])
+        self.assertEqual(sessions.pids, set())
+
+    def test_run_commands(self):
+        output = StringIO.StringIO()
+        commands = ["echo %d; exit %d" % (index, index, ) for index in range(10)]
+        results = chroot_batch.run_commands(self.base_dir, iter(commands), workers=3, host_type=chroot.HOST_TYPE_DEBIAN, config_dir_path=self.config_dir_path, chroot_binary=self.chroot_binary, output=output)
+        self.assertEqual([(result.index, result.command, result.returncode) for result in results], [(index, command, index) for index, command in enumerate(commands)])
+        self.assertEqual(sorted(output.getvalue().splitlines()), sorted(["[%d out] %d" % (index, index, ) for index in range(10)]))
+        self.assertEqual(self.ensured_mounts, [(self.base_dir, chroot.HOST_TYPE_DEBIAN)])
+        # the batch and its commands have been unregistered
+        with chroot_registry.open_registry(self.config_dir_path) as registry:
+            self.assertEqual(registry.list_sessions(), [])
+
+if __name__ == "__main__":
+    unittest.main()
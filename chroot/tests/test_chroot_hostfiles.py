@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of the synchronization of host files in `chroot_hostfiles.py` which use files in temporary directories as host files.
+
+import unittest
+import tempfile
+import shutil
+import os
+import stat
+import time
+from chroot import chroot_hostfiles
+
+class SyncFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.directory, "host", "resolv.conf")
+        os.mkdir(os.path.dirname(self.source_path))
+        self.write(self.source_path, "nameserver 10.0.0.1\n")
+        os.chmod(self.source_path, 0o640)
+        self.base_dir = os.path.join(self.directory, "base")
+        self.target_path = chroot_hostfiles.target_path(self.base_dir, self.source_path)
+        self.racy_interval = chroot_hostfiles.racy_interval
+        self.read = chroot_hostfiles._read
+        self.read_paths = []
+        chroot_hostfiles._read = self.counting_read
+
+    def tearDown(self):
+        chroot_hostfiles.racy_interval = self.racy_interval
+        chroot_hostfiles._read = self.read
+        chroot_hostfiles._digests.clear()
+        shutil.rmtree(self.directory)
+
+    def counting_read(self, path):
+        self.read_paths.append(path)
+        return self.read(path)
+
+    def write(self, path, content):
+        with open(path, "w") as path_file:
+            path_file.write(content)
+
+    def content(self, path):
+        with open(path, "r") as path_file:
+            return path_file.read()
+
+    def test_target_path(self):
+        self.assertEqual(chroot_hostfiles.target_path("/base", "/etc/resolv.conf"), "/base/etc/resolv.conf")
+
+    def test_sync(self):
+        self.assertTrue(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.assertEqual(self.content(self.target_path), "nameserver 10.0.0.1\n")
+        self.assertEqual(stat.S_IMODE(os.stat(self.target_path).st_mode), 0o640)
+        # up to date
+        self.assertFalse(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.write(self.source_path, "nameserver 10.0.0.2\n")
+        self.assertTrue(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.assertEqual(self.content(self.target_path), "nameserver 10.0.0.2\n")
+        # no temporary files are left behind
+        self.assertEqual(os.listdir(os.path.dirname(self.target_path)), ["resolv.conf"])
+
+    def test_missing_source(self):
+        self.assertFalse(chroot_hostfiles.sync_file(os.path.join(self.directory, "missing"), self.target_path))
+        self.assertFalse(os.path.exists(os.path.dirname(self.target_path)))
+
+    def test_replaced_atomically(self):
+        chroot_hostfiles.sync_file(self.source_path, self.target_path)
+        # a reader of the old file keeps reading the old content
+        with open(self.target_path, "r") as old_file:
+            self.write(self.source_path, "nameserver 10.0.0.2\n")
+            self.assertTrue(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+            self.assertEqual(old_file.read(), "nameserver 10.0.0.1\n")
+        self.assertEqual(self.content(self.target_path), "nameserver 10.0.0.2\n")
+
+    def test_symlink_replaced(self):
+        os.makedirs(os.path.dirname(self.target_path))
+        link_target_path = os.path.join(self.directory, "link-target")
+        self.write(link_target_path, "nameserver 10.0.0.1\n")
+        os.symlink(link_target_path, self.target_path)
+        self.assertTrue(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.assertFalse(os.path.islink(self.target_path))
+        self.assertEqual(self.content(link_target_path), "nameserver 10.0.0.1\n")
+
+    def test_same_size_change(self):
+        chroot_hostfiles.sync_file(self.source_path, self.target_path)
+        self.write(self.target_path, "nameserver 10.0.0.9\n")
+        self.assertTrue(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.assertEqual(self.content(self.target_path), "nameserver 10.0.0.1\n")
+
+    def test_cached(self):
+        chroot_hostfiles.racy_interval = 0
+        chroot_hostfiles.sync_file(self.source_path, self.target_path)
+        del self.read_paths[:]
+        self.assertFalse(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.assertEqual(self.read_paths, [])
+        # a change of the target which keeps its size and modification time is noticed by its change time
+        target_stat = os.stat(self.target_path)
+        time.sleep(0.01)
+        self.write(self.target_path, "nameserver 10.0.0.9\n")
+        os.utime(self.target_path, (target_stat.st_atime, target_stat.st_mtime))
+        self.assertTrue(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.assertEqual(self.read_paths, [self.target_path, self.source_path])
+        self.assertEqual(self.content(self.target_path), "nameserver 10.0.0.1\n")
+
+    def test_recent_files_not_cached(self):
+        chroot_hostfiles.sync_file(self.source_path, self.target_path)
+        del self.read_paths[:]
+        self.assertFalse(chroot_hostfiles.sync_file(self.source_path, self.target_path))
+        self.assertEqual(self.read_paths, [self.source_path, self.target_path])
+
+    def test_sync_files(self):
+        missing_path = os.path.join(self.directory, "host", "missing")
+        self.assertEqual(chroot_hostfiles.sync_files(self.base_dir, [self.source_path, missing_path]), [self.target_path])
+        self.assertEqual(chroot_hostfiles.sync_files(self.base_dir, [self.source_path, missing_path]), [])
+
+@unittest.skipUnless(chroot_hostfiles.inotify_available(), "inotify isn't available")
+class HostFileWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.directory, "resolv.conf")
+        self.other_path = os.path.join(self.directory, "hosts")
+        for path in [self.source_path, self.other_path]:
+            open(path, "w").close()
+        self.watcher = chroot_hostfiles.HostFileWatcher([self.source_path])
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.directory)
+
+    def test_timeout(self):
+        self.assertEqual(self.watcher.wait(timeout=0.01), set())
+
+    def test_changes(self):
+        with open(self.other_path, "w") as other_file:
+            other_file.write("127.0.0.1 localhost\n")
+        self.assertEqual(self.watcher.wait(timeout=0.1, debounce=0.01), set())
+        with open(self.source_path, "w") as source_file:
+            source_file.write("nameserver 10.0.0.1\n")
+        self.assertEqual(self.watcher.wait(timeout=5, debounce=0.01), set([self.source_path]))
+        # replaced by renaming
+        tmp_path = os.path.join(self.directory, ".resolv.conf.tmp")
+        open(tmp_path, "w").close()
+        os.rename(tmp_path, self.source_path)
+        self.assertEqual(self.watcher.wait(timeout=5, debounce=0.01), set([self.source_path]))
+
+if __name__ == "__main__":
+    unittest.main()
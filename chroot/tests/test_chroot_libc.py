@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `chroot_libc.py`.
+
+import unittest
+import time
+from chroot import chroot_libc
+
+class LoadLibcTest(unittest.TestCase):
+
+    def test_loaded_once(self):
+        self.assertIs(chroot_libc.load_libc(), chroot_libc.load_libc())
+
+class MonotonicTest(unittest.TestCase):
+
+    def test_monotonic(self):
+        start = chroot_libc.monotonic()
+        time.sleep(0.01)
+        self.assertTrue(0.005 < chroot_libc.monotonic()-start < 5.0)
+
+    @unittest.skipIf(chroot_libc.CLOCK_MONOTONIC is None, "the monotonic clock isn't available")
+    def test_clock_gettime(self):
+        self.assertIsNot(chroot_libc._load_clock_gettime(), False)
+        # unlike `time.time` the clock starts at boot
+        self.assertTrue(chroot_libc.monotonic() < time.time()-3600)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of the recording and export of phase timings in `chroot_metrics.py`.
+
+import unittest
+import tempfile
+import shutil
+import os
+import json
+from chroot import chroot_metrics
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jsonl_file_path = os.path.join(self.directory, "metrics.jsonl")
+        self.textfile_path = os.path.join(self.directory, "chroot.prom")
+        self.recorder = chroot_metrics.Recorder("chroot", jsonl_file_path=self.jsonl_file_path, textfile_path=self.textfile_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self):
+        with self.recorder.phase("mount", "/base/proc"):
+            pass
+        with self.recorder.phase("mount", "/base/proc") as timing:
+            timing.outcome = chroot_metrics.OUTCOME_FAILED
+        try:
+            with self.recorder.phase("wait"):
+                raise KeyboardInterrupt()
+        except KeyboardInterrupt:
+            pass
+
+    def read_jsonl(self):
+        with open(self.jsonl_file_path, "r") as jsonl_file:
+            return [json.loads(line) for line in jsonl_file]
+
+    def test_phase(self):
+        self.record()
+        self.assertEqual([(timing.phase, timing.target, timing.outcome, timing.error) for timing in self.recorder.timings], [("mount", "/base/proc", chroot_metrics.OUTCOME_OK, None), ("mount", "/base/proc", chroot_metrics.OUTCOME_FAILED, None), ("wait", None, chroot_metrics.OUTCOME_ERROR, "KeyboardInterrupt")])
+        for timing in self.recorder.timings:
+            self.assertTrue(timing.duration >= 0)
+
+    def test_jsonl(self):
+        self.record()
+        self.recorder.write()
+        with self.recorder.phase("umount", "/base/proc"):
+            pass
+        self.recorder.write()
+        # only the timings which haven't been written before are appended
+        lines = self.read_jsonl()
+        self.assertEqual([(line["phase"], line["target"], line["outcome"], line["error"]) for line in lines], [("mount", "/base/proc", "ok", None), ("mount", "/base/proc", "failed", None), ("wait", None, "error", "KeyboardInterrupt"), ("umount", "/base/proc", "ok", None)])
+        for line in lines:
+            self.assertEqual((line["command"], line["pid"]), ("chroot", os.getpid()))
+
+    def test_textfile(self):
+        self.record()
+        self.recorder.write(active_sessions={("/base", "debian"): 2})
+        with open(self.textfile_path, "r") as textfile:
+            lines = textfile.read().splitlines()
+        self.assertIn('chroot_phase_count{command="chroot",outcome="failed",phase="mount",target="/base/proc"} 1', lines)
+        self.assertIn('chroot_phase_count{command="chroot",outcome="error",phase="wait",target=""} 1', lines)
+        self.assertIn('chroot_active_sessions{base_dir="/base",host_type="debian"} 2', lines)
+        self.assertIn("# TYPE chroot_phase_duration_seconds gauge", lines)
+        # the file is replaced without leaving temporary files behind
+        self.assertEqual(sorted(os.listdir(self.directory)), ["chroot.prom", "metrics.jsonl"])
+
+    def test_write_failure_logged(self):
+        jsonl_file_path = os.path.join(self.directory, "missing", "metrics.jsonl")
+        recorder = chroot_metrics.Recorder("chroot", jsonl_file_path=jsonl_file_path)
+        with recorder.phase("wait"):
+            pass
+        # doesn't raise
+        recorder.write()
+        self.assertFalse(os.path.exists(jsonl_file_path))
+
+    def test_labels(self):
+        self.assertEqual(chroot_metrics._labels(b="a\"b", a="c\\d\ne"), 'a="c\\\\d\\ne",b="a\\"b"')
+
+    def test_unrecorded_phase(self):
+        with chroot_metrics.phase(None, "wait") as timing:
+            self.assertEqual(timing.phase, "wait")
+
+if __name__ == "__main__":
+    unittest.main()
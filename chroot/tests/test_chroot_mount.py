@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of the translation of `mount -o` options in `chroot_mount.py`.
+
+import unittest
+from chroot import chroot_mount
+
+class ParseOptionsTest(unittest.TestCase):
+
+    def test_none(self):
+        self.assertEqual(chroot_mount.parse_options(None), (0, None))
+        self.assertEqual(chroot_mount.parse_options(""), (0, None))
+
+    def test_flags(self):
+        self.assertEqual(chroot_mount.parse_options("ro,nosuid, nodev,noexec"), (chroot_mount.MS_RDONLY | chroot_mount.MS_NOSUID | chroot_mount.MS_NODEV | chroot_mount.MS_NOEXEC, None))
+        self.assertEqual(chroot_mount.parse_options("rbind,rslave"), (chroot_mount.MS_BIND | chroot_mount.MS_REC | chroot_mount.MS_SLAVE, None))
+
+    def test_noops(self):
+        self.assertEqual(chroot_mount.parse_options("defaults,rw,,suid,dev,exec"), (0, None))
+
+    def test_data(self):
+        self.assertEqual(chroot_mount.parse_options("nosuid,mode=0755,size=10m,rw"), (chroot_mount.MS_NOSUID, "mode=0755,size=10m"))
+        self.assertEqual(chroot_mount.parse_options("lowerdir=/a:/b"), (0, "lowerdir=/a:/b"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of the ordering and execution of mounts and of the loading of host profile files in `chroot_mount_plan.py` which use fake mount functions instead of mounting.
+
+import unittest
+import tempfile
+import shutil
+import os
+import json
+import threading
+from chroot import chroot_mount_plan
+
+mount_spec = chroot_mount_plan.mount_spec
+
+class MountLevelsTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(chroot_mount_plan.mount_levels([]), [])
+        self.assertEqual(chroot_mount_plan.umount_order([]), [])
+
+    def test_independent(self):
+        proc = mount_spec("proc", "proc", "proc")
+        sysfs = mount_spec("sysfs", "sys", "sysfs")
+        self.assertEqual(chroot_mount_plan.mount_levels([proc, sysfs]), [[proc, sysfs]])
+        self.assertEqual(chroot_mount_plan.umount_order([proc, sysfs]), [sysfs, proc])
+
+    def test_nested_targets(self):
+        dev = mount_spec("/dev", "dev")
+        pts = mount_spec("devpts", "dev/pts", "devpts")
+        shm = mount_spec("tmpfs", "dev/shm/", "tmpfs")
+        # `dev2` isn't inside `dev`
+        dev2 = mount_spec("/dev", "dev2")
+        mount_specs = [pts, dev2, shm, dev]
+        self.assertEqual(chroot_mount_plan.mount_levels(mount_specs), [[dev2, dev], [pts, shm]])
+        self.assertEqual(chroot_mount_plan.umount_order(mount_specs), [shm, pts, dev, dev2])
+
+    def test_explicit_dependencies(self):
+        proc = mount_spec("proc", "proc", "proc")
+        binfmt = mount_spec("binfmt_misc", "binfmt", "binfmt_misc", dependencies=["proc"])
+        other = mount_spec("/other", "other", dependencies=["binfmt"])
+        mount_specs = [other, binfmt, proc]
+        self.assertEqual(chroot_mount_plan.mount_levels(mount_specs), [[proc], [binfmt], [other]])
+        self.assertEqual(chroot_mount_plan.umount_order(mount_specs), [other, binfmt, proc])
+
+    def test_missing_dependency(self):
+        with self.assertRaisesRegexp(ValueError, "depends on 'proc' which isn't mounted"):
+            chroot_mount_plan.mount_levels([mount_spec("binfmt_misc", "binfmt", "binfmt_misc", dependencies=["proc"])])
+
+    def test_cycle(self):
+        a = mount_spec("/a", "a", dependencies=["b"])
+        b = mount_spec("/b", "b", dependencies=["a"])
+        c = mount_spec("/c", "c")
+        with self.assertRaisesRegexp(ValueError, "mounts on 'a', 'b' are cyclic"):
+            chroot_mount_plan.mount_levels([a, b, c])
+        with self.assertRaises(ValueError):
+            chroot_mount_plan.umount_order([a, b, c])
+
+    def test_cycle_through_nested_target(self):
+        # `dev/pts` depends on `dev` implicitly
+        dev = mount_spec("/dev", "dev", dependencies=["dev/pts"])
+        pts = mount_spec("devpts", "dev/pts", "devpts")
+        with self.assertRaisesRegexp(ValueError, "cyclic"):
+            chroot_mount_plan.mount_levels([dev, pts])
+
+    def test_duplicate_target(self):
+        with self.assertRaisesRegexp(ValueError, "mounted twice"):
+            chroot_mount_plan.mount_levels([mount_spec("proc", "proc", "proc"), mount_spec("/proc", "proc")])
+
+class LoadHostProfilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.host_profiles = dict(chroot_mount_plan.host_profiles)
+        self.registered_host_profiles = dict(chroot_mount_plan.registered_host_profiles)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        chroot_mount_plan.host_profiles.clear()
+        chroot_mount_plan.host_profiles.update(self.host_profiles)
+        chroot_mount_plan.registered_host_profiles.clear()
+        chroot_mount_plan.registered_host_profiles.update(self.registered_host_profiles)
+
+    def write(self, file_name, description):
+        with open(os.path.join(self.directory, file_name), "w") as host_profile_file:
+            json.dump(description, host_profile_file)
+
+    def targets(self, name):
+        return [spec.target for spec in chroot_mount_plan.get_host_profile(name).mount_specs]
+
+    def test_missing_directory(self):
+        self.assertEqual(chroot_mount_plan.load_host_profiles(os.path.join(self.directory, "missing")), [])
+
+    def test_profile(self):
+        self.write("tmp.json", {"name": "tmp", "mounts": [{"source": "tmpfs", "target": "tmp", "fs_type": "tmpfs", "options": "nosuid"}], "kernel_modules": ["tmpfs"]})
+        self.write("ignored.txt", {"name": "ignored", "mounts": []})
+        self.assertEqual(chroot_mount_plan.load_host_profiles(self.directory), ["tmp"])
+        host_profile = chroot_mount_plan.get_host_profile("tmp")
+        self.assertEqual(host_profile.mount_specs, (mount_spec("tmpfs", "tmp", "tmpfs", "nosuid"), ))
+        self.assertEqual((host_profile.syscall_supported, host_profile.lazy_umount_option, host_profile.kernel_modules, host_profile.sync_files), (True, "-l", ("tmpfs", ), chroot_mount_plan.sync_files_default))
+        self.assertRaises(ValueError, chroot_mount_plan.get_host_profile, "ignored")
+
+    def test_base_in_later_file(self):
+        self.write("a.json", {"name": "derived", "base": "tmp", "mounts": [{"source": "/cache", "target": "tmp/cache", "options": "bind"}]})
+        self.write("b.json", {"name": "tmp", "mounts": [{"source": "tmpfs", "target": "tmp", "fs_type": "tmpfs"}], "lazy_umount_option": "-f"})
+        self.assertEqual(chroot_mount_plan.load_host_profiles(self.directory), ["derived", "tmp"])
+        self.assertEqual(self.targets("derived"), ["tmp", "tmp/cache"])
+        self.assertEqual(chroot_mount_plan.get_host_profile("derived").lazy_umount_option, "-f")
+
+    def test_self_based_profile_reloaded(self):
+        chroot_mount_plan.register_host_profile("tmp", [mount_spec("tmpfs", "tmp", "tmpfs")])
+        self.write("tmp.json", {"name": "tmp", "base": "tmp", "mounts": [{"source": "/var/cache/apt", "target": "var/cache/apt", "options": "bind"}]})
+        for _ in range(2):
+            self.assertEqual(chroot_mount_plan.load_host_profiles(self.directory), ["tmp"])
+            self.assertEqual(self.targets("tmp"), ["tmp", "var/cache/apt"])
+        # changes of the file replace the previously loaded profile
+        self.write("tmp.json", {"name": "tmp", "base": "tmp", "mounts": [{"source": "/var/lib/apt", "target": "var/lib/apt", "options": "bind"}]})
+        chroot_mount_plan.load_host_profiles(self.directory)
+        self.assertEqual(self.targets("tmp"), ["tmp", "var/lib/apt"])
+
+    def test_self_based_profile_unregistered(self):
+        self.write("tmp.json", {"name": "tmp", "base": "tmp", "mounts": []})
+        with self.assertRaisesRegexp(ValueError, "host_type 'tmp' not supported"):
+            chroot_mount_plan.load_host_profiles(self.directory)
+
+    def test_invalid(self):
+        self.write("a.json", {"name": "a", "mounts": [{"source": "/a", "target": "a", "dependencies": ["missing"]}]})
+        self.write("b.json", {"name": "b", "base": "a", "mounts": []})
+        self.write("c.json", {"mounts": []})
+        self.write("d.json", {"name": "d", "mounts": []})
+        with open(os.path.join(self.directory, "e.json"), "w") as host_profile_file:
+            host_profile_file.write("{")
+        with self.assertRaisesRegexp(ValueError, "invalid host profile file"):
+            chroot_mount_plan.load_host_profiles(self.directory)
+        # the profiles based on invalid profiles are skipped as well
+        self.assertEqual(chroot_mount_plan.load_host_profiles(self.directory, skip_invalid=True), ["d"])
+
+    def test_cyclic_bases(self):
+        self.write("a.json", {"name": "a", "base": "b", "mounts": []})
+        self.write("b.json", {"name": "b", "base": "a", "mounts": []})
+        with self.assertRaisesRegexp(ValueError, "base profiles 'a', 'b' are cyclic"):
+            chroot_mount_plan.load_host_profiles(self.directory)
+
+class ExecuteMountsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.mounted = []
+        self.umounted = []
+        self.failing_targets = set()
+
+    def mount(self, base_dir, spec):
+        if spec.target in self.failing_targets:
+            raise OSError("mounting '%s' failed" % (spec.target, ))
+        with self.lock:
+            self.mounted.append(spec.target)
+
+    def umount(self, target):
+        self.umounted.append(target)
+
+    def test_levels(self):
+        mount_specs = [mount_spec("/dev", "dev"), mount_spec("devpts", "dev/pts", "devpts"), mount_spec("proc", "proc", "proc"), mount_spec("sysfs", "sys", "sysfs")]
+        mounted = chroot_mount_plan.execute_mounts("/base", mount_specs, self.mount, self.umount, is_mounted=lambda target: target == "/base/sys")
+        self.assertEqual(sorted(mounted[:2]), ["/base/dev", "/base/proc"])
+        self.assertEqual(mounted[2:], ["/base/dev/pts"])
+        self.assertEqual(self.mounted[2:], ["dev/pts"])
+        self.assertEqual(self.umounted, [])
+
+    def test_rollback(self):
+        self.failing_targets.add("dev/shm")
+        mount_specs = [mount_spec("/dev", "dev"), mount_spec("proc", "proc", "proc"), mount_spec("devpts", "dev/pts", "devpts"), mount_spec("tmpfs", "dev/shm", "tmpfs")]
+        with self.assertRaisesRegexp(OSError, "mounting 'dev/shm' failed"):
+            chroot_mount_plan.execute_mounts("/base", mount_specs, self.mount, self.umount, workers=1)
+        self.assertEqual(self.mounted, ["dev", "proc", "dev/pts"])
+        self.assertEqual(self.umounted, ["/base/dev/pts", "/base/proc", "/base/dev"])
+
+    def test_failing_rollback(self):
+        self.failing_targets.add("proc")
+        def umount(target):
+            self.umounted.append(target)
+            raise OSError("busy")
+        with self.assertRaisesRegexp(OSError, "mounting 'proc' failed"):
+            chroot_mount_plan.execute_mounts("/base", [mount_spec("/dev", "dev"), mount_spec("proc", "proc", "proc")], self.mount, umount)
+        self.assertEqual(self.umounted, ["/base/dev"])
+
+class ParallelMapTest(unittest.TestCase):
+
+    def test_results_in_order(self):
+        self.assertEqual(chroot_mount_plan.parallel_map(lambda item: item*2, range(10), 3), [item*2 for item in range(10)])
+        self.assertEqual(chroot_mount_plan.parallel_map(lambda item: item, [], 3), [])
+
+    def test_concurrency(self):
+        barrier = threading.Semaphore(0)
+        def function(item):
+            # deadlocks unless both items are processed concurrently
+            barrier.release()
+            barrier.acquire()
+            return item
+        self.assertEqual(chroot_mount_plan.parallel_map(function, [1, 2], 2), [1, 2])
+
+    def test_error(self):
+        done = []
+        def function(item):
+            if item == 0:
+                raise ValueError("item 0")
+            done.append(item)
+        with self.assertRaisesRegexp(ValueError, "item 0"):
+            chroot_mount_plan.parallel_map(function, range(5), 2)
+        # the other items are processed nevertheless
+        self.assertEqual(sorted(done), [1, 2, 3, 4])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of the parsing of `/proc/self/mountinfo` and of the mount index in `chroot_mountinfo.py` which uses fixture files instead of the mount table of the current process.
+
+import unittest
+import tempfile
+import os
+from chroot import chroot_mountinfo
+
+class UnescapeTest(unittest.TestCase):
+
+    def test_unescape(self):
+        self.assertEqual(chroot_mountinfo._unescape("/mnt/a\\040b"), "/mnt/a b")
+        self.assertEqual(chroot_mountinfo._unescape("\\011\\012\\134"), "\t\n\\")
+        self.assertEqual(chroot_mountinfo._unescape("/mnt/plain"), "/mnt/plain")
+        # only three digit octal escapes are reverted
+        self.assertEqual(chroot_mountinfo._unescape("\\04"), "\\04")
+
+class ParseLineTest(unittest.TestCase):
+
+    def test_optional_fields(self):
+        entry = chroot_mountinfo.parse_line("36 35 98:0 /mnt1 /mnt/parent\\040dir rw,noatime master:1 shared:2 - ext3 /dev/root rw,errors=continue\n")
+        self.assertEqual(entry, chroot_mountinfo.MountInfoEntry(mount_id=36,
+            parent_id=35,
+            major_minor="98:0",
+            root="/mnt1",
+            mount_point="/mnt/parent dir",
+            mount_options="rw,noatime",
+            fs_type="ext3",
+            source="/dev/root",
+            super_options="rw,errors=continue",
+        ))
+
+    def test_no_optional_fields(self):
+        entry = chroot_mountinfo.parse_line("25 1 0:22 / /base/proc rw,nosuid - proc proc rw")
+        self.assertEqual((entry.mount_id, entry.parent_id, entry.mount_point, entry.mount_options, entry.fs_type, entry.source, entry.super_options), (25, 1, "/base/proc", "rw,nosuid", "proc", "proc", "rw"))
+
+    def test_missing_super_options(self):
+        entry = chroot_mountinfo.parse_line("25 1 0:22 / /base/proc rw - proc proc")
+        self.assertEqual(entry.super_options, "")
+
+    def test_separator_in_root(self):
+        # the separator is only searched after the mandatory fields
+        entry = chroot_mountinfo.parse_line("40 25 0:23 - /base/dev rw - devtmpfs udev rw")
+        self.assertEqual((entry.root, entry.fs_type, entry.source), ("-", "devtmpfs", "udev"))
+
+def _entry(mount_id, parent_id, mount_point):
+    return chroot_mountinfo.parse_line("%d %d 0:%d / %s rw - tmpfs tmpfs rw" % (mount_id, parent_id, mount_id, mount_point, ))
+
+class StackTest(unittest.TestCase):
+
+    def test_single(self):
+        entry = _entry(30, 1, "/base")
+        self.assertEqual(chroot_mountinfo._stack([entry]), [entry])
+
+    def test_reused_mount_ids(self):
+        # the mount id of the top filesystem has been reused and is lower than the one of the filesystem below
+        bottom = _entry(40, 1, "/base/proc")
+        middle = _entry(45, 40, "/base/proc")
+        top = _entry(12, 45, "/base/proc")
+        self.assertEqual(chroot_mountinfo._stack([top, bottom, middle]), [bottom, middle, top])
+
+    def test_different_subtrees(self):
+        first = _entry(30, 1, "/base")
+        second = _entry(31, 2, "/base")
+        top = _entry(32, 31, "/base")
+        self.assertEqual(chroot_mountinfo._stack([top, second, first]), [first, second, top])
+
+mountinfo_fixture = """1 0 8:1 / / rw - ext4 /dev/sda1 rw
+20 1 0:20 / /nonexistent/base rw - tmpfs tmpfs rw
+21 20 0:21 / /nonexistent/base/proc rw,nosuid - proc proc rw
+12 21 0:22 / /nonexistent/base/proc rw - proc proc rw
+22 20 0:23 / /nonexistent/base/dev rw - devtmpfs udev rw
+23 22 0:24 / /nonexistent/base/dev/pts rw - devpts devpts rw
+24 1 0:25 / /nonexistent/base2 rw - tmpfs tmpfs rw
+25 1 0:26 / /nonexistent/base\\040dir rw - tmpfs tmpfs rw
+"""
+
+class MountInfoIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        mountinfo_fd, self.mountinfo_path = tempfile.mkstemp()
+        os.write(mountinfo_fd, mountinfo_fixture)
+        os.close(mountinfo_fd)
+        self.index = chroot_mountinfo.MountInfoIndex(self.mountinfo_path)
+
+    def tearDown(self):
+        self.index.close()
+        os.remove(self.mountinfo_path)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup("/nonexistent/base/proc").mount_id, 12)
+        self.assertEqual(self.index.lookup("/nonexistent/base dir").mount_id, 25)
+        self.assertTrue(self.index.is_mounted("/nonexistent/base/dev/pts"))
+        self.assertFalse(self.index.is_mounted("/nonexistent/base/sys"))
+
+    def test_mounts_under(self):
+        self.assertEqual(self.index.mounts_under("/nonexistent/base"), ["/nonexistent/base/dev/pts", "/nonexistent/base/dev", "/nonexistent/base/proc", "/nonexistent/base/proc", "/nonexistent/base"])
+        self.assertEqual(self.index.mounts_under("/nonexistent/base/"), self.index.mounts_under("/nonexistent/base"))
+        self.assertEqual(self.index.mounts_under("/nonexistent/bas"), [])
+
+    def test_refresh(self):
+        with open(self.mountinfo_path, "w") as mountinfo_file:
+            mountinfo_file.write(str.join("\n", mountinfo_fixture.splitlines()[:3])+"\n")
+        self.assertTrue(self.index.refresh(force=True))
+        self.assertEqual(self.index.lookup("/nonexistent/base/proc").mount_id, 21)
+        self.assertEqual(self.index.mounts_under("/nonexistent/base"), ["/nonexistent/base/proc", "/nonexistent/base"])
+
+if __name__ == "__main__":
+    unittest.main()
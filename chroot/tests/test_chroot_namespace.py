@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `chroot_namespace.py`. Namespaces are replaced with fakes (the forked processes use the fakes as well) except in the tests which require root privileges.
+
+import unittest
+import tempfile
+import shutil
+import os
+import signal
+import time
+from chroot import chroot_mount
+from chroot import chroot_namespace
+
+class StartSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.unshare = chroot_namespace.unshare
+        self.syscall_mount = chroot_mount.syscall_mount
+        chroot_namespace.unshare = lambda flags: None
+        chroot_mount.syscall_mount = lambda source, target, fs_type=None, options_str=None, flags=0: None
+
+    def tearDown(self):
+        chroot_namespace.unshare = self.unshare
+        chroot_mount.syscall_mount = self.syscall_mount
+        shutil.rmtree(self.directory)
+
+    def test_start_session(self):
+        setup_path = os.path.join(self.directory, "setup")
+        pid = chroot_namespace.start_session(["sh", "-c", "test -f '%s' && exit 4" % (setup_path, )], setup_function=lambda: open(setup_path, "w").close())
+        self.assertEqual(chroot_namespace.wait_session(pid), 4)
+
+    def test_setup_failure(self):
+        def failing_setup_function():
+            raise RuntimeError("mounting failed")
+        with self.assertRaisesRegexp(OSError, "starting session in mount namespace failed: RuntimeError: mounting failed"):
+            chroot_namespace.start_session(["true"], setup_function=failing_setup_function)
+
+    def test_exec_failure(self):
+        with self.assertRaisesRegexp(OSError, "starting session in mount namespace failed: OSError: .*No such file"):
+            chroot_namespace.start_session([os.path.join(self.directory, "missing")])
+
+    def test_pid_namespace_returncode(self):
+        pid = chroot_namespace.start_session(["sh", "-c", "exit 4"], pid_namespace=True)
+        self.assertEqual(chroot_namespace.wait_session(pid), 4)
+
+    def test_pid_namespace_forwards_signals(self):
+        pid = chroot_namespace.start_session(["sleep", "10"], pid_namespace=True)
+        # sent immediately after the start
+        os.kill(pid, signal.SIGTERM)
+        # the session was terminated by the forwarded signal, the process in between exits like a shell
+        self.assertEqual(chroot_namespace.wait_session(pid), 128+signal.SIGTERM)
+
+class WaitSessionTest(unittest.TestCase):
+
+    def test_wait_session(self):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(3)
+        self.assertEqual(chroot_namespace.wait_session(pid), 3)
+
+    def test_signaled(self):
+        pid = os.fork()
+        if pid == 0:
+            time.sleep(10)
+            os._exit(0)
+        os.kill(pid, signal.SIGKILL)
+        self.assertEqual(chroot_namespace.wait_session(pid), -signal.SIGKILL)
+
+@unittest.skipUnless(chroot_namespace.namespace_available() and os.geteuid() == 0, "creating namespaces requires Linux and root privileges")
+class NamespaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mount_point = os.path.join(self.directory, "mnt")
+        os.mkdir(self.mount_point)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_mounts_private(self):
+        def setup_function():
+            chroot_mount.syscall_mount("tmpfs", self.mount_point, "tmpfs")
+            open(os.path.join(self.mount_point, "file"), "w").close()
+        pid = chroot_namespace.start_session(["test", "-f", os.path.join(self.mount_point, "file")], setup_function=setup_function)
+        self.assertEqual(chroot_namespace.wait_session(pid), 0)
+        # neither the mount nor the file are visible outside of the namespace
+        self.assertEqual(os.listdir(self.mount_point), [])
+
+    def test_pid_namespace(self):
+        pid_path = os.path.join(self.directory, "pid")
+        pid = chroot_namespace.start_session(["sh", "-c", "echo $$ > '%s'" % (pid_path, )], pid_namespace=True)
+        self.assertEqual(chroot_namespace.wait_session(pid), 0)
+        with open(pid_path, "r") as pid_file:
+            self.assertEqual(pid_file.read(), "1\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `chroot_overlay.py` which replace the mounts with fakes recording them, so that they don't require root privileges or overlayfs.
+
+import unittest
+import tempfile
+import shutil
+import os
+import stat
+from chroot import chroot_mount
+from chroot import chroot_mountinfo
+from chroot import chroot_overlay
+
+class FakeIndex(object):
+
+    def __init__(self, mount_points):
+        self.mount_points = mount_points
+
+    def mounts_under(self, path):
+        return [mount_point for mount_point in self.mount_points if mount_point == path or mount_point.startswith(path+"/")]
+
+class SessionRootTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.directory, "base")
+        os.mkdir(self.base_dir)
+        os.chmod(self.base_dir, 0o751)
+        self.overlay_dir = os.path.join(self.directory, "overlays")
+        self.calls = []
+        self.failing_target_suffix = None
+        self.failing_umount = False
+        self.patched = dict((name, getattr(chroot_mount, name)) for name in ["syscall_available", "syscall_mount", "lazy_syscall_mount", "syscall_umount"])
+        chroot_mount.syscall_available = lambda: True
+        chroot_mount.syscall_mount = lambda source, target, fs_type=None, options_str=None, flags=0: self.record("mount", source, target, fs_type, options_str)
+        chroot_mount.lazy_syscall_mount = lambda source, target, fs_type=None, options_str=None, flags=0: self.record("mount", source, target, fs_type, options_str)
+        chroot_mount.syscall_umount = self.fake_umount
+        self.get_index = chroot_mountinfo.get_index
+
+    def tearDown(self):
+        for name, value in self.patched.items():
+            setattr(chroot_mount, name, value)
+        chroot_mountinfo.get_index = self.get_index
+        shutil.rmtree(self.directory)
+
+    def record(self, *call):
+        if self.failing_target_suffix is not None and call[2].endswith(self.failing_target_suffix):
+            raise OSError("mounting '%s' failed" % (call[2], ))
+        self.calls.append(call)
+
+    def fake_umount(self, target, flags=0):
+        self.calls.append(("umount", target, flags))
+        if self.failing_umount:
+            raise OSError("unmounting '%s' failed" % (target, ))
+        if ("mount", "tmpfs", target, "tmpfs", "size=1g") in self.calls:
+            # the content of the tmpfs is gone
+            for name in os.listdir(target):
+                shutil.rmtree(os.path.join(target, name))
+
+    def create_session_root(self):
+        return chroot_overlay.create_session_root(self.base_dir, [os.path.join(self.base_dir, "proc"), os.path.join(self.base_dir, "dev"), os.path.join(self.base_dir, "dev", "pts")], overlay_dir=self.overlay_dir, tmpfs_options="size=1g")
+
+    def test_create_session_root(self):
+        session_dir = self.create_session_root()
+        self.assertEqual(os.path.dirname(session_dir), self.overlay_dir)
+        self.assertTrue(os.path.basename(session_dir).startswith("base-"))
+        root_dir = chroot_overlay.session_root_path(session_dir)
+        self.assertEqual(root_dir, os.path.join(session_dir, chroot_overlay.root_dir_name))
+        upper_dir = os.path.join(session_dir, chroot_overlay.upper_dir_name)
+        work_dir = os.path.join(session_dir, chroot_overlay.work_dir_name)
+        self.assertEqual(self.calls, [
+            ("mount", "tmpfs", session_dir, "tmpfs", "size=1g"),
+            ("mount", "overlay", root_dir, "overlay", "lowerdir=%s,upperdir=%s,workdir=%s" % (self.base_dir, upper_dir, work_dir, )),
+            ("mount", os.path.join(self.base_dir, "proc"), os.path.join(root_dir, "proc"), None, "bind"),
+            ("mount", os.path.join(self.base_dir, "dev"), os.path.join(root_dir, "dev"), None, "bind"),
+            ("mount", os.path.join(self.base_dir, "dev", "pts"), os.path.join(root_dir, "dev", "pts"), None, "bind"),
+        ])
+        # the root of the overlay has the mode of the base directory
+        self.assertEqual(stat.S_IMODE(os.stat(upper_dir).st_mode), 0o751)
+
+    def test_rollback(self):
+        self.failing_target_suffix = "/root/dev"
+        for failing_umount in [False, True]:
+            del self.calls[:]
+            self.failing_umount = failing_umount
+            # a failing rollback doesn't hide the original error
+            with self.assertRaisesRegexp(OSError, "mounting '.*/root/dev' failed"):
+                self.create_session_root()
+            session_dir = self.calls[0][2]
+            root_dir = chroot_overlay.session_root_path(session_dir)
+            # the mounts are undone in reverse order
+            self.assertEqual([call for call in self.calls if call[0] == "umount"], [("umount", os.path.join(root_dir, "proc"), chroot_mount.MNT_DETACH), ("umount", root_dir, chroot_mount.MNT_DETACH), ("umount", session_dir, chroot_mount.MNT_DETACH)])
+            if not failing_umount:
+                self.assertEqual(os.listdir(self.overlay_dir), [])
+
+    def test_remove_session_root(self):
+        session_dir = self.create_session_root()
+        root_dir = chroot_overlay.session_root_path(session_dir)
+        mount_points = [session_dir, root_dir, os.path.join(root_dir, "proc")]
+        chroot_mountinfo.get_index = lambda: FakeIndex(list(reversed(mount_points))+[self.base_dir])
+        self.assertEqual(chroot_overlay.remove_session_root(session_dir), None)
+        self.assertEqual([call for call in self.calls if call[0] == "umount"], [("umount", mount_point, chroot_mount.MNT_DETACH) for mount_point in reversed(mount_points)])
+        self.assertFalse(os.path.exists(session_dir))
+
+    def test_snapshot(self):
+        session_dir = self.create_session_root()
+        upper_dir = os.path.join(session_dir, chroot_overlay.upper_dir_name)
+        with open(os.path.join(upper_dir, "changed"), "w") as changed_file:
+            changed_file.write("changed\n")
+        chroot_mountinfo.get_index = lambda: FakeIndex([session_dir])
+        snapshot_dir = os.path.join(self.directory, "snapshots")
+        snapshot_path = chroot_overlay.remove_session_root(session_dir, snapshot_dir=snapshot_dir)
+        self.assertEqual(snapshot_path, os.path.join(snapshot_dir, os.path.basename(session_dir)))
+        self.assertFalse(os.path.exists(session_dir))
+        self.assertEqual(os.listdir(snapshot_path), ["changed"])
+        self.assertEqual(stat.S_IMODE(os.stat(snapshot_path).st_mode), 0o751)
+
+    def test_linux_only(self):
+        chroot_mount.syscall_available = lambda: False
+        with self.assertRaises(RuntimeError):
+            self.create_session_root()
+        self.assertFalse(os.path.exists(self.overlay_dir))
+
+if __name__ == "__main__":
+    unittest.main()
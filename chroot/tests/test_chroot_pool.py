@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `chroot_pool.py` which use a registry in a temporary directory and replace the mounts and overlay roots with fakes.
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import threading
+from chroot import chroot
+from chroot import chroot_mountinfo
+from chroot import chroot_overlay
+from chroot import chroot_pool
+from chroot import chroot_process
+from chroot import chroot_registry
+
+class FakeIndex(object):
+
+    def __init__(self, mounted_paths):
+        self.mounted_paths = mounted_paths
+
+    def is_mounted(self, path):
+        return path in self.mounted_paths
+
+class SessionRootPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+        self.base_dir = os.path.join(self.directory, "base")
+        os.mkdir(self.base_dir)
+        self.config_dir_path = os.path.join(self.directory, "config")
+        os.mkdir(self.config_dir_path)
+        self.overlay_dir = os.path.join(self.directory, "overlays")
+        os.mkdir(self.overlay_dir)
+        self.lock = threading.Lock()
+        self.ensured_mounts = []
+        self.discarded = []
+        self.umounted = []
+        self.patched = [(chroot, name, getattr(chroot, name)) for name in ["ensure_mounts", "_mount_targets", "_discard_session_root", "_umount_host_type"]]
+        self.patched.append((chroot_overlay, "create_session_root", chroot_overlay.create_session_root))
+        self.patched.append((chroot_mountinfo, "get_index", chroot_mountinfo.get_index))
+        chroot.ensure_mounts = lambda registry, base_dir, host_type, **kwargs: self.append(self.ensured_mounts, base_dir)
+        chroot._mount_targets = lambda base_dir, host_type: [os.path.join(base_dir, "proc")]
+        chroot._discard_session_root = lambda session_dir: self.append(self.discarded, session_dir)
+        chroot._umount_host_type = lambda base_dir, host_type, **kwargs: self.append(self.umounted, base_dir) or True
+        chroot_overlay.create_session_root = lambda base_dir, shared_mount_targets, overlay_dir=None, tmpfs_options=None: tempfile.mkdtemp(dir=overlay_dir)
+        # without a mount table the roots in the pool are considered mounted
+        chroot_mountinfo.get_index = lambda: None
+        self.registry = chroot_registry.open_registry(self.config_dir_path)
+        self.pool = chroot_pool.SessionRootPool(self.base_dir, size=3, ttl=10.0, host_type=chroot.HOST_TYPE_DEBIAN, config_dir_path=self.config_dir_path, overlay_dir=self.overlay_dir, refill_interval=0.01)
+
+    def tearDown(self):
+        self.pool.stop(drain=False)
+        for module, name, value in self.patched:
+            setattr(module, name, value)
+        self.registry.close()
+        shutil.rmtree(self.directory)
+
+    def append(self, values, value):
+        with self.lock:
+            values.append(value)
+
+    def pool_entries(self):
+        return [session_dir for _, _, session_dir, _ in self.registry.list_pool_entries(base_dir=self.base_dir, host_type=chroot.HOST_TYPE_DEBIAN)]
+
+    def test_refill(self):
+        self.assertEqual(self.pool.refill(), 3)
+        self.assertEqual(sorted(self.pool_entries()), sorted(os.path.join(self.overlay_dir, name) for name in os.listdir(self.overlay_dir)))
+        self.assertEqual(self.ensured_mounts, [self.base_dir]*3)
+        self.assertEqual(self.pool.refill(), 0)
+        # a handed out root is replaced
+        session_dir = chroot._take_pooled_session_root(self.registry, self.base_dir, chroot.HOST_TYPE_DEBIAN)
+        self.assertNotIn(session_dir, self.pool_entries())
+        self.assertEqual(self.pool.refill(), 1)
+        self.assertEqual(len(self.pool_entries()), 3)
+
+    def test_take_discards_unmounted(self):
+        self.registry.add_pool_entry(self.base_dir, chroot.HOST_TYPE_DEBIAN, "/sessions/a", created=1.0)
+        self.registry.add_pool_entry(self.base_dir, chroot.HOST_TYPE_DEBIAN, "/sessions/b", created=2.0)
+        chroot_mountinfo.get_index = lambda: FakeIndex([chroot_overlay.session_root_path("/sessions/b")])
+        self.assertEqual(chroot._take_pooled_session_root(self.registry, self.base_dir, chroot.HOST_TYPE_DEBIAN), "/sessions/b")
+        self.assertEqual(self.discarded, ["/sessions/a"])
+        self.assertEqual(chroot._take_pooled_session_root(self.registry, self.base_dir, chroot.HOST_TYPE_DEBIAN), None)
+
+    def test_evict(self):
+        for session_dir, created in [("/sessions/a", 100.0), ("/sessions/b", 105.0), ("/sessions/c", 110.0)]:
+            self.registry.add_pool_entry(self.base_dir, chroot.HOST_TYPE_DEBIAN, session_dir, created=created)
+        self.registry.add_pool_entry("/other", chroot.HOST_TYPE_DEBIAN, "/sessions/d", created=0.0)
+        self.assertEqual(self.pool.evict(now=115.0), 2)
+        self.assertEqual(self.discarded, ["/sessions/a", "/sessions/b"])
+        self.assertEqual(self.pool_entries(), ["/sessions/c"])
+        self.assertEqual(self.pool.evict(now=115.0), 0)
+        # roots of other pools aren't touched
+        self.assertEqual(len(self.registry.list_pool_entries(base_dir="/other")), 1)
+
+    def test_drain(self):
+        self.pool.refill()
+        session_dirs = self.pool_entries()
+        self.registry.register_mounts(self.base_dir, chroot.HOST_TYPE_DEBIAN)
+        self.assertTrue(self.pool.drain())
+        self.assertEqual(sorted(self.discarded), sorted(session_dirs))
+        self.assertEqual(self.pool_entries(), [])
+        self.assertEqual(self.umounted, [self.base_dir])
+        self.assertEqual(self.registry.list_mounts(), [])
+
+    def test_drain_keeps_mounts_of_sessions(self):
+        self.pool.refill()
+        pid = os.getpid()
+        self.registry.register(self.base_dir, chroot.HOST_TYPE_DEBIAN, pid, chroot_process.process_start_time(pid))
+        self.assertFalse(self.pool.drain())
+        self.assertEqual(self.pool_entries(), [])
+        self.assertEqual(self.umounted, [])
+
+    def test_background_refill(self):
+        self.pool.start()
+        deadline = time.time()+5
+        while len(self.pool_entries()) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.pool.stop()
+        self.assertEqual(self.pool_entries(), [])
+        self.assertEqual(len(self.discarded), 3)
+
+if __name__ == "__main__":
+    unittest.main()
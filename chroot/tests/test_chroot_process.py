@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `chroot_process.py` which use children of the test process as sessions.
+
+import unittest
+import tempfile
+import shutil
+import os
+import errno
+import signal
+import threading
+import time
+import subprocess as sp
+from chroot import chroot_libc
+from chroot import chroot_process
+
+def _exited(pid):
+    """Returns `True` if the process `pid` doesn't exist or is a zombie (which isn't necessarily reaped by init in containers)."""
+    try:
+        with open("/proc/%d/stat" % (pid, ), "r") as stat_file:
+            stat = stat_file.read()
+    except IOError:
+        return True
+    return stat[stat.rindex(")")+2] in "ZX"
+
+def _exited_pid():
+    """Returns the pid of a process which has exited and been reaped."""
+    process = sp.Popen(["true"])
+    process.wait()
+    return process.pid
+
+class ProcessTest(unittest.TestCase):
+
+    def test_pid_exists(self):
+        self.assertTrue(chroot_process.pid_exists(os.getpid()))
+        self.assertFalse(chroot_process.pid_exists(_exited_pid()))
+
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "/proc isn't available")
+    def test_process_start_time(self):
+        start_time = chroot_process.process_start_time(os.getpid())
+        self.assertTrue(start_time > 0)
+        self.assertEqual(chroot_process.process_start_time(os.getpid()), start_time)
+        self.assertEqual(chroot_process.process_start_time(_exited_pid()), None)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "/proc isn't available")
+    def test_process_start_time_command_name(self):
+        # the command name might contain spaces and parentheses
+        directory = tempfile.mkdtemp()
+        try:
+            command = os.path.join(directory, "a) (b")
+            os.symlink("/bin/sleep", command)
+            process = sp.Popen([command, "10"])
+            try:
+                with open("/proc/%d/stat" % (process.pid, ), "r") as stat_file:
+                    self.assertIn("(a) (b)", stat_file.read())
+                self.assertTrue(chroot_process.process_start_time(process.pid) >= chroot_process.process_start_time(os.getpid()))
+            finally:
+                process.kill()
+                process.wait()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_session_alive(self):
+        pid = os.getpid()
+        start_time = chroot_process.process_start_time(pid)
+        self.assertTrue(chroot_process.session_alive(pid, start_time))
+        # without start time only the existence is checked
+        self.assertTrue(chroot_process.session_alive(pid, None))
+        self.assertFalse(chroot_process.session_alive(_exited_pid(), None))
+        if start_time is None:
+            self.skipTest("process start times aren't available")
+        # the pid has been reused
+        self.assertFalse(chroot_process.session_alive(pid, start_time+1))
+
+    def test_pidfd_open(self):
+        fd = chroot_process.pidfd_open(os.getpid())
+        if fd is None:
+            self.skipTest("pidfds aren't supported")
+        os.close(fd)
+        with self.assertRaises(OSError) as context:
+            chroot_process.pidfd_open(_exited_pid())
+        self.assertEqual(context.exception.errno, errno.ESRCH)
+
+class TerminatePidsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.processes = []
+
+    def tearDown(self):
+        for process in self.processes:
+            try:
+                os.kill(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    def start(self, command, **kwargs):
+        """Starts `command` and reaps it as soon as it exits (sessions aren't children of the process terminating them, a zombie would be considered running)."""
+        process = sp.Popen(command, **kwargs)
+        self.processes.append(process)
+        reaper = threading.Thread(target=process.wait)
+        reaper.daemon = True
+        reaper.start()
+        return process
+
+    def returncode(self, process):
+        """Returns the exit status of `process` once the reaper has caught up with `wait_pids` which notices the exit first."""
+        deadline = chroot_libc.monotonic()+5
+        while process.returncode is None and chroot_libc.monotonic() < deadline:
+            time.sleep(0.01)
+        return process.returncode
+
+    def test_wait_pids_timeout(self):
+        process = self.start(["sleep", "10"])
+        start = chroot_libc.monotonic()
+        self.assertEqual(chroot_process.wait_pids([process.pid], chroot_libc.monotonic()+0.2), set([process.pid]))
+        self.assertTrue(chroot_libc.monotonic()-start >= 0.2)
+        # an expired deadline returns immediately
+        self.assertEqual(chroot_process.wait_pids([process.pid], chroot_libc.monotonic()-1), set([process.pid]))
+
+    def test_wait_pids_exited(self):
+        process = self.start(["sleep", "0.1"])
+        exited = self.start(["true"])
+        while chroot_process.pid_exists(exited.pid):
+            time.sleep(0.01)
+        start = chroot_libc.monotonic()
+        # processes which don't exist anymore are ignored
+        self.assertEqual(chroot_process.wait_pids([process.pid, exited.pid], chroot_libc.monotonic()+5), set())
+        self.assertTrue(chroot_libc.monotonic()-start < 5)
+
+    def test_terminate_pids(self):
+        process = self.start(["sleep", "10"])
+        start = chroot_libc.monotonic()
+        self.assertEqual(chroot_process.terminate_pids([process.pid], chroot_libc.monotonic()+5, term_timeout=2), set())
+        self.assertTrue(chroot_libc.monotonic()-start < 2)
+        self.assertEqual(self.returncode(process), -signal.SIGTERM)
+
+    def test_terminate_pids_kills(self):
+        # `sleep` inherits the ignored SIGTERM
+        process = self.start(["sh", "-c", "trap '' TERM; echo; exec sleep 10"], stdout=sp.PIPE)
+        process.stdout.readline()
+        start = chroot_libc.monotonic()
+        self.assertEqual(chroot_process.terminate_pids([process.pid], chroot_libc.monotonic()+5, term_timeout=0.2), set())
+        self.assertTrue(0.2 <= chroot_libc.monotonic()-start < 5)
+        self.assertEqual(self.returncode(process), -signal.SIGKILL)
+
+    def test_terminate_pids_deadline(self):
+        process = self.start(["sh", "-c", "trap '' TERM; echo; exec sleep 10"], stdout=sp.PIPE)
+        process.stdout.readline()
+        # SIGKILL is sent when the deadline is reached before `term_timeout`
+        start = chroot_libc.monotonic()
+        chroot_process.terminate_pids([process.pid], chroot_libc.monotonic()+0.2, term_timeout=10)
+        self.assertTrue(chroot_libc.monotonic()-start < 5)
+        self.assertEqual(self.returncode(process), -signal.SIGKILL)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "/proc isn't available")
+    def test_kill_pids_process_group(self):
+        # the leader of a process group receives the signal together with the processes it started
+        process = self.start(["sh", "-c", "sleep 10 & echo $!; wait"], stdout=sp.PIPE, preexec_fn=os.setpgrp)
+        child_pid = int(process.stdout.readline())
+        chroot_process.kill_pids([process.pid], signal.SIGKILL)
+        deadline = chroot_libc.monotonic()+5
+        while not _exited(child_pid) and chroot_libc.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(_exited(child_pid))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `chroot_registry.py` which use registries in temporary directories and thus don't require root privileges.
+
+import unittest
+import tempfile
+import shutil
+import os
+import sqlite3
+import dumbdbm
+import shelve
+from chroot import chroot_registry
+from chroot import chroot_process
+
+class SessionRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir_path = tempfile.mkdtemp()
+        self.registry = chroot_registry.SessionRegistry(os.path.join(self.config_dir_path, chroot_registry.registry_file_name))
+
+    def tearDown(self):
+        self.registry.close()
+        shutil.rmtree(self.config_dir_path)
+
+    def test_register_and_unregister(self):
+        self.registry.register("/base", "debian", 10, 100)
+        self.registry.register("/base", "debian", 11)
+        self.registry.register("/base", "freebsd", 12)
+        self.registry.register("/other", "debian", 13)
+        self.assertEqual(self.registry.lookup("/base", "debian"), set([10, 11]))
+        self.assertEqual(self.registry.lookup("/missing", "debian"), set())
+        self.assertEqual(self.registry.list_sessions(), [("/base", "debian", 10, 100), ("/base", "debian", 11, None), ("/base", "freebsd", 12, None), ("/other", "debian", 13, None)])
+        self.assertEqual(self.registry.list_sessions(base_dir="/base", host_type="freebsd"), [("/base", "freebsd", 12, None)])
+        self.assertEqual(self.registry.list_sessions(host_type="debian"), [("/base", "debian", 10, 100), ("/base", "debian", 11, None), ("/other", "debian", 13, None)])
+        # a reused pid replaces the entry
+        self.registry.register("/base", "debian", 10, 200)
+        self.assertEqual(self.registry.list_sessions(base_dir="/base", host_type="debian"), [("/base", "debian", 10, 200), ("/base", "debian", 11, None)])
+        self.assertEqual(self.registry.unregister("/base", "debian", 10), 1)
+        self.assertEqual(self.registry.unregister("/base", "debian", 10), 0)
+        self.assertEqual(self.registry.unregister("/base", "freebsd"), 1)
+        self.assertEqual(self.registry.list_sessions(), [("/base", "debian", 11, None), ("/other", "debian", 13, None)])
+
+    def test_mounts(self):
+        self.registry.register_mounts("/base", "debian")
+        self.registry.register_mounts("/base", "debian")
+        self.registry.register_mounts("/other", "freebsd")
+        self.assertEqual(self.registry.list_mounts(), [("/base", "debian"), ("/other", "freebsd")])
+        self.assertEqual(self.registry.list_mounts(host_type="freebsd"), [("/other", "freebsd")])
+        self.registry.unregister_mounts("/base", "debian")
+        self.assertEqual(self.registry.list_mounts(), [("/other", "freebsd")])
+
+    def test_pool(self):
+        self.registry.add_pool_entry("/base", "debian", "/sessions/b", created=2.0)
+        self.registry.add_pool_entry("/base", "debian", "/sessions/a", created=1.0)
+        self.registry.add_pool_entry("/other", "debian", "/sessions/c", created=0.0)
+        self.assertEqual(self.registry.list_pool_entries(base_dir="/base"), [("/base", "debian", "/sessions/a", 1.0), ("/base", "debian", "/sessions/b", 2.0)])
+        self.assertEqual(self.registry.take_pool_entry("/base", "debian"), "/sessions/a")
+        self.assertFalse(self.registry.remove_pool_entry("/sessions/a"))
+        self.assertTrue(self.registry.remove_pool_entry("/sessions/b"))
+        self.assertEqual(self.registry.take_pool_entry("/base", "debian"), None)
+        self.assertEqual(self.registry.list_pool_entries(), [("/other", "debian", "/sessions/c", 0.0)])
+
+    def test_overlay_roots(self):
+        self.registry.add_overlay_root("/base", "debian", "/sessions/a", 10, 100)
+        self.registry.add_overlay_root("/other", "debian", "/sessions/b", 11)
+        self.assertEqual(self.registry.list_overlay_roots(), [("/base", "debian", "/sessions/a", 10, 100), ("/other", "debian", "/sessions/b", 11, None)])
+        self.assertEqual(self.registry.list_overlay_roots(base_dir="/other"), [("/other", "debian", "/sessions/b", 11, None)])
+        self.assertTrue(self.registry.remove_overlay_root("/sessions/a"))
+        self.assertFalse(self.registry.remove_overlay_root("/sessions/a"))
+        self.assertEqual(self.registry.list_overlay_roots(), [("/other", "debian", "/sessions/b", 11, None)])
+
+    def test_locked_rolls_back(self):
+        try:
+            with self.registry.locked():
+                self.registry.register("/base", "debian", 10)
+                with self.registry.locked():
+                    self.registry.register("/base", "debian", 11)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertEqual(self.registry.list_sessions(), [])
+
+    def test_reap(self):
+        pid = os.getpid()
+        start_time = chroot_process.process_start_time(pid)
+        self.registry.register("/base", "debian", pid, start_time)
+        # the pid has been reused by another process
+        self.registry.register("/base", "freebsd", pid, -1 if start_time is None else start_time+1)
+        self.registry.register("/other", "debian", pid, -1 if start_time is None else start_time+1)
+        if start_time is None:
+            # without start times only the existence of the pid can be checked
+            self.skipTest("process start times aren't available")
+        self.assertEqual(self.registry.reap(base_dir="/base"), 1)
+        self.assertEqual(self.registry.list_sessions(), [("/base", "debian", pid, start_time), ("/other", "debian", pid, start_time+1)])
+        self.assertEqual(self.registry.reap(), 1)
+        self.assertEqual(self.registry.list_sessions(), [("/base", "debian", pid, start_time)])
+
+    def test_migrate_count_file(self):
+        count_file_path = os.path.join(self.config_dir_path, chroot_registry.legacy_count_file_name)
+        count_file_dict = shelve.Shelf(dict=dumbdbm.open(count_file_path, "c"))
+        count_file_dict["/base"] = {"debian": [10, 11], "freebsd": [12]}
+        count_file_dict["/malformed"] = [13]
+        count_file_dict.close()
+        self.registry.register("/base", "debian", 10, 100)
+        self.assertEqual(self.registry.migrate_count_file(count_file_path), 2)
+        self.assertEqual(self.registry.list_sessions(), [("/base", "debian", 10, 100), ("/base", "debian", 11, None), ("/base", "freebsd", 12, None)])
+        self.assertFalse(os.path.exists(count_file_path+".dat"))
+        self.assertTrue(os.path.exists(count_file_path+".dat"+chroot_registry.migrated_suffix))
+        # the migrated count file isn't imported again
+        self.assertEqual(self.registry.migrate_count_file(count_file_path), 0)
+
+    def test_upgrade_schema(self):
+        registry_file_path = os.path.join(self.config_dir_path, "old.sqlite")
+        connection = sqlite3.connect(registry_file_path)
+        connection.execute("CREATE TABLE sessions (base_dir TEXT NOT NULL, host_type TEXT NOT NULL, pid INTEGER NOT NULL, PRIMARY KEY (base_dir, host_type, pid)) WITHOUT ROWID")
+        connection.execute("INSERT INTO sessions (base_dir, host_type, pid) VALUES ('/base', 'debian', 10)")
+        connection.commit()
+        connection.close()
+        with chroot_registry.SessionRegistry(registry_file_path) as registry:
+            self.assertEqual(registry.list_sessions(), [("/base", "debian", 10, None)])
+            registry.register("/base", "debian", 11, 100)
+            self.assertEqual(registry.lookup("/base", "debian"), set([10, 11]))
+
+    def test_open_registry_migrates(self):
+        count_file_path = os.path.join(self.config_dir_path, chroot_registry.legacy_count_file_name)
+        count_file_dict = shelve.Shelf(dict=dumbdbm.open(count_file_path, "c"))
+        count_file_dict["/base"] = {"debian": [10]}
+        count_file_dict.close()
+        with chroot_registry.open_registry(self.config_dir_path) as registry:
+            self.assertEqual(registry.list_sessions(), [("/base", "debian", 10, None)])
+
+    def test_base_dir_lock(self):
+        with chroot_registry.base_dir_lock(self.config_dir_path, "/base", "debian"):
+            # other base directories aren't blocked
+            with chroot_registry.base_dir_lock(self.config_dir_path, "/other", "debian"):
+                pass
+        self.assertEqual(len(os.listdir(os.path.join(self.config_dir_path, chroot_registry.lock_dir_name))), 2)
+
+if __name__ == "__main__":
+    unittest.main()
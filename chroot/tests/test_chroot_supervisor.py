@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of the session bookkeeping of `chroot_supervisor.py` which replace the mounts with fakes and the chroot binary with a stand-in script.
+
+import unittest
+import tempfile
+import shutil
+import os
+import threading
+from chroot import chroot
+from chroot import chroot_process
+from chroot import chroot_supervisor
+
+class SupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+        self.chroot_binary = os.path.join(self.directory, "chroot")
+        with open(self.chroot_binary, "w") as chroot_binary_file:
+            chroot_binary_file.write("#!/bin/sh\nexit 3\n")
+        os.chmod(self.chroot_binary, 0o755)
+        self.base_dirs = []
+        for name in ["base1", "base2"]:
+            base_dir = os.path.join(self.directory, name)
+            os.mkdir(base_dir)
+            self.base_dirs.append(base_dir)
+        self.devnull = os.open(os.devnull, os.O_RDWR)
+        self.lock = threading.Lock()
+        self.mounted = []
+        self.umounted = []
+        self.ensure_mounts = chroot.ensure_mounts
+        self.umount_host_type = chroot._umount_host_type
+        chroot.ensure_mounts = self.fake_ensure_mounts
+        chroot._umount_host_type = self.fake_umount_host_type
+        self.blocked_base_dir = None
+        self.unblock = threading.Event()
+        self.supervisor = chroot_supervisor.Supervisor(os.path.join(self.directory, "socket"), config_dir_path=os.path.join(self.directory, "config"), chroot_binary=self.chroot_binary, auto_umount=True)
+
+    def tearDown(self):
+        self.unblock.set()
+        chroot.ensure_mounts = self.ensure_mounts
+        chroot._umount_host_type = self.umount_host_type
+        self.supervisor.server_close()
+        os.close(self.devnull)
+        shutil.rmtree(self.directory)
+
+    def fake_ensure_mounts(self, registry, base_dir, host_type, **kwargs):
+        if base_dir == self.blocked_base_dir:
+            self.unblock.wait()
+        with self.lock:
+            self.mounted.append(base_dir)
+        return True
+
+    def fake_umount_host_type(self, base_dir, host_type, **kwargs):
+        with self.lock:
+            self.umounted.append(base_dir)
+        return True
+
+    def start_session(self, base_dir):
+        return self.supervisor.start_session(os.getpid(), [self.devnull]*3, base_dir, chroot.HOST_TYPE_DEBIAN, "/bin/sh")
+
+    def test_session(self):
+        base_dir, host_type, session_process, pty_master_fd = self.start_session(self.base_dirs[0])
+        self.assertEqual((base_dir, host_type, pty_master_fd), (self.base_dirs[0], chroot.HOST_TYPE_DEBIAN, None))
+        self.assertEqual(self.supervisor.registry.lookup(base_dir, host_type), set([session_process.pid]))
+        self.assertEqual(session_process.wait(), 3)
+        self.supervisor.end_session(base_dir, host_type, session_process.pid)
+        self.assertEqual(self.supervisor.registry.lookup(base_dir, host_type), set())
+        self.assertEqual((self.mounted, self.umounted), ([base_dir], [base_dir]))
+
+    def test_mounts_set_up_once(self):
+        sessions = [self.start_session(self.base_dirs[0]) for _ in range(3)]
+        for _, _, session_process, _ in sessions:
+            session_process.wait()
+        self.assertEqual(self.mounted, [self.base_dirs[0]])
+        for base_dir, host_type, session_process, _ in sessions:
+            self.supervisor.end_session(base_dir, host_type, session_process.pid)
+        # freed after the last session only
+        self.assertEqual(self.umounted, [self.base_dirs[0]])
+
+    def test_other_base_dirs_not_blocked(self):
+        self.blocked_base_dir = self.base_dirs[0]
+        blocked_thread = threading.Thread(target=self.start_session, args=(self.base_dirs[0], ))
+        blocked_thread.daemon = True
+        blocked_thread.start()
+        try:
+            _, _, session_process, _ = self.start_session(self.base_dirs[1])
+            session_process.wait()
+            self.assertEqual(self.mounted, [self.base_dirs[1]])
+        finally:
+            self.unblock.set()
+            blocked_thread.join()
+        self.assertEqual(self.mounted, [self.base_dirs[1], self.base_dirs[0]])
+
+    def test_mounts_kept_for_session_being_started(self):
+        base_dir, host_type, session_process, _ = self.start_session(self.base_dirs[0])
+        session_process.wait()
+        # the second session is held after it has been started, but before it's registered
+        process_start_time = chroot_process.process_start_time
+        started = threading.Event()
+        def blocking_process_start_time(pid):
+            started.set()
+            self.unblock.wait()
+            return process_start_time(pid)
+        chroot_process.process_start_time = blocking_process_start_time
+        results = []
+        starting_thread = threading.Thread(target=lambda: results.append(self.start_session(self.base_dirs[0])))
+        starting_thread.daemon = True
+        try:
+            starting_thread.start()
+            started.wait()
+            self.supervisor.end_session(base_dir, host_type, session_process.pid)
+            self.assertEqual(self.umounted, [])
+        finally:
+            self.unblock.set()
+            starting_thread.join()
+            chroot_process.process_start_time = process_start_time
+        _, _, session_process2, _ = results[0]
+        session_process2.wait()
+        self.supervisor.end_session(base_dir, host_type, session_process2.pid)
+        self.assertEqual((self.mounted, self.umounted), ([base_dir], [base_dir]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*- 
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#    Dieses Programm ist Freie Software: Sie können es unter den Bedingungen
+#    der GNU General Public License, wie von der Free Software Foundation,
+#    Version 3 der Lizenz oder (nach Ihrer Wahl) jeder neueren
+#    veröffentlichten Version, weiterverbreiten und/oder modifizieren.
+#
+#    Dieses Programm wird in der Hoffnung, dass es nützlich sein wird, aber
+#    OHNE JEDE GEWÄHRLEISTUNG, bereitgestellt; sogar ohne die implizite
+#    Gewährleistung der MARKTFÄHIGKEIT oder EIGNUNG FÜR EINEN BESTIMMTEN ZWECK.
+#    Siehe die GNU General Public License für weitere Details.
+#
+#    Sie sollten eine Kopie der GNU General Public License zusammen mit diesem
+#    Programm erhalten haben. Wenn nicht, siehe <http://www.gnu.org/licenses/>.
+
+# Tests of `benchmarks/lifecycle_benchmark.py` which run it with small parameters in a separate interpreter (it imports the modules of the `chroot` package as top-level modules, so they can't share an interpreter with the tests).
+
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+import json
+import subprocess as sp
+
+benchmarks_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "benchmarks")
+
+def _run(code):
+    """Runs `code` with the benchmark imported as `lifecycle_benchmark` and returns what it prints parsed as JSON."""
+    return json.loads(sp.check_output([sys.executable, "-c", "import json, lifecycle_benchmark\n"+code], cwd=benchmarks_dir))
+
+class LifecycleBenchmarkTest(unittest.TestCase):
+
+    def test_summarize(self):
+        summary = _run("print(json.dumps(lifecycle_benchmark.summarize([0.004, 0.001, 0.003, 0.002])))")
+        self.assertEqual(summary, {"iterations": 4, "mean_ms": 2.5, "median_ms": 3.0, "p95_ms": 4.0})
+
+    def test_report(self):
+        directory = tempfile.mkdtemp()
+        try:
+            output = os.path.join(directory, "report.json")
+            _run("lifecycle_benchmark.lifecycle_benchmark(session_counts='1,100', iterations=2, live_sessions=2, registry_operations=10, processes=2, launches=2, output=%r)\nprint('null')" % (output, ))
+            with open(output, "r") as output_file:
+                report = json.load(output_file)
+            self.assertEqual(sorted(report["sessions"].keys()), ["1", "100"])
+            for session_count_report in report["sessions"].values():
+                self.assertEqual(session_count_report["start"]["iterations"], 2)
+                self.assertEqual(session_count_report["shutdown"]["iterations"], 2)
+                self.assertEqual(session_count_report["shutdown_all"]["iterations"], 1)
+                self.assertIn("mount", session_count_report["start_phases"])
+                self.assertTrue(session_count_report["registry"]["register_per_s"] > 0)
+            self.assertEqual(report["concurrent"]["iterations"], 4)
+            self.assertTrue(report["concurrent"]["sessions_per_s"] > 0)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -34,10 +34,15 @@ setup(
     name = chroot_globals.app_name,
     version = chroot_globals.app_version_string,
     packages = find_packages(),
-    install_requires = ["plac >= 0.9.1", "python-essentials", ],
+    install_requires = ["plac >= 0.9.1", ],
     entry_points={
         'console_scripts': [
             'mychroot = chroot.chroot:main',
+            'mychroot-supervisor = chroot.chroot_supervisor:main',
+            'mychroot-client = chroot.chroot_client:main',
+            'mychroot-batch = chroot.chroot_batch:main',
+            'mychroot-sync = chroot.chroot_sync:main',
+            'mychroot-pool = chroot.chroot_pool:main',
         ],
     },
 